@@ -0,0 +1,26 @@
+-- DropIndex
+DROP INDEX "User_createdAt_idx";
+
+-- DropIndex
+DROP INDEX "Post_createdAt_idx";
+
+-- DropIndex
+DROP INDEX "Comment_createdAt_idx";
+
+-- DropIndex
+DROP INDEX "AuditLog_createdAt_idx";
+
+-- CreateIndex
+CREATE INDEX "User_createdAt_id_idx" ON "User"("createdAt", "id");
+
+-- CreateIndex
+CREATE INDEX "Post_createdAt_id_idx" ON "Post"("createdAt", "id");
+
+-- CreateIndex
+CREATE INDEX "Post_categoryId_createdAt_id_idx" ON "Post"("categoryId", "createdAt", "id");
+
+-- CreateIndex
+CREATE INDEX "Comment_createdAt_id_idx" ON "Comment"("createdAt", "id");
+
+-- CreateIndex
+CREATE INDEX "AuditLog_createdAt_id_idx" ON "AuditLog"("createdAt", "id");
@@ -0,0 +1,8 @@
+-- CreateExtension
+CREATE EXTENSION IF NOT EXISTS "pg_trgm";
+
+-- CreateIndex
+CREATE INDEX "User_email_trgm_idx" ON "User" USING GIN ("email" gin_trgm_ops);
+
+-- CreateIndex
+CREATE INDEX "Profile_username_trgm_idx" ON "Profile" USING GIN ("username" gin_trgm_ops);
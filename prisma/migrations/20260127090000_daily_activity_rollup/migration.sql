@@ -0,0 +1,11 @@
+-- CreateTable
+CREATE TABLE "DailyActivityRollup" (
+    "date" DATE NOT NULL,
+    "posts" INTEGER NOT NULL DEFAULT 0,
+    "comments" INTEGER NOT NULL DEFAULT 0,
+    "newUsers" INTEGER NOT NULL DEFAULT 0,
+    "votes" INTEGER NOT NULL DEFAULT 0,
+    "updatedAt" TIMESTAMP(3) NOT NULL,
+
+    CONSTRAINT "DailyActivityRollup_pkey" PRIMARY KEY ("date")
+);
@@ -0,0 +1,15 @@
+-- CreateTable
+CREATE TABLE "ContributorScore" (
+    "window" VARCHAR(10) NOT NULL,
+    "userId" TEXT NOT NULL,
+    "postCount" INTEGER NOT NULL DEFAULT 0,
+    "commentCount" INTEGER NOT NULL DEFAULT 0,
+    "totalScore" INTEGER NOT NULL DEFAULT 0,
+    "activity" INTEGER NOT NULL DEFAULT 0,
+    "updatedAt" TIMESTAMP(3) NOT NULL,
+
+    CONSTRAINT "ContributorScore_pkey" PRIMARY KEY ("window","userId")
+);
+
+-- CreateIndex
+CREATE INDEX "ContributorScore_window_activity_userId_idx" ON "ContributorScore"("window", "activity" DESC, "userId");
@@ -0,0 +1,6 @@
+-- Service account that audit entries without a human actor (retention purges,
+-- scheduled jobs) are attributed to, since "AuditLog"."userId" is required.
+-- It has no password, so it cannot sign in.
+INSERT INTO "User" ("id", "email", "emailVerified", "createdAt", "updatedAt")
+VALUES ('system', 'system@neurokid.invalid', false, NOW(), NOW())
+ON CONFLICT ("id") DO NOTHING;
@@ -0,0 +1,19 @@
+-- CreateTable
+CREATE TABLE "ExportArtifact" (
+    "id" TEXT NOT NULL,
+    "seq" INTEGER NOT NULL,
+    "userId" TEXT NOT NULL,
+    "data" BYTEA NOT NULL,
+    "createdAt" TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+    CONSTRAINT "ExportArtifact_pkey" PRIMARY KEY ("id","seq")
+);
+
+-- CreateIndex
+CREATE INDEX "ExportArtifact_userId_idx" ON "ExportArtifact"("userId");
+
+-- CreateIndex
+CREATE INDEX "ExportArtifact_createdAt_idx" ON "ExportArtifact"("createdAt");
+
+-- AddForeignKey
+ALTER TABLE "ExportArtifact" ADD CONSTRAINT "ExportArtifact_userId_fkey" FOREIGN KEY ("userId") REFERENCES "User"("id") ON DELETE CASCADE ON UPDATE CASCADE;
@@ -5,9 +5,11 @@ Production-ready with security hardening for 100K+ users
 """
 
 import os
+import hmac
 import logging
 import uuid
 from datetime import datetime
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, HTTPException, Depends, Header
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
@@ -33,12 +35,39 @@ ALLOWED_ORIGINS = [
 if REPLIT_DOMAIN:
     ALLOWED_ORIGINS.append(f"https://{REPLIT_DOMAIN}")
 
+# Shared with trusted services (e.g. the Next.js server) sent as X-Internal-Token
+INTERNAL_API_TOKEN = os.environ.get('INTERNAL_API_TOKEN', '')
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    from api.database import init_connection_pool, close_connection_pool
+    from api.task_queue import task_queue
+    from api.trending import trending_engine
+    from api.audit import audit_writer
+    
+    try:
+        await init_connection_pool()
+    except Exception as e:
+        logger.warning(f"Connection pool not initialized at startup, will retry on first query: {e}")
+    trending_engine.start()
+    audit_writer.start()
+    
+    yield
+    
+    trending_engine.stop()
+    task_queue.stop()
+    # Before the pool closes, so buffered audit entries are written (or spooled)
+    await audit_writer.stop()
+    await close_connection_pool()
+
+
 app = FastAPI(
     title="NeuroKid Python Backend",
     description="Python backend API for analytics, data governance, and admin features",
     version="1.0.0",
     docs_url=None if IS_PRODUCTION else "/docs",
-    redoc_url=None if IS_PRODUCTION else "/redoc"
+    redoc_url=None if IS_PRODUCTION else "/redoc",
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -46,24 +75,26 @@ app.add_middleware(
     allow_origins=ALLOWED_ORIGINS if IS_PRODUCTION else ["*"],
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE"],
-    allow_headers=["Authorization", "Content-Type", "X-Request-ID"],
+    allow_headers=["Authorization", "Content-Type", "X-Request-ID", "X-Cache-Control"],
+    expose_headers=["Retry-After", "X-RateLimit-Limit", "X-RateLimit-Remaining", "X-RateLimit-Reset"],
     allow_origin_regex=r"https://.*\.replit\.dev" if IS_PRODUCTION else None,
 )
 
 
 @app.middleware("http")
 async def rate_limit_middleware(request: Request, call_next):
-    """Global rate limiting middleware"""
-    from api.rate_limiter import rate_limiter, get_client_ip
+    """Global rate limiting middleware, charging each route's cost to its policy bucket"""
+    from api.rate_limiter import rate_limiter, match_policy
     
     excluded_paths = ["/", "/health", "/docs", "/redoc", "/openapi.json"]
-    if request.url.path in excluded_paths:
+    if request.url.path in excluded_paths or request.method == "OPTIONS":
         return await call_next(request)
     
-    client_ip = get_client_ip(request)
-    rate_key = f"{client_ip}:{request.url.path}"
+    policy, cost = match_policy(request.method, request.url.path)
+    decision = await rate_limiter.acheck(policy.key(request), tokens=cost, capacity=policy.capacity,
+                                         refill_rate=policy.refill_rate, policy=policy.name)
     
-    if not rate_limiter.is_allowed(rate_key, capacity=100, refill_rate=10):
+    if not decision.allowed:
         return JSONResponse(
             status_code=429,
             content={
@@ -72,10 +103,42 @@ async def rate_limit_middleware(request: Request, call_next):
                     "code": "RATE_LIMITED",
                     "message": "Too many requests. Please try again later."
                 }
-            }
+            },
+            headers=decision.headers()
         )
     
-    return await call_next(request)
+    response = await call_next(request)
+    response.headers.update(decision.headers())
+    return response
+
+
+def is_privileged_request(request: Request) -> bool:
+    """Internal services and admins, the callers trusted to bypass caches"""
+    from api.rate_limiter import bearer_claims
+    
+    internal = request.headers.get("X-Internal-Token", "")
+    if INTERNAL_API_TOKEN and hmac.compare_digest(internal.encode(), INTERNAL_API_TOKEN.encode()):
+        return True
+    return (bearer_claims(request) or {}).get("role") == "ADMIN"
+
+
+@app.middleware("http")
+async def cache_control_context(request: Request, call_next):
+    """Expose the X-Cache-Control override to @cached route handlers
+    
+    Anyone else could force a recomputation on every request, so the
+    header is ignored unless the caller is privileged.
+    """
+    from api.cache import request_cache_control
+    
+    override = request.headers.get("X-Cache-Control")
+    if override and not is_privileged_request(request):
+        override = None
+    token = request_cache_control.set(override)
+    try:
+        return await call_next(request)
+    finally:
+        request_cache_control.reset(token)
 
 
 @app.middleware("http")
@@ -120,12 +183,13 @@ async def global_exception_handler(request: Request, exc: Exception):
         )
 
 
-from api.routes import users_router, analytics_router, posts_router, governance_router
+from api.routes import users_router, analytics_router, posts_router, governance_router, tasks_router
 
 app.include_router(users_router, prefix="/api/python")
 app.include_router(analytics_router, prefix="/api/python")
 app.include_router(posts_router, prefix="/api/python")
 app.include_router(governance_router, prefix="/api/python")
+app.include_router(tasks_router, prefix="/api/python")
 
 
 @app.get("/")
@@ -143,7 +207,7 @@ async def health_check():
     from api.database import execute_query
     
     try:
-        result = execute_query("SELECT 1 as check", fetch_one=True)
+        result = await execute_query("SELECT 1 as check", fetch_one=True)
         db_status = "connected" if result else "disconnected"
     except Exception as e:
         logger.error(f"Health check DB error: {e}")
@@ -164,13 +228,17 @@ async def api_stats():
     from api.cache import cache
     from api.task_queue import task_queue
     from api.rate_limiter import rate_limiter
+    from api.trending import trending_engine
+    from api.audit import audit_writer
+    from api.database import db_stats
     
     return {
         "endpoints": {
             "users": "/api/python/users",
             "analytics": "/api/python/analytics",
             "posts": "/api/python/posts",
-            "governance": "/api/python/governance"
+            "governance": "/api/python/governance",
+            "tasks": "/api/python/tasks"
         },
         "features": [
             "User management and activity tracking",
@@ -181,7 +249,10 @@ async def api_stats():
         ],
         "cache": cache.stats(),
         "task_queue": task_queue.stats(),
-        "rate_limiter": rate_limiter.stats()
+        "rate_limiter": rate_limiter.stats(),
+        "trending": trending_engine.stats(),
+        "audit": audit_writer.stats(),
+        "database": db_stats()
     }
 
 
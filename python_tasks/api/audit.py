@@ -0,0 +1,325 @@
+"""
+Buffered audit log writer for Python API
+Queues audit entries in process and writes them in multi-row inserts, spooling to disk while the database is down
+"""
+
+import os
+import json
+import uuid
+import fcntl
+import asyncio
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import asyncpg
+
+logger = logging.getLogger('python_api.audit')
+
+AUDIT_FLUSH_INTERVAL = float(os.environ.get('AUDIT_FLUSH_INTERVAL_MS', 250)) / 1000
+AUDIT_BATCH_SIZE = int(os.environ.get('AUDIT_BATCH_SIZE', 500))
+# Entries kept in memory while the database is down and spooling is disabled
+AUDIT_MAX_BUFFER = int(os.environ.get('AUDIT_MAX_BUFFER', 50000))
+# Empty disables the spool: failed batches are retried from memory instead
+AUDIT_SPOOL_PATH = os.environ.get('AUDIT_SPOOL_PATH', os.path.join(tempfile.gettempdir(), 'neurokid-audit.spool'))
+# Entries the database rejects (constraint violations, bad values); empty only logs them
+AUDIT_DEAD_LETTER_PATH = os.environ.get('AUDIT_DEAD_LETTER_PATH',
+                                        os.path.join(tempfile.gettempdir(), 'neurokid-audit.dead'))
+
+# Seeded service account for entries without a human actor ("userId" is required)
+SYSTEM_USER_ID = os.environ.get('AUDIT_SYSTEM_USER_ID', 'system')
+
+# Errors about the rows themselves: retrying them can never succeed, so they are
+# dead-lettered. Anything else is treated as the database being unreachable.
+REJECTED_ERRORS = (asyncpg.exceptions.IntegrityConstraintViolationError, asyncpg.exceptions.DataError)
+
+# Ids are assigned when an entry is queued, so a batch replayed from the spool
+# after a timed-out insert that actually committed is not written twice
+INSERT_AUDIT_BATCH = '''
+    INSERT INTO "AuditLog" (id, action, "userId", "targetType", "targetId", changes, "createdAt")
+    SELECT id, action, "userId", "targetType", "targetId", changes::jsonb, "createdAt"
+    FROM unnest(%s::text[], %s::text[], %s::text[], %s::text[], %s::text[], %s::text[], %s::timestamp[])
+        AS t(id, action, "userId", "targetType", "targetId", changes, "createdAt")
+    ON CONFLICT (id) DO NOTHING
+'''
+
+
+def audit_entry(action: str, user_id: str = None, resource: str = None, resource_id: str = None,
+                details: dict = None) -> Dict:
+    """An AuditLog row, stamped with its id and time now rather than when it is flushed
+    
+    Entries without a user are attributed to the system account.
+    """
+    return {
+        "id": uuid.uuid4().hex,
+        "action": action,
+        "userId": user_id or SYSTEM_USER_ID,
+        "targetType": resource,
+        "targetId": resource_id,
+        "changes": json.dumps(details, default=str) if details else None,
+        "createdAt": datetime.now(timezone.utc).replace(tzinfo=None),
+    }
+
+
+def batch_params(entries: List[Dict]) -> tuple:
+    """Column arrays for INSERT_AUDIT_BATCH"""
+    columns = ("id", "action", "userId", "targetType", "targetId", "changes", "createdAt")
+    return tuple([entry[column] for entry in entries] for column in columns)
+
+
+class AuditWriter:
+    """In-process audit sink flushed every flush_interval seconds or batch_size entries
+    
+    write() only appends to a buffer, so request handlers no longer wait for
+    an INSERT. A background task drains the buffer in one multi-row insert
+    per batch_size entries. If the database is unreachable, the batch is
+    appended to the spool file and fsynced, and the spool is replayed once
+    the database is back. A batch the database rejects is retried row by
+    row, and only the rows that still fail go to the dead-letter file, so
+    one bad entry cannot hold up the rest. stop() flushes whatever is left,
+    so entries are only lost if the process dies within a flush interval of
+    queueing them.
+    """
+    
+    def __init__(self, flush_interval: float = AUDIT_FLUSH_INTERVAL, batch_size: int = AUDIT_BATCH_SIZE,
+                 spool_path: Optional[str] = AUDIT_SPOOL_PATH, max_buffer: int = AUDIT_MAX_BUFFER,
+                 dead_letter_path: Optional[str] = AUDIT_DEAD_LETTER_PATH):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.spool_path = spool_path or None
+        self.dead_letter_path = dead_letter_path or None
+        self.max_buffer = max_buffer
+        self._buffer: List[Dict] = []
+        self._lock = threading.Lock()
+        self._wake: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._written = 0
+        self._flushes = 0
+        self._spooled = 0
+        self._replayed = 0
+        self._dropped = 0
+        self._dead_lettered = 0
+        self._errors = 0
+    
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+    
+    def write(self, entry: Dict) -> None:
+        """Queue an entry; wakes the flusher early once a full batch is waiting"""
+        with self._lock:
+            self._buffer.append(entry)
+            overflow = len(self._buffer) - self.max_buffer
+            if overflow > 0:
+                del self._buffer[:overflow]
+                self._dropped += overflow
+            full = len(self._buffer) >= self.batch_size
+        if overflow > 0:
+            logger.error(f"Audit buffer full, dropped {overflow} oldest entries")
+        if full and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+    
+    def start(self) -> None:
+        """Flush on the running event loop until stop()"""
+        if self._task is None:
+            self._loop = asyncio.get_running_loop()
+            self._wake = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            self._task = self._loop.create_task(self._flush_loop())
+    
+    async def stop(self) -> None:
+        """Stop the flusher and write (or spool) everything still buffered"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        self._loop = None
+    
+    async def _flush_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._errors += 1
+                logger.error(f"Audit flush error: {e}")
+    
+    async def flush(self) -> int:
+        """Write the spool (if any) and then the buffer; returns entries written"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            written = 0
+            if self._spool_pending():
+                try:
+                    written += await self._replay_spool()
+                except Exception as e:
+                    # Still unreachable: spool the buffer too rather than retry per batch
+                    self._errors += 1
+                    logger.warning(f"Audit spool replay failed: {e}")
+                    with self._lock:
+                        entries, self._buffer = self._buffer, []
+                    if entries:
+                        self._keep(entries)
+                    return written
+            with self._lock:
+                entries, self._buffer = self._buffer, []
+            for start in range(0, len(entries), self.batch_size):
+                batch = entries[start:start + self.batch_size]
+                try:
+                    written += await self._write_batch(batch)
+                except Exception as e:
+                    self._errors += 1
+                    logger.warning(f"Audit insert failed ({e}), keeping {len(entries) - start} entries")
+                    self._keep(entries[start:])
+                    break
+            return written
+    
+    async def _insert(self, batch: List[Dict]) -> None:
+        from api.database import execute_write
+        
+        await execute_write(INSERT_AUDIT_BATCH, batch_params(batch))
+        self._written += len(batch)
+        self._flushes += 1
+    
+    async def _write_batch(self, batch: List[Dict]) -> int:
+        """Insert a batch, falling back to one row at a time if the database rejects it
+        
+        Returns the entries written. Rejected rows are dead-lettered; any other
+        error propagates so the caller keeps the batch for a retry (inserts are
+        idempotent by id, so rows already written are not duplicated).
+        """
+        try:
+            await self._insert(batch)
+            return len(batch)
+        except REJECTED_ERRORS as e:
+            if len(batch) == 1:
+                self._dead_letter(batch[0], e)
+                return 0
+            logger.warning(f"Audit batch rejected ({e}), retrying {len(batch)} entries one by one")
+        
+        written = 0
+        for entry in batch:
+            try:
+                await self._insert([entry])
+                written += 1
+            except REJECTED_ERRORS as e:
+                self._dead_letter(entry, e)
+        return written
+    
+    def _dead_letter(self, entry: Dict, error: Exception) -> None:
+        self._dead_lettered += 1
+        logger.error(f"Audit entry {entry['id']} ({entry['action']}) rejected: {error}")
+        if not self.dead_letter_path:
+            return
+        try:
+            with open(self.dead_letter_path, "a", encoding="utf-8") as dead:
+                dead.write(json.dumps({**self._serialize(entry), "error": str(error)}) + "\n")
+                dead.flush()
+                os.fsync(dead.fileno())
+        except OSError as e:
+            logger.error(f"Audit dead-letter write failed: {e}")
+    
+    @staticmethod
+    def _serialize(entry: Dict) -> Dict:
+        return {**entry, "createdAt": entry["createdAt"].isoformat()}
+    
+    @contextmanager
+    def _spool_lock(self):
+        """Exclusive lock shared by every worker using this spool
+        
+        Held while appending and while moving the spool aside for replay, so
+        an append can never land in a file that has already been read.
+        """
+        with open(self.spool_path + ".lock", "a") as lock:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+    
+    def _keep(self, entries: List[Dict]) -> None:
+        """Spool entries that could not be written, or put them back in the buffer"""
+        if self.spool_path:
+            try:
+                self._spool(entries)
+                return
+            except OSError as e:
+                logger.error(f"Audit spool write failed: {e}")
+        with self._lock:
+            self._buffer[:0] = entries
+    
+    def _spool(self, entries: List[Dict]) -> None:
+        with self._spool_lock(), open(self.spool_path, "a", encoding="utf-8") as spool:
+            for entry in entries:
+                spool.write(json.dumps(self._serialize(entry)) + "\n")
+            spool.flush()
+            os.fsync(spool.fileno())
+        self._spooled += len(entries)
+    
+    def _spool_pending(self) -> bool:
+        return bool(self.spool_path) and (os.path.exists(self.spool_path)
+                                          or os.path.exists(self.spool_path + ".replay"))
+    
+    async def _replay_spool(self) -> int:
+        """Insert spooled entries; the spool is removed only once all of them are written
+        
+        Several workers may share a spool; one that loses the race to a file
+        just finds nothing to replay, and inserts are idempotent by id.
+        Rejected entries are dead-lettered like buffered ones.
+        """
+        replaying = self.spool_path + ".replay"
+        try:
+            with self._spool_lock():
+                if not os.path.exists(replaying):
+                    os.replace(self.spool_path, replaying)
+                with open(replaying, encoding="utf-8") as spool:
+                    entries = [json.loads(line) for line in spool if line.strip()]
+        except FileNotFoundError:
+            return 0
+        for entry in entries:
+            entry["createdAt"] = datetime.fromisoformat(entry["createdAt"])
+        written = 0
+        for start in range(0, len(entries), self.batch_size):
+            written += await self._write_batch(entries[start:start + self.batch_size])
+        try:
+            os.remove(replaying)
+        except FileNotFoundError:
+            pass
+        self._replayed += written
+        logger.info(f"Replayed {written} of {len(entries)} spooled audit entries")
+        return written
+    
+    def stats(self) -> dict:
+        with self._lock:
+            buffered = len(self._buffer)
+        return {
+            "running": self.running,
+            "buffered": buffered,
+            "written": self._written,
+            "flushes": self._flushes,
+            "spooled": self._spooled,
+            "replayed": self._replayed,
+            "dropped": self._dropped,
+            "dead_lettered": self._dead_lettered,
+            "errors": self._errors,
+            "spool_pending": self._spool_pending(),
+        }
+
+
+audit_writer = AuditWriter()
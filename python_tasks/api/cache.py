@@ -5,32 +5,84 @@ Production-ready for 100K+ users
 """
 
 import os
+import sys
 import time
 import json
+import heapq
+import fnmatch
 import threading
+import math
+import uuid
+import random
+import hashlib
+import asyncio
+import inspect
 import logging
-from typing import Any, Optional, Dict
+from contextvars import ContextVar
+from collections import OrderedDict
+from typing import Any, Optional, Dict, List
+
+from api.codecs import get_codec
 from functools import wraps
 
 logger = logging.getLogger('python_api.cache')
 
 REDIS_URL = os.environ.get('REDIS_URL', os.environ.get('KV_URL', ''))
+# Opt-in: L1 copies can serve values up to CACHE_L1_TTL seconds stale
+CACHE_TIERED = os.environ.get('CACHE_TIERED', 'false').lower() == 'true'
+CACHE_L1_TTL = int(os.environ.get('CACHE_L1_TTL', 5))
+CACHE_L1_MAX_SIZE = int(os.environ.get('CACHE_L1_MAX_SIZE', 500))
+INVALIDATION_CHANNEL = "neurokid:cache:invalidate"
+TAG_INVALIDATION_CHANNEL = "neurokid:cache:invalidate-tags"
+TAG_INDEX_TTL = 86400
+
+# Delete every key listed in each tag set, then the sets themselves
+_INVALIDATE_TAGS_SCRIPT = """
+local removed = 0
+for _, tag in ipairs(KEYS) do
+    local members = redis.call('smembers', tag)
+    for i = 1, #members, 500 do
+        removed = removed + redis.call('del', unpack(members, i, math.min(i + 499, #members)))
+    end
+    redis.call('del', tag)
+end
+return removed
+"""
+
+# Per-request cache override, set from the X-Cache-Control header by the app middleware
+request_cache_control: ContextVar[Optional[str]] = ContextVar('request_cache_control', default=None)
+
+# Keep references so background refresh tasks are not garbage collected mid-flight
+_background_refreshes: set = set()
+
+# Delete the lock only if we still own it, so an expired lock re-taken by
+# another worker is not released from under it
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
 
 
 class RedisCache:
     """Redis-based distributed cache"""
     
-    def __init__(self, url: str, default_ttl: int = 300):
+    def __init__(self, url: str, default_ttl: int = 300, codec=None):
         self.default_ttl = default_ttl
+        self.codec = codec or get_codec()
         self._client = None
         self._hits = 0
         self._misses = 0
         self._connected = False
+        self._subscriber = None
+        self._url = url
+        self._async = None
         
         if url:
             try:
                 import redis
-                self._client = redis.from_url(url, decode_responses=True)
+                self._client = redis.from_url(url)
                 self._client.ping()
                 self._connected = True
                 logger.info("Redis cache connected successfully")
@@ -49,7 +101,71 @@ class RedisCache:
             value = self._client.get(f"neurokid:{key}")
             if value:
                 self._hits += 1
-                return json.loads(value)
+                return self.codec.loads(value)
+            self._misses += 1
+            return None
+        except Exception as e:
+            logger.error(f"Redis get error: {e}")
+            self._misses += 1
+            return None
+    
+    def set(self, key: str, value: Any, ttl: Optional[int] = None, tags: Optional[List[str]] = None) -> bool:
+        if not self.is_connected:
+            return False
+        try:
+            ttl = ttl or self.default_ttl
+            pipe = self._client.pipeline(transaction=False)
+            pipe.setex(f"neurokid:{key}", ttl, self.codec.dumps(value))
+            self._index_tags(pipe, key, ttl, tags)
+            pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"Redis set error: {e}")
+            return False
+    
+    @staticmethod
+    def _index_tags(pipe, key: str, ttl: int, tags: Optional[List[str]]) -> None:
+        """Record key in one set per tag so invalidation never needs a SCAN"""
+        for tag in tags or ():
+            pipe.sadd(f"neurokid:tag:{tag}", f"neurokid:{key}")
+            pipe.expire(f"neurokid:tag:{tag}", max(ttl, TAG_INDEX_TTL))
+    
+    def invalidate_tags(self, tags: List[str]) -> int:
+        """Delete every key carrying any of the tags in one server-side script"""
+        if not self.is_connected or not tags:
+            return 0
+        try:
+            return self._client.eval(_INVALIDATE_TAGS_SCRIPT, len(tags), *(f"neurokid:tag:{t}" for t in tags))
+        except Exception as e:
+            logger.error(f"Redis tag invalidation error: {e}")
+            return 0
+    
+    async def ainvalidate_tags(self, tags: List[str]) -> int:
+        if not self.is_connected or not tags:
+            return 0
+        try:
+            return await self.async_client.eval(_INVALIDATE_TAGS_SCRIPT, len(tags),
+                                                *(f"neurokid:tag:{t}" for t in tags))
+        except Exception as e:
+            logger.error(f"Redis tag invalidation error: {e}")
+            return 0
+    
+    @property
+    def async_client(self):
+        """redis.asyncio client sharing the URL, created on first use"""
+        if self._async is None:
+            import redis.asyncio as aioredis
+            self._async = aioredis.from_url(self._url)
+        return self._async
+    
+    async def aget(self, key: str) -> Optional[Any]:
+        if not self.is_connected:
+            return None
+        try:
+            value = await self.async_client.get(f"neurokid:{key}")
+            if value:
+                self._hits += 1
+                return self.codec.loads(value)
             self._misses += 1
             return None
         except Exception as e:
@@ -57,12 +173,15 @@ class RedisCache:
             self._misses += 1
             return None
     
-    def set(self, key: str, value: Any, ttl: Optional[int] = None) -> bool:
+    async def aset(self, key: str, value: Any, ttl: Optional[int] = None, tags: Optional[List[str]] = None) -> bool:
         if not self.is_connected:
             return False
         try:
             ttl = ttl or self.default_ttl
-            self._client.setex(f"neurokid:{key}", ttl, json.dumps(value, default=str))
+            pipe = self.async_client.pipeline(transaction=False)
+            pipe.setex(f"neurokid:{key}", ttl, self.codec.dumps(value))
+            self._index_tags(pipe, key, ttl, tags)
+            await pipe.execute()
             return True
         except Exception as e:
             logger.error(f"Redis set error: {e}")
@@ -96,67 +215,235 @@ class RedisCache:
             logger.error(f"Redis clear error: {e}")
             return 0
     
+    def acquire_lock(self, name: str, ttl: int) -> Optional[str]:
+        """Take a short-lived lock shared by all workers; returns a token or None"""
+        token = uuid.uuid4().hex
+        if self._client.set(f"neurokid:lock:{name}", token, nx=True, ex=ttl):
+            return token
+        return None
+    
+    def release_lock(self, name: str, token: str) -> None:
+        self._client.eval(_RELEASE_LOCK_SCRIPT, 1, f"neurokid:lock:{name}", token)
+    
+    async def aacquire_lock(self, name: str, ttl: int) -> Optional[str]:
+        token = uuid.uuid4().hex
+        if await self.async_client.set(f"neurokid:lock:{name}", token, nx=True, ex=ttl):
+            return token
+        return None
+    
+    async def arelease_lock(self, name: str, token: str) -> None:
+        await self.async_client.eval(_RELEASE_LOCK_SCRIPT, 1, f"neurokid:lock:{name}", token)
+    
+    def publish_invalidation(self, pattern: str = "", tags: Optional[List[str]] = None) -> None:
+        """Tell every worker to drop local copies of keys matching pattern or tags"""
+        if not self.is_connected:
+            return
+        try:
+            if tags:
+                self._client.publish(TAG_INVALIDATION_CHANNEL, "\n".join(tags))
+            else:
+                self._client.publish(INVALIDATION_CHANNEL, pattern)
+        except Exception as e:
+            logger.error(f"Redis publish error: {e}")
+    
+    async def apublish_invalidation(self, pattern: str = "", tags: Optional[List[str]] = None) -> None:
+        if not self.is_connected:
+            return
+        try:
+            if tags:
+                await self.async_client.publish(TAG_INVALIDATION_CHANNEL, "\n".join(tags))
+            else:
+                await self.async_client.publish(INVALIDATION_CHANNEL, pattern)
+        except Exception as e:
+            logger.error(f"Redis publish error: {e}")
+    
+    def subscribe_invalidations(self, callback, tag_callback=None) -> None:
+        """Invoke callback(pattern) / tag_callback(tags) for invalidations published by any worker"""
+        if not self.is_connected:
+            return
+        try:
+            pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+            handlers = {INVALIDATION_CHANNEL: lambda message: callback(message["data"].decode())}
+            if tag_callback is not None:
+                handlers[TAG_INVALIDATION_CHANNEL] = lambda message: tag_callback(message["data"].decode().split("\n"))
+            pubsub.subscribe(**handlers)
+            self._subscriber = pubsub.run_in_thread(sleep_time=1, daemon=True)
+            logger.info("Subscribed to cache invalidation channel")
+        except Exception as e:
+            logger.error(f"Redis subscribe error: {e}")
+    
     def stats(self) -> dict:
         total = self._hits + self._misses
         hit_rate = (self._hits / total * 100) if total > 0 else 0
         return {
             "type": "redis",
             "connected": self.is_connected,
+            "codec": self.codec.name,
             "hits": self._hits,
             "misses": self._misses,
             "hit_rate": f"{hit_rate:.1f}%"
         }
 
 
+def _estimate_size(value: Any) -> int:
+    """Approximate deep size in bytes of a JSON-like value"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_estimate_size(k) + _estimate_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set)):
+        size += sum(_estimate_size(item) for item in value)
+    return size
+
+
 class InMemoryCache:
-    """Thread-safe in-memory cache with TTL support"""
+    """Thread-safe in-memory LRU cache with TTL support and a byte budget
+    
+    Entries live in an OrderedDict in recency order, so lookups, promotion and
+    LRU eviction are O(1). Expiry times go on a min-heap that is swept lazily:
+    a few expired entries are reclaimed on every write and a daemon thread
+    sweeps the rest every sweep_interval seconds.
+    """
+    
+    SWEEP_BATCH = 16
     
-    def __init__(self, max_size: int = 1000, default_ttl: int = 300):
-        self._cache: Dict[str, tuple] = {}
+    def __init__(self, max_size: int = 1000, default_ttl: int = 300,
+                 max_bytes: int = 64 * 1024 * 1024, sweep_interval: float = 30):
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._expiry_heap: List[tuple] = []
+        self._tags: Dict[str, set] = {}
         self._lock = threading.RLock()
         self.max_size = max_size
+        self.max_bytes = max_bytes
         self.default_ttl = default_ttl
+        self.sweep_interval = sweep_interval
+        self._bytes = 0
         self._hits = 0
         self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._sweeper: Optional[threading.Thread] = None
     
     def get(self, key: str) -> Optional[Any]:
         with self._lock:
-            if key in self._cache:
-                value, expiry = self._cache[key]
+            entry = self._cache.get(key)
+            if entry is not None:
+                value, expiry, _, _ = entry
                 if time.time() < expiry:
+                    self._cache.move_to_end(key)
                     self._hits += 1
                     return value
-                else:
-                    del self._cache[key]
+                self._remove(key)
+                self._expirations += 1
             self._misses += 1
             return None
     
-    def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
+    def set(self, key: str, value: Any, ttl: Optional[int] = None, tags: Optional[List[str]] = None) -> None:
         ttl = ttl or self.default_ttl
         expiry = time.time() + ttl
+        size = _estimate_size(value) + sys.getsizeof(key)
         
         with self._lock:
-            if len(self._cache) >= self.max_size:
-                self._evict_oldest()
-            self._cache[key] = (value, expiry)
+            self._ensure_sweeper()
+            if key in self._cache:
+                self._remove(key)
+            if size > self.max_bytes:
+                logger.debug(f"Value for {key} ({size} bytes) exceeds cache budget, not cached")
+                return
+            tags = tuple(tags or ())
+            self._cache[key] = (value, expiry, size, tags)
+            self._bytes += size
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            heapq.heappush(self._expiry_heap, (expiry, key))
+            
+            self._sweep_expired(self.SWEEP_BATCH)
+            while len(self._cache) > self.max_size or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._cache)))
+                self._evictions += 1
+            if len(self._expiry_heap) > 2 * len(self._cache) + 64:
+                self._compact_heap()
     
     def delete(self, key: str) -> bool:
         with self._lock:
             if key in self._cache:
-                del self._cache[key]
+                self._remove(key)
                 return True
             return False
     
-    def clear(self) -> None:
+    def clear(self, pattern: str = "") -> int:
         with self._lock:
+            if pattern and pattern != "*":
+                keys = [key for key in self._cache if fnmatch.fnmatchcase(key, pattern)]
+                for key in keys:
+                    self._remove(key)
+                return len(keys)
+            count = len(self._cache)
             self._cache.clear()
+            self._expiry_heap.clear()
+            self._tags.clear()
+            self._bytes = 0
             logger.info("In-memory cache cleared")
+            return count
     
-    def _evict_oldest(self) -> None:
-        if not self._cache:
-            return
-        oldest_key = min(self._cache.keys(), key=lambda k: self._cache[k][1])
-        del self._cache[oldest_key]
+    def invalidate_tags(self, tags: List[str]) -> int:
+        """Remove every entry carrying any of the tags"""
+        with self._lock:
+            removed = 0
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    if key in self._cache:
+                        self._remove(key)
+                        removed += 1
+                self._tags.pop(tag, None)
+            return removed
+    
+    def sweep(self) -> int:
+        """Remove every expired entry; returns the number reclaimed"""
+        with self._lock:
+            return self._sweep_expired()
+    
+    def _remove(self, key: str) -> None:
+        _, _, size, tags = self._cache.pop(key)
+        self._bytes -= size
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+    
+    def _sweep_expired(self, limit: Optional[int] = None) -> int:
+        now = time.time()
+        removed = 0
+        heap = self._expiry_heap
+        while heap and heap[0][0] <= now and (limit is None or removed < limit):
+            expiry, key = heapq.heappop(heap)
+            entry = self._cache.get(key)
+            # Heap entries go stale when a key is overwritten or deleted
+            if entry is not None and entry[1] == expiry:
+                self._remove(key)
+                self._expirations += 1
+                removed += 1
+        return removed
+    
+    def _compact_heap(self) -> None:
+        self._expiry_heap = [(entry[1], key) for key, entry in self._cache.items()]
+        heapq.heapify(self._expiry_heap)
+    
+    def _ensure_sweeper(self) -> None:
+        if self._sweeper is None and self.sweep_interval:
+            self._sweeper = threading.Thread(target=self._sweep_loop, daemon=True, name="CacheSweeper")
+            self._sweeper.start()
+    
+    def _sweep_loop(self) -> None:
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                removed = self.sweep()
+                if removed:
+                    logger.debug(f"Swept {removed} expired cache entries")
+            except Exception as e:
+                logger.error(f"Cache sweep error: {e}")
     
     def stats(self) -> dict:
         with self._lock:
@@ -166,22 +453,43 @@ class InMemoryCache:
                 "type": "in-memory",
                 "size": len(self._cache),
                 "max_size": self.max_size,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
                 "hits": self._hits,
                 "misses": self._misses,
-                "hit_rate": f"{hit_rate:.1f}%"
+                "hit_rate": f"{hit_rate:.1f}%",
+                "evictions": self._evictions,
+                "expirations": self._expirations
             }
 
 
 class HybridCache:
-    """Hybrid cache that uses Redis when available, falls back to in-memory"""
+    """Hybrid cache that uses Redis when available, falls back to in-memory
+    
+    In tiered mode a small short-TTL in-process L1 fronts Redis (L2), so hot
+    keys skip the network round trip. Deletes and clears are broadcast over
+    Redis pub/sub so every worker drops its L1 copy.
+    """
     
-    def __init__(self, redis_url: str = "", max_memory_size: int = 1000, default_ttl: int = 300):
+    def __init__(self, redis_url: str = "", max_memory_size: int = 1000, default_ttl: int = 300,
+                 max_memory_bytes: int = 64 * 1024 * 1024, tiered: bool = False,
+                 l1_ttl: int = 5, l1_max_size: int = 500, codec=None):
         self.default_ttl = default_ttl
-        self._redis = RedisCache(redis_url, default_ttl) if redis_url else None
-        self._memory = InMemoryCache(max_memory_size, default_ttl)
+        self.l1_ttl = l1_ttl
+        self._redis = RedisCache(redis_url, default_ttl, codec) if redis_url else None
+        self._memory = InMemoryCache(max_memory_size, default_ttl, max_bytes=max_memory_bytes)
+        self._l1: Optional[InMemoryCache] = None
+        self._locks: Dict[str, tuple] = {}
+        self._locks_guard = threading.Lock()
+        self._tag_listeners: List = []
         
         if self._redis and self._redis.is_connected:
-            logger.info("Using Redis cache (distributed)")
+            if tiered:
+                self._l1 = InMemoryCache(l1_max_size, l1_ttl, max_bytes=max_memory_bytes // 4)
+                logger.info(f"Using tiered cache (in-process L1 ttl={l1_ttl}s, Redis L2)")
+            else:
+                logger.info("Using Redis cache (distributed)")
+            self._redis.subscribe_invalidations(self._on_invalidation, self._on_tag_invalidation)
         else:
             logger.info("Using in-memory cache (local)")
     
@@ -189,29 +497,172 @@ class HybridCache:
     def is_distributed(self) -> bool:
         return self._redis is not None and self._redis.is_connected
     
+    @property
+    def is_tiered(self) -> bool:
+        return self._l1 is not None and self.is_distributed
+    
     def get(self, key: str) -> Optional[Any]:
+        if self.is_tiered:
+            value = self._l1.get(key)
+            if value is not None:
+                return value
+            value = self._redis.get(key)
+            if value is not None:
+                self._l1.set(key, value, self.l1_ttl)
+            return value
         if self.is_distributed:
             return self._redis.get(key)
         return self._memory.get(key)
     
-    def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
+    async def aget(self, key: str) -> Optional[Any]:
+        """Non-blocking get: Redis I/O goes through the asyncio client"""
+        if self.is_tiered:
+            value = self._l1.get(key)
+            if value is not None:
+                return value
+            value = await self._redis.aget(key)
+            if value is not None:
+                self._l1.set(key, value, self.l1_ttl)
+            return value
+        if self.is_distributed:
+            return await self._redis.aget(key)
+        return self._memory.get(key)
+    
+    async def aset(self, key: str, value: Any, ttl: Optional[int] = None,
+                   tags: Optional[List[str]] = None) -> None:
         if self.is_distributed:
-            self._redis.set(key, value, ttl)
+            await self._redis.aset(key, value, ttl, tags)
+            if self.is_tiered:
+                self._l1.set(key, value, min(ttl or self.default_ttl, self.l1_ttl))
         else:
-            self._memory.set(key, value, ttl)
+            self._memory.set(key, value, ttl, tags)
+    
+    def set(self, key: str, value: Any, ttl: Optional[int] = None, tags: Optional[List[str]] = None) -> None:
+        if self.is_distributed:
+            self._redis.set(key, value, ttl, tags)
+            if self.is_tiered:
+                self._l1.set(key, value, min(ttl or self.default_ttl, self.l1_ttl))
+        else:
+            self._memory.set(key, value, ttl, tags)
     
     def delete(self, key: str) -> bool:
         if self.is_distributed:
+            if self.is_tiered:
+                self._l1.delete(key)
+                self._redis.publish_invalidation(key)
             return self._redis.delete(key)
         return self._memory.delete(key)
     
     def clear(self, pattern: str = "") -> int:
         if self.is_distributed:
+            if self.is_tiered:
+                self._l1.clear(pattern)
+                self._redis.publish_invalidation(pattern or "*")
             return self._redis.clear(pattern or "*")
-        self._memory.clear()
-        return 0
+        return self._memory.clear(pattern)
+    
+    def invalidate_tags(self, tags: List[str]) -> int:
+        """Drop every entry tagged with any of tags (e.g. 'table:Post', 'user:<id>')"""
+        if self.is_distributed:
+            removed = self._redis.invalidate_tags(tags)
+            self._on_tag_invalidation(tags)
+            self._redis.publish_invalidation(tags=tags)
+            return removed
+        removed = self._memory.invalidate_tags(tags)
+        self._on_tag_invalidation(tags)
+        return removed
+    
+    async def ainvalidate_tags(self, tags: List[str]) -> int:
+        if self.is_distributed:
+            removed = await self._redis.ainvalidate_tags(tags)
+            self._on_tag_invalidation(tags)
+            await self._redis.apublish_invalidation(tags=tags)
+            return removed
+        removed = self._memory.invalidate_tags(tags)
+        self._on_tag_invalidation(tags)
+        return removed
+    
+    def add_tag_listener(self, callback) -> None:
+        """Call callback(tags) on every tag invalidation, local or published by another worker
+        
+        Lets process-local caches outside this one (e.g. the role cache) honour
+        the same tags.
+        """
+        self._tag_listeners.append(callback)
+    
+    def acquire_lock(self, name: str, ttl: int) -> Optional[str]:
+        """Acquire a recompute lock (Redis SET NX when distributed, local otherwise)"""
+        if self.is_distributed:
+            try:
+                return self._redis.acquire_lock(name, ttl)
+            except Exception as e:
+                logger.error(f"Redis lock error, falling back to local lock: {e}")
+        return self._acquire_local_lock(name, ttl)
+    
+    def release_lock(self, name: str, token: str) -> None:
+        if self.is_distributed:
+            try:
+                self._redis.release_lock(name, token)
+                return
+            except Exception as e:
+                logger.error(f"Redis unlock error: {e}")
+        self._release_local_lock(name, token)
+    
+    async def aacquire_lock(self, name: str, ttl: int) -> Optional[str]:
+        if self.is_distributed:
+            try:
+                return await self._redis.aacquire_lock(name, ttl)
+            except Exception as e:
+                logger.error(f"Redis lock error, falling back to local lock: {e}")
+        return self._acquire_local_lock(name, ttl)
+    
+    async def arelease_lock(self, name: str, token: str) -> None:
+        if self.is_distributed:
+            try:
+                await self._redis.arelease_lock(name, token)
+                return
+            except Exception as e:
+                logger.error(f"Redis unlock error: {e}")
+        self._release_local_lock(name, token)
+    
+    def _acquire_local_lock(self, name: str, ttl: int) -> Optional[str]:
+        now = time.time()
+        with self._locks_guard:
+            holder = self._locks.get(name)
+            if holder is not None and holder[1] > now:
+                return None
+            token = uuid.uuid4().hex
+            self._locks[name] = (token, now + ttl)
+            return token
+    
+    def _release_local_lock(self, name: str, token: str) -> None:
+        with self._locks_guard:
+            holder = self._locks.get(name)
+            if holder is not None and holder[0] == token:
+                del self._locks[name]
+    
+    def _on_invalidation(self, pattern: str) -> None:
+        if self._l1 is not None:
+            self._l1.clear(pattern)
+    
+    def _on_tag_invalidation(self, tags: List[str]) -> None:
+        # L1 copies filled from Redis reads do not know their tags, and L1 is
+        # small and short-lived, so a tagged write simply empties it
+        if self._l1 is not None:
+            self._l1.clear()
+        for listener in self._tag_listeners:
+            try:
+                listener(tags)
+            except Exception as e:
+                logger.error(f"Tag invalidation listener error: {e}")
     
     def stats(self) -> dict:
+        if self.is_tiered:
+            return {
+                "type": "tiered",
+                "l1": self._l1.stats(),
+                "l2": self._redis.stats()
+            }
         if self.is_distributed:
             return self._redis.stats()
         return self._memory.stats()
@@ -219,29 +670,205 @@ class HybridCache:
 
 cache = HybridCache(
     redis_url=REDIS_URL,
-    max_memory_size=1000,
-    default_ttl=300
+    max_memory_size=10000,
+    default_ttl=300,
+    max_memory_bytes=int(os.environ.get('CACHE_MAX_BYTES', 64 * 1024 * 1024)),
+    tiered=CACHE_TIERED,
+    l1_ttl=CACHE_L1_TTL,
+    l1_max_size=CACHE_L1_MAX_SIZE
 )
 
 
-def cached(ttl: int = 300, key_prefix: str = ""):
-    """Decorator for caching function results"""
-    import hashlib
+def _cache_key(func, key_prefix: str, args: tuple, kwargs: dict) -> str:
+    key_data = f"{func.__module__}.{func.__name__}:{json.dumps(args, default=str, sort_keys=True)}:{json.dumps(kwargs, default=str, sort_keys=True)}"
+    key_hash = hashlib.sha256(key_data.encode()).hexdigest()[:16]
+    return f"{key_prefix}:{func.__name__}:{key_hash}"
+
+
+def _resolve_tags(templates, func, args: tuple, kwargs: dict) -> List[str]:
+    """Format tag templates such as 'user:{user_id}' with the call's arguments"""
+    if not templates:
+        return []
+    arguments = inspect.signature(func).bind_partial(*args, **kwargs).arguments
+    return [tag.format(**arguments) for tag in templates]
+
+
+def _is_fresh(entry: dict, beta: float, now: float) -> bool:
+    """Probabilistic early expiry (XFetch): refresh sooner the costlier the recompute"""
+    if beta > 0 and entry["delta"] > 0:
+        return now - entry["delta"] * beta * math.log(1.0 - random.random()) < entry["exp"]
+    return now < entry["exp"]
+
+
+def _parse_cache_control(value: Optional[str]) -> dict:
+    """Parse no-cache / no-store / max-age=N from a Cache-Control style string"""
+    directives = {"no-cache": False, "no-store": False, "max-age": None}
+    for part in (value or "").lower().split(","):
+        part = part.strip()
+        if part in ("no-cache", "no-store"):
+            directives[part] = True
+        elif part.startswith("max-age="):
+            try:
+                directives["max-age"] = int(part.split("=", 1)[1])
+            except ValueError:
+                pass
+    return directives
+
+
+def _classify(entry: Optional[dict], directives: dict, beta: float, stale_ttl: int, now: float) -> str:
+    """'fresh', 'stale' (serve and refresh) or 'miss' for a cached envelope"""
+    if entry is None or directives["no-cache"]:
+        return "miss"
+    max_age = directives["max-age"]
+    if max_age is not None and now - entry.get("at", 0) > max_age:
+        return "miss"
+    if _is_fresh(entry, beta, now):
+        return "fresh"
+    if now < entry["exp"] + stale_ttl:
+        return "stale"
+    return "miss"
+
+
+def cached(ttl: int = 300, key_prefix: str = "", stale_ttl: int = 0,
+           beta: float = 1.0, lock_timeout: int = 10, tags: Optional[List[str]] = None):
+    """Decorator for caching function results
+    
+    Works on plain functions and coroutine functions, including FastAPI route
+    handlers; coroutine results are cached through the non-blocking Redis client.
     
+    Recomputation is single-flight: one caller takes a short-lived lock (a Redis
+    key when distributed) while the others wait for its result. Hot entries are
+    refreshed in the background ahead of expiry, with probability rising towards
+    the deadline (scaled by beta and the observed compute time; beta=0 disables),
+    and for stale_ttl seconds after expiry the old value is served while one
+    caller refreshes it.
+    
+    Callers may override caching per call with a cache_control="no-cache" /
+    "no-store" / "max-age=N" keyword; for routes the X-Cache-Control request
+    header is used.
+    
+    tags (e.g. ["table:Post", "user:{user_id}"], formatted with the call's
+    arguments) let writes drop the entry through invalidate_tags/@invalidates.
+    """
     def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            key_data = f"{func.__module__}.{func.__name__}:{json.dumps(args, default=str, sort_keys=True)}:{json.dumps(kwargs, default=str, sort_keys=True)}"
-            key_hash = hashlib.sha256(key_data.encode()).hexdigest()[:16]
-            cache_key = f"{key_prefix}:{func.__name__}:{key_hash}"
+        def envelope(result, start: float) -> dict:
+            now = time.time()
+            return {"v": result, "at": now, "exp": now + ttl, "delta": now - start}
+        
+        def call_options(kwargs: dict) -> dict:
+            return _parse_cache_control(kwargs.pop("cache_control", None) or request_cache_control.get())
+        
+        if inspect.iscoroutinefunction(func):
+            async def acompute(cache_key, args, kwargs):
+                start = time.time()
+                result = await func(*args, **kwargs)
+                await cache.aset(cache_key, envelope(result, start), ttl + stale_ttl,
+                                 _resolve_tags(tags, func, args, kwargs))
+                return result
             
-            cached_value = cache.get(cache_key)
-            if cached_value is not None:
-                return cached_value
+            async def arefresh_in_background(cache_key, token, args, kwargs):
+                try:
+                    await acompute(cache_key, args, kwargs)
+                except Exception as e:
+                    logger.error(f"Background refresh of {cache_key} failed: {e}")
+                finally:
+                    await cache.arelease_lock(cache_key, token)
             
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                directives = call_options(kwargs)
+                if directives["no-store"]:
+                    return await func(*args, **kwargs)
+                cache_key = _cache_key(func, key_prefix, args, kwargs)
+                
+                started = time.time()
+                entry = await cache.aget(cache_key)
+                state = _classify(entry, directives, beta, stale_ttl, started)
+                if state == "fresh":
+                    return entry["v"]
+                if state == "stale":
+                    token = await cache.aacquire_lock(cache_key, lock_timeout)
+                    if token:
+                        task = asyncio.create_task(arefresh_in_background(cache_key, token, args, kwargs))
+                        _background_refreshes.add(task)
+                        task.add_done_callback(_background_refreshes.discard)
+                    return entry["v"]
+                
+                deadline = started + lock_timeout
+                token = await cache.aacquire_lock(cache_key, lock_timeout)
+                while token is None and time.time() < deadline:
+                    await asyncio.sleep(0.05)
+                    entry = await cache.aget(cache_key)
+                    if entry is not None and entry.get("at", 0) >= started:
+                        return entry["v"]
+                    token = await cache.aacquire_lock(cache_key, lock_timeout)
+                
+                try:
+                    if token:
+                        entry = await cache.aget(cache_key)
+                        if entry is not None and entry.get("at", 0) >= started:
+                            return entry["v"]
+                    return await acompute(cache_key, args, kwargs)
+                finally:
+                    if token:
+                        await cache.arelease_lock(cache_key, token)
+            return async_wrapper
+        
+        def compute(cache_key, args, kwargs):
+            start = time.time()
             result = func(*args, **kwargs)
-            cache.set(cache_key, result, ttl)
+            cache.set(cache_key, envelope(result, start), ttl + stale_ttl,
+                      _resolve_tags(tags, func, args, kwargs))
             return result
+        
+        def refresh_in_background(cache_key, token, args, kwargs):
+            try:
+                compute(cache_key, args, kwargs)
+            except Exception as e:
+                logger.error(f"Background refresh of {cache_key} failed: {e}")
+            finally:
+                cache.release_lock(cache_key, token)
+        
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            directives = call_options(kwargs)
+            if directives["no-store"]:
+                return func(*args, **kwargs)
+            cache_key = _cache_key(func, key_prefix, args, kwargs)
+            
+            started = time.time()
+            entry = cache.get(cache_key)
+            state = _classify(entry, directives, beta, stale_ttl, started)
+            if state == "fresh":
+                return entry["v"]
+            if state == "stale":
+                token = cache.acquire_lock(cache_key, lock_timeout)
+                if token:
+                    threading.Thread(
+                        target=refresh_in_background,
+                        args=(cache_key, token, args, kwargs),
+                        daemon=True
+                    ).start()
+                return entry["v"]
+            
+            deadline = started + lock_timeout
+            token = cache.acquire_lock(cache_key, lock_timeout)
+            while token is None and time.time() < deadline:
+                time.sleep(0.05)
+                entry = cache.get(cache_key)
+                if entry is not None and entry.get("at", 0) >= started:
+                    return entry["v"]
+                token = cache.acquire_lock(cache_key, lock_timeout)
+            
+            try:
+                if token:
+                    entry = cache.get(cache_key)
+                    if entry is not None and entry.get("at", 0) >= started:
+                        return entry["v"]
+                return compute(cache_key, args, kwargs)
+            finally:
+                if token:
+                    cache.release_lock(cache_key, token)
         return wrapper
     return decorator
 
@@ -249,3 +876,31 @@ def cached(ttl: int = 300, key_prefix: str = ""):
 def invalidate_cache(pattern: str = "") -> int:
     """Invalidate cache entries matching pattern"""
     return cache.clear(pattern)
+
+
+def invalidate_tags(*tags: str) -> int:
+    """Invalidate every cache entry carrying any of the tags"""
+    return cache.invalidate_tags(list(tags))
+
+
+def invalidates(*tags: str):
+    """Decorator for write paths: invalidate tagged cache entries after a successful call
+    
+    Tags are formatted with the call's arguments, e.g. @invalidates("table:Post", "post:{post_id}").
+    """
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                result = await func(*args, **kwargs)
+                await cache.ainvalidate_tags(_resolve_tags(tags, func, args, kwargs))
+                return result
+            return async_wrapper
+        
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            result = func(*args, **kwargs)
+            cache.invalidate_tags(_resolve_tags(tags, func, args, kwargs))
+            return result
+        return wrapper
+    return decorator
@@ -0,0 +1,181 @@
+"""
+Serialization codecs for the Redis cache tier
+Typed round-tripping of datetime/date/Decimal with optional zlib compression
+"""
+
+import os
+import json
+import zlib
+import logging
+from datetime import datetime, date
+from decimal import Decimal
+from typing import Any, Dict
+
+logger = logging.getLogger('python_api.codecs')
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+CACHE_CODEC = os.environ.get('CACHE_CODEC', '')
+CACHE_COMPRESS_THRESHOLD = int(os.environ.get('CACHE_COMPRESS_THRESHOLD', 4096))
+
+_TYPE_KEY = "__type__"
+
+
+def _tag(value: Any) -> dict:
+    """Tagged JSON representation for types JSON cannot carry"""
+    if isinstance(value, datetime):
+        return {_TYPE_KEY: "datetime", "value": value.isoformat()}
+    if isinstance(value, date):
+        return {_TYPE_KEY: "date", "value": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {_TYPE_KEY: "decimal", "value": str(value)}
+    if isinstance(value, (set, tuple)):
+        return list(value)
+    return str(value)
+
+
+def _untag(obj: dict) -> Any:
+    kind = obj.get(_TYPE_KEY)
+    if kind is None or len(obj) != 2:
+        return obj
+    if kind == "datetime":
+        return datetime.fromisoformat(obj["value"])
+    if kind == "date":
+        return date.fromisoformat(obj["value"])
+    if kind == "decimal":
+        return Decimal(obj["value"])
+    return obj
+
+
+class JSONCodec:
+    """Standard library JSON with tagged datetime/date/Decimal"""
+
+    name = "json"
+    codec_id = 1
+
+    def dumps(self, value: Any) -> bytes:
+        return json.dumps(value, default=_tag, separators=(',', ':')).encode()
+
+    def loads(self, data: bytes) -> Any:
+        return json.loads(data, object_hook=_untag)
+
+
+class OrjsonCodec:
+    """orjson with tagged datetime/date/Decimal"""
+
+    name = "orjson"
+    codec_id = 2
+
+    def dumps(self, value: Any) -> bytes:
+        return orjson.dumps(value, default=_tag,
+                            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+
+    def loads(self, data: bytes) -> Any:
+        return self._restore(orjson.loads(data))
+
+    def _restore(self, value: Any) -> Any:
+        if isinstance(value, dict):
+            if _TYPE_KEY in value:
+                return _untag(value)
+            return {k: self._restore(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self._restore(v) for v in value]
+        return value
+
+
+class MsgpackCodec:
+    """MessagePack with extension types for datetime/date/Decimal"""
+
+    name = "msgpack"
+    codec_id = 3
+
+    EXT_DATETIME = 1
+    EXT_DATE = 2
+    EXT_DECIMAL = 3
+
+    def _default(self, value: Any):
+        if isinstance(value, datetime):
+            return msgpack.ExtType(self.EXT_DATETIME, value.isoformat().encode())
+        if isinstance(value, date):
+            return msgpack.ExtType(self.EXT_DATE, value.isoformat().encode())
+        if isinstance(value, Decimal):
+            return msgpack.ExtType(self.EXT_DECIMAL, str(value).encode())
+        if isinstance(value, set):
+            return list(value)
+        return str(value)
+
+    def _ext_hook(self, code: int, data: bytes):
+        if code == self.EXT_DATETIME:
+            return datetime.fromisoformat(data.decode())
+        if code == self.EXT_DATE:
+            return date.fromisoformat(data.decode())
+        if code == self.EXT_DECIMAL:
+            return Decimal(data.decode())
+        return msgpack.ExtType(code, data)
+
+    def dumps(self, value: Any) -> bytes:
+        return msgpack.packb(value, default=self._default, use_bin_type=True)
+
+    def loads(self, data: bytes) -> Any:
+        return msgpack.unpackb(data, ext_hook=self._ext_hook, raw=False, strict_map_key=False)
+
+
+class CompressedCodec:
+    """Frames another codec's output, zlib-compressing payloads above a size threshold
+
+    The first byte records the inner codec and whether the body is compressed,
+    so values written by a different codec (e.g. across a deploy) read as a
+    miss instead of garbage.
+    """
+
+    COMPRESSED_FLAG = 0x80
+
+    def __init__(self, codec, threshold: int = CACHE_COMPRESS_THRESHOLD, level: int = 6):
+        self.codec = codec
+        self.threshold = threshold
+        self.level = level
+        self.name = f"{codec.name}+zlib" if threshold else codec.name
+
+    def dumps(self, value: Any) -> bytes:
+        body = self.codec.dumps(value)
+        header = self.codec.codec_id
+        if self.threshold and len(body) >= self.threshold:
+            body = zlib.compress(body, self.level)
+            header |= self.COMPRESSED_FLAG
+        return bytes([header]) + body
+
+    def loads(self, data: bytes) -> Any:
+        header, body = data[0], data[1:]
+        if header & ~self.COMPRESSED_FLAG != self.codec.codec_id:
+            raise ValueError(f"Cached value was written by another codec (id {header & ~self.COMPRESSED_FLAG})")
+        if header & self.COMPRESSED_FLAG:
+            body = zlib.decompress(body)
+        return self.codec.loads(body)
+
+
+def available_codecs() -> Dict[str, Any]:
+    codecs = {"json": JSONCodec()}
+    if orjson is not None:
+        codecs["orjson"] = OrjsonCodec()
+    if msgpack is not None:
+        codecs["msgpack"] = MsgpackCodec()
+    return codecs
+
+
+def get_codec(name: str = CACHE_CODEC, compress_threshold: int = CACHE_COMPRESS_THRESHOLD) -> CompressedCodec:
+    """Framed codec by name; defaults to the fastest one installed"""
+    codecs = available_codecs()
+    if name and name not in codecs:
+        logger.warning(f"Cache codec '{name}' unavailable, falling back")
+        name = ""
+    if not name:
+        name = next(n for n in ("msgpack", "orjson", "json") if n in codecs)
+    return CompressedCodec(codecs[name], threshold=compress_threshold)
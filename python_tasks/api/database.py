@@ -1,135 +1,519 @@
 """Database connection and models for FastAPI
-Production-ready with connection pooling for 100K+ users
+Async-native (asyncpg) with connection pooling for 100K+ users
 """
 
 import os
+import re
+import time
+import base64
+import hashlib
+import asyncio
 import logging
-from contextlib import contextmanager
-from typing import Optional, List, Dict, Any
-import psycopg2
-from psycopg2 import pool
-from psycopg2.extras import RealDictCursor
+import threading
+from contextlib import asynccontextmanager
+from datetime import datetime, date
+from typing import Optional, List, Dict, Any, Tuple
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import asyncpg
+
+from api.cache import cache, InMemoryCache
 
 logger = logging.getLogger('python_api.database')
 
 DATABASE_URL = os.environ.get('DATABASE_URL', '')
+DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', 2))
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 20))
+DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 15000))
+DB_SLOW_QUERY_MS = int(os.environ.get('DB_SLOW_QUERY_MS', 500))
+COUNTER_SNAPSHOT_MAX_AGE = int(os.environ.get('COUNTER_SNAPSHOT_MAX_AGE', 60))
+COUNT_CACHE_TTL = int(os.environ.get('COUNT_CACHE_TTL', 60))
+USER_SEARCH_COUNT_CAP = int(os.environ.get('USER_SEARCH_COUNT_CAP', 10000))
+ROLE_CACHE_TTL = int(os.environ.get('ROLE_CACHE_TTL', 60))
+ROLE_CACHE_MAX_SIZE = int(os.environ.get('ROLE_CACHE_MAX_SIZE', 10000))
+ANONYMIZE_BATCH_SIZE = int(os.environ.get('ANONYMIZE_BATCH_SIZE', 500))
+# Leaderboard windows kept in "ContributorScore", in days (None = all time)
+CONTRIBUTOR_WINDOWS = {"7d": 7, "30d": 30, "all": None}
+# Shorter terms match as a prefix; a bare %ab% has no trigram to look up
+USER_SEARCH_MIN_CONTAINS = 3
 
-connection_pool: Optional[pool.ThreadedConnectionPool] = None
+# Prisma-style query params that asyncpg does not understand
+_UNSUPPORTED_DSN_PARAMS = {'pgbouncer', 'connection_limit', 'pool_timeout', 'schema'}
 
-def init_connection_pool(min_conn: int = 2, max_conn: int = 20):
-    """Initialize the connection pool for production use"""
-    global connection_pool
-    if connection_pool is None:
+
+class QueryMetrics:
+    """Per-query latency metrics, keyed by a normalized SQL fingerprint"""
+    
+    def __init__(self, top_n: int = 10):
+        self._lock = threading.Lock()
+        self._queries: Dict[str, Dict[str, float]] = {}
+        self.top_n = top_n
+        self._total = 0
+        self._errors = 0
+        self._slow = 0
+    
+    @staticmethod
+    def fingerprint(query: str) -> str:
+        return ' '.join(query.split())[:120]
+    
+    def record(self, query: str, duration_ms: float, error: bool = False) -> None:
+        key = self.fingerprint(query)
+        with self._lock:
+            entry = self._queries.get(key)
+            if entry is None:
+                entry = self._queries[key] = {"calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0}
+            entry["calls"] += 1
+            entry["total_ms"] += duration_ms
+            entry["max_ms"] = max(entry["max_ms"], duration_ms)
+            self._total += 1
+            if error:
+                entry["errors"] += 1
+                self._errors += 1
+            if duration_ms >= DB_SLOW_QUERY_MS:
+                self._slow += 1
+        if duration_ms >= DB_SLOW_QUERY_MS:
+            logger.warning(f"Slow query ({duration_ms:.1f}ms): {key}")
+    
+    def stats(self) -> dict:
+        with self._lock:
+            ranked = sorted(self._queries.items(), key=lambda kv: kv[1]["total_ms"], reverse=True)
+            return {
+                "queries": self._total,
+                "errors": self._errors,
+                "slow_queries": self._slow,
+                "slow_threshold_ms": DB_SLOW_QUERY_MS,
+                "top_queries": [
+                    {
+                        "query": key,
+                        "calls": int(entry["calls"]),
+                        "errors": int(entry["errors"]),
+                        "avg_ms": round(entry["total_ms"] / entry["calls"], 2),
+                        "max_ms": round(entry["max_ms"], 2),
+                        "total_ms": round(entry["total_ms"], 2)
+                    }
+                    for key, entry in ranked[:self.top_n]
+                ]
+            }
+
+
+query_metrics = QueryMetrics()
+
+connection_pool: Optional[asyncpg.Pool] = None
+_pool_lock: Optional[asyncio.Lock] = None
+_snapshot_lock: Optional[asyncio.Lock] = None
+
+
+def _prepare_dsn(url: str) -> tuple:
+    """Strip Prisma-only params from DATABASE_URL; report whether pgbouncer is in front"""
+    parts = urlsplit(url)
+    params = parse_qsl(parts.query, keep_blank_values=True)
+    behind_pgbouncer = any(k == 'pgbouncer' and v == 'true' for k, v in params)
+    query = urlencode([(k, v) for k, v in params if k not in _UNSUPPORTED_DSN_PARAMS])
+    return urlunsplit(parts._replace(query=query)), behind_pgbouncer
+
+
+async def init_connection_pool(min_size: int = DB_POOL_MIN_SIZE, max_size: int = DB_POOL_MAX_SIZE):
+    """Initialize the asyncpg connection pool for production use"""
+    global connection_pool, _pool_lock
+    if _pool_lock is None:
+        _pool_lock = asyncio.Lock()
+    async with _pool_lock:
+        if connection_pool is not None:
+            return connection_pool
+        dsn, behind_pgbouncer = _prepare_dsn(DATABASE_URL)
+        options = {
+            "min_size": min_size,
+            "max_size": max_size,
+            "command_timeout": DB_STATEMENT_TIMEOUT_MS / 1000,
+        }
+        if behind_pgbouncer:
+            # Transaction pooling breaks prepared statements and rejects startup params
+            options["statement_cache_size"] = 0
+        else:
+            options["server_settings"] = {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}
         try:
-            connection_pool = pool.ThreadedConnectionPool(
-                minconn=min_conn,
-                maxconn=max_conn,
-                dsn=DATABASE_URL
-            )
-            logger.info(f"Database connection pool initialized (min={min_conn}, max={max_conn})")
+            connection_pool = await asyncpg.create_pool(dsn, **options)
+            logger.info(f"Database connection pool initialized (min={min_size}, max={max_size}, "
+                        f"statement_timeout={DB_STATEMENT_TIMEOUT_MS}ms)")
         except Exception as e:
             logger.error(f"Failed to initialize connection pool: {e}")
             raise
+        return connection_pool
 
-def get_connection():
-    """Get a database connection from pool or create new one"""
-    global connection_pool
-    if connection_pool:
-        return connection_pool.getconn()
-    return psycopg2.connect(DATABASE_URL)
 
-def release_connection(conn):
-    """Release connection back to pool"""
+async def close_connection_pool():
+    """Close the pool, waiting for checked-out connections to be released"""
     global connection_pool
-    if connection_pool:
-        try:
-            connection_pool.putconn(conn)
-        except Exception:
-            pass
-    else:
-        try:
-            conn.close()
-        except Exception:
-            pass
-
-@contextmanager
-def get_db():
-    """Database connection context manager with pooling support"""
-    conn = get_connection()
+    if connection_pool is not None:
+        pool, connection_pool = connection_pool, None
+        await pool.close()
+        logger.info("Database connection pool closed")
+
+
+async def get_pool() -> asyncpg.Pool:
+    if connection_pool is None:
+        return await init_connection_pool()
+    return connection_pool
+
+
+@asynccontextmanager
+async def get_db():
+    """Connection context manager wrapping work in a transaction"""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            yield conn
+
+
+_PLACEHOLDER = re.compile(r'%s')
+
+
+def to_asyncpg(query: str) -> str:
+    """Rewrite psycopg-style %s placeholders to asyncpg's positional $n"""
+    counter = iter(range(1, 10_000))
+    return _PLACEHOLDER.sub(lambda _: f'${next(counter)}', query)
+
+
+async def execute_query(query: str, params: tuple = None, fetch_one: bool = False) -> Any:
+    """Execute a query and return results"""
+    pool = await get_pool()
+    sql = to_asyncpg(query)
+    start = time.perf_counter()
+    error = False
     try:
-        yield conn
-        conn.commit()
+        async with pool.acquire() as conn:
+            if fetch_one:
+                row = await conn.fetchrow(sql, *(params or ()))
+                return dict(row) if row else None
+            return [dict(row) for row in await conn.fetch(sql, *(params or ()))]
     except Exception:
-        conn.rollback()
+        error = True
         raise
     finally:
-        release_connection(conn)
+        query_metrics.record(query, (time.perf_counter() - start) * 1000, error)
 
-def execute_query(query: str, params: tuple = None, fetch_one: bool = False) -> Any:
-    """Execute a query and return results"""
-    with get_db() as conn:
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        cursor.execute(query, params)
-        if fetch_one:
-            result = cursor.fetchone()
-            return dict(result) if result else None
-        return [dict(row) for row in cursor.fetchall()]
-
-def execute_write(query: str, params: tuple = None) -> int:
+
+async def execute_write(query: str, params: tuple = None) -> int:
     """Execute a write query and return affected rows"""
-    with get_db() as conn:
-        cursor = conn.cursor()
-        cursor.execute(query, params)
-        return cursor.rowcount
+    pool = await get_pool()
+    sql = to_asyncpg(query)
+    start = time.perf_counter()
+    error = False
+    try:
+        async with pool.acquire() as conn:
+            status = await conn.execute(sql, *(params or ()))
+        return _rowcount(status)
+    except Exception:
+        error = True
+        raise
+    finally:
+        query_metrics.record(query, (time.perf_counter() - start) * 1000, error)
+
+
+def _rowcount(status: str) -> int:
+    """Parse the affected row count out of a command tag such as 'UPDATE 3'"""
+    try:
+        return int(status.rsplit(' ', 1)[-1])
+    except (ValueError, AttributeError):
+        return 0
+
+
+def db_stats() -> dict:
+    """Pool utilisation and query latency metrics"""
+    pool = connection_pool
+    stats = {
+        "driver": "asyncpg",
+        "pool_initialized": pool is not None,
+        "statement_timeout_ms": DB_STATEMENT_TIMEOUT_MS,
+    }
+    if pool is not None:
+        stats.update({
+            "pool_size": pool.get_size(),
+            "pool_idle": pool.get_idle_size(),
+            "pool_max": pool.get_max_size(),
+        })
+    stats.update(query_metrics.stats())
+    return stats
+
+
+def encode_cursor(created_at: datetime, row_id: str) -> str:
+    """Opaque keyset cursor for the row a page ended on"""
+    raw = f"{created_at.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """(createdAt, id) from a cursor; raises ValueError if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, row_id = raw.split("|", 1)
+        return datetime.fromisoformat(created_at), row_id
+    except (UnicodeDecodeError, ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def keyset_page(rows: List[Dict], limit: int) -> Tuple[List[Dict], Optional[str]]:
+    """Trim a limit + 1 fetch to the page and build the cursor for the next one"""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(last['createdAt'], last['id'])
+
+
+async def count_rows(table: str, from_clause: str, where: str = "", params: tuple = (),
+                     exact: bool = False) -> int:
+    """Row count for a listing total, approximate unless exact is set
+
+    Unfiltered totals come from the planner's reltuples estimate. Filtered
+    totals are counted once and cached for COUNT_CACHE_TTL seconds (dropped
+    early by writes tagged with the table), so paging does not recount.
+    """
+    query = f'SELECT COUNT(*) as count FROM {from_clause}' + (f' WHERE {where}' if where else '')
+    if not exact and not where:
+        result = await execute_query(
+            'SELECT reltuples::bigint as estimate FROM pg_class WHERE oid = to_regclass(%s)',
+            (f'"{table}"',), fetch_one=True)
+        # reltuples is -1 until the table has been vacuumed or analyzed
+        if result and result['estimate'] >= 0:
+            return result['estimate']
+
+    key = None
+    if not exact:
+        digest = hashlib.md5(f"{query}|{params!r}".encode()).hexdigest()
+        key = f"count:{table}:{digest}"
+        cached_count = await cache.aget(key)
+        if cached_count is not None:
+            return cached_count
+
+    result = await execute_query(query, params or None, fetch_one=True)
+    count = result['count'] if result else 0
+    if key:
+        await cache.aset(key, count, COUNT_CACHE_TTL, tags=[f"table:{table}"])
+    return count
+
+
+_USER_SEARCH_MATCH = '''
+                SELECT id FROM "User" WHERE email ILIKE %s
+                UNION
+                SELECT "userId" FROM "Profile" WHERE username ILIKE %s
+'''
+
+
+def like_pattern(term: str, prefix: bool = False) -> str:
+    """ILIKE pattern matching term literally, anchored at the start if prefix"""
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"{escaped}%" if prefix else f"%{escaped}%"
+
+
+def user_search_condition(term: str) -> Tuple[str, tuple]:
+    """WHERE clause matching users by email or username, served by the trigram indexes
 
-try:
-    init_connection_pool()
-except Exception as e:
-    logger.warning(f"Connection pool not initialized, using direct connections: {e}")
+    Each side is its own subquery so the planner can use the GIN index on
+    User.email and on Profile.username; an OR across the join cannot use either.
+    """
+    pattern = like_pattern(term, prefix=len(term) < USER_SEARCH_MIN_CONTAINS)
+    return f'u.id IN ({_USER_SEARCH_MATCH})', (pattern, pattern)
+
+
+def build_user_search(term: str, limit: int, offset: int = 0, after: Tuple[datetime, str] = None,
+                      count_cap: Optional[int] = USER_SEARCH_COUNT_CAP) -> Tuple[str, tuple]:
+    """One statement returning a page of matching users plus a capped match count
+
+    The matches are collected once and feed both the count and the page.
+    Every row carries "searchTotal"; when the page is empty a single row with
+    a NULL id still carries it. Counting stops at count_cap (None counts all).
+    """
+    _, search_params = user_search_condition(term)
+    params = list(search_params)
+    counted = 'SELECT 1 FROM matched'
+    if count_cap:
+        counted += ' LIMIT %s'
+        params.append(count_cap)
+
+    page_where = 'u.id IN (SELECT id FROM matched)'
+    if after:
+        page_where += ' AND (u."createdAt", u.id) < (%s, %s)'
+        params.extend(after)
+    page_tail = ' LIMIT %s'
+    params.append(limit)
+    if offset and not after:
+        page_tail += ' OFFSET %s'
+        params.append(offset)
+
+    query = f'''
+        WITH matched AS MATERIALIZED ({_USER_SEARCH_MATCH})
+        SELECT t."searchTotal", page.*
+        FROM (SELECT COUNT(*) AS "searchTotal" FROM ({counted}) c) t
+        LEFT JOIN LATERAL (
+            SELECT u.id, u.email, u."createdAt", u."lastLoginAt",
+                   p.username, p."displayName", p."avatarUrl"
+            FROM "User" u
+            LEFT JOIN "Profile" p ON u.id = p."userId"
+            WHERE {page_where}
+            ORDER BY u."createdAt" DESC, u.id DESC{page_tail}
+        ) page ON true
+    '''
+    return query, tuple(params)
+
+
+# Roles per user id, tagged user:<id> so role changes published by the web app
+# (or any tagged write here) drop the entry on every worker
+_role_cache = InMemoryCache(max_size=ROLE_CACHE_MAX_SIZE, default_ttl=ROLE_CACHE_TTL, sweep_interval=0)
+cache.add_tag_listener(_role_cache.invalidate_tags)
+
+
+# Anonymizes a batch of users and audits each one in a single statement (so a
+# single transaction): either every user in the batch is done or none is
+_ANONYMIZE_USERS = '''
+    WITH targets AS (
+        SELECT id FROM "User" WHERE id = ANY(%s) FOR UPDATE
+    ), posts AS (
+        UPDATE "Post" p SET "isAnonymous" = true
+        FROM targets t WHERE p."authorId" = t.id
+        RETURNING p.id
+    ), comments AS (
+        UPDATE "Comment" c SET "isAnonymous" = true
+        FROM targets t WHERE c."authorId" = t.id
+        RETURNING c.id
+    ), users AS (
+        UPDATE "User" u SET email = 'deleted_' || u.id || '@deleted.neurokid.help', "hashedPassword" = NULL
+        FROM targets t WHERE u.id = t.id
+        RETURNING u.id
+    ), audit AS (
+        INSERT INTO "AuditLog" (id, action, "userId", "targetType", "targetId", changes, "createdAt")
+        SELECT gen_random_uuid(), 'ACCOUNT_DELETED', id, 'user', id, %s::jsonb, NOW() FROM users
+    )
+    SELECT (SELECT COALESCE(array_agg(id), '{}') FROM users) as users,
+           (SELECT COUNT(*) FROM posts) as posts,
+           (SELECT COUNT(*) FROM comments) as comments
+'''
 
 
 class UserRepository:
     @staticmethod
-    def get_all(limit: int = 50, offset: int = 0, search: str = None) -> List[Dict]:
+    async def get_roles(user_ids: List[str]) -> Dict[str, List[str]]:
+        """Every role held by each user, most privileged first, with one query for all cache misses"""
+        roles = {}
+        missing = []
+        for user_id in dict.fromkeys(user_ids):
+            cached_roles = _role_cache.get(user_id)
+            if cached_roles is None:
+                missing.append(user_id)
+            else:
+                roles[user_id] = cached_roles
+        if missing:
+            rows = await execute_query('''
+                SELECT "userId", array_agg(role::text ORDER BY role DESC) as roles
+                FROM "UserRole"
+                WHERE "userId" = ANY(%s)
+                GROUP BY "userId"
+            ''', (missing,))
+            loaded = {row['userId']: list(row['roles']) for row in rows}
+            for user_id in missing:
+                roles[user_id] = loaded.get(user_id, [])
+                _role_cache.set(user_id, roles[user_id], tags=[f"user:{user_id}", "table:UserRole"])
+        return roles
+
+    @staticmethod
+    async def attach_roles(users: List[Dict]) -> List[Dict]:
+        """Fill roles (all of them) and role (the most privileged) on user rows in place"""
+        roles = await UserRepository.get_roles([user['id'] for user in users])
+        for user in users:
+            user['roles'] = roles[user['id']]
+            user['role'] = user['roles'][0] if user['roles'] else None
+        return users
+
+    @staticmethod
+    async def get_all(limit: int = 50, offset: int = 0, search: str = None,
+                      after: Tuple[datetime, str] = None) -> List[Dict]:
+        """Users newest first; pass after=(createdAt, id) to page by keyset instead of offset"""
         query = '''
             SELECT u.id, u.email, u."createdAt", u."lastLoginAt",
-                   p.username, p."displayName", p."avatarUrl",
-                   (SELECT r.role FROM "UserRole" r WHERE r."userId" = u.id LIMIT 1) as role
+                   p.username, p."displayName", p."avatarUrl"
             FROM "User" u
             LEFT JOIN "Profile" p ON u.id = p."userId"
         '''
+        conditions = []
         params = []
         if search:
-            query += ' WHERE u.email ILIKE %s OR p.username ILIKE %s'
-            params.extend([f'%{search}%', f'%{search}%'])
-        query += ' ORDER BY u."createdAt" DESC LIMIT %s OFFSET %s'
-        params.extend([limit, offset])
-        return execute_query(query, tuple(params))
+            condition, search_params = user_search_condition(search)
+            conditions.append(condition)
+            params.extend(search_params)
+        if after:
+            conditions.append('(u."createdAt", u.id) < (%s, %s)')
+            params.extend(after)
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY u."createdAt" DESC, u.id DESC LIMIT %s'
+        params.append(limit)
+        if offset and not after:
+            query += ' OFFSET %s'
+            params.append(offset)
+        return await UserRepository.attach_roles(await execute_query(query, tuple(params)))
 
     @staticmethod
-    def get_by_id(user_id: str) -> Optional[Dict]:
+    async def search(term: str, limit: int = 50, offset: int = 0, after: Tuple[datetime, str] = None,
+                     exact: bool = False) -> Tuple[List[Dict], int, bool]:
+        """Matching users newest first with their total, in a single round trip
+
+        Returns (rows, total, total_is_estimate); the total stops counting at
+        USER_SEARCH_COUNT_CAP unless exact is set.
+        """
+        count_cap = None if exact else USER_SEARCH_COUNT_CAP
+        query, params = build_user_search(term, limit, offset, after, count_cap)
+        rows = await execute_query(query, params)
+        total = rows[0]['searchTotal'] if rows else 0
+        users = []
+        for row in rows:
+            row.pop('searchTotal')
+            if row['id'] is not None:
+                users.append(row)
+        await UserRepository.attach_roles(users)
+        return users, total, bool(count_cap) and total >= count_cap
+
+    @staticmethod
+    async def get_by_id(user_id: str) -> Optional[Dict]:
         query = '''
             SELECT u.id, u.email, u."createdAt", u."lastLoginAt",
-                   p.username, p."displayName", p.bio, p."avatarUrl", p.location,
-                   (SELECT r.role FROM "UserRole" r WHERE r."userId" = u.id LIMIT 1) as role
+                   p.username, p."displayName", p.bio, p."avatarUrl", p.location
             FROM "User" u
             LEFT JOIN "Profile" p ON u.id = p."userId"
             WHERE u.id = %s
         '''
-        return execute_query(query, (user_id,), fetch_one=True)
+        user = await execute_query(query, (user_id,), fetch_one=True)
+        if user:
+            await UserRepository.attach_roles([user])
+        return user
 
     @staticmethod
-    def get_count(search: str = None) -> int:
-        query = 'SELECT COUNT(*) as count FROM "User" u'
-        params = []
+    async def get_count(search: str = None, exact: bool = False) -> int:
         if search:
-            query += ' LEFT JOIN "Profile" p ON u.id = p."userId" WHERE u.email ILIKE %s OR p.username ILIKE %s'
-            params.extend([f'%{search}%', f'%{search}%'])
-        result = execute_query(query, tuple(params) if params else None, fetch_one=True)
-        return result['count'] if result else 0
+            condition, params = user_search_condition(search)
+            return await count_rows("User", '"User" u', condition, params, exact=exact)
+        return await count_rows("User", '"User"', exact=exact)
+
+    @staticmethod
+    async def anonymize(user_ids: List[str], details: dict = None,
+                        batch_size: int = ANONYMIZE_BATCH_SIZE) -> Dict[str, Any]:
+        """Anonymize users and their posts and comments, auditing each user in the same transaction
+        
+        One statement per batch_size users. Ids that do not exist are skipped;
+        the returned "users" lists the ones that were anonymized.
+        """
+        import json
+        changes = json.dumps({"action": "user_anonymized", **(details or {})})
+        result = {"users": [], "posts": 0, "comments": 0}
+        user_ids = list(dict.fromkeys(user_ids))
+        for start in range(0, len(user_ids), batch_size):
+            row = await execute_query(_ANONYMIZE_USERS, (user_ids[start:start + batch_size], changes),
+                                      fetch_one=True)
+            result["users"].extend(row['users'])
+            result["posts"] += row['posts']
+            result["comments"] += row['comments']
+        return result
 
     @staticmethod
-    def get_user_posts(user_id: str, limit: int = 20) -> List[Dict]:
+    async def get_user_posts(user_id: str, limit: int = 20) -> List[Dict]:
         query = '''
             SELECT id, title, "createdAt", "voteScore", status
             FROM "Post"
@@ -137,10 +521,10 @@ class UserRepository:
             ORDER BY "createdAt" DESC
             LIMIT %s
         '''
-        return execute_query(query, (user_id, limit))
+        return await execute_query(query, (user_id, limit))
 
     @staticmethod
-    def get_user_comments(user_id: str, limit: int = 20) -> List[Dict]:
+    async def get_user_comments(user_id: str, limit: int = 20) -> List[Dict]:
         query = '''
             SELECT c.id, c.content, c."createdAt", c."voteScore", p.title as "postTitle"
             FROM "Comment" c
@@ -149,12 +533,14 @@ class UserRepository:
             ORDER BY c."createdAt" DESC
             LIMIT %s
         '''
-        return execute_query(query, (user_id, limit))
+        return await execute_query(query, (user_id, limit))
 
 
 class PostRepository:
     @staticmethod
-    def get_all(limit: int = 50, offset: int = 0, category_id: str = None) -> List[Dict]:
+    async def get_all(limit: int = 50, offset: int = 0, category_id: str = None,
+                      after: Tuple[datetime, str] = None) -> List[Dict]:
+        """Posts newest first; pass after=(createdAt, id) to page by keyset instead of offset"""
         query = '''
             SELECT p.id, p.title, p."createdAt", p."voteScore", p.status, p."isPinned",
                    c.name as "categoryName", pr.username as "authorUsername"
@@ -163,28 +549,34 @@ class PostRepository:
             LEFT JOIN "User" u ON p."authorId" = u.id
             LEFT JOIN "Profile" pr ON u.id = pr."userId"
         '''
+        conditions = []
         params = []
         if category_id:
-            query += ' WHERE p."categoryId" = %s'
+            conditions.append('p."categoryId" = %s')
             params.append(category_id)
-        query += ' ORDER BY p."createdAt" DESC LIMIT %s OFFSET %s'
-        params.extend([limit, offset])
-        return execute_query(query, tuple(params))
+        if after:
+            conditions.append('(p."createdAt", p.id) < (%s, %s)')
+            params.extend(after)
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY p."createdAt" DESC, p.id DESC LIMIT %s'
+        params.append(limit)
+        if offset and not after:
+            query += ' OFFSET %s'
+            params.append(offset)
+        return await execute_query(query, tuple(params))
 
     @staticmethod
-    def get_count(category_id: str = None) -> int:
-        query = 'SELECT COUNT(*) as count FROM "Post"'
-        params = []
+    async def get_count(category_id: str = None, exact: bool = False) -> int:
         if category_id:
-            query += ' WHERE "categoryId" = %s'
-            params.append(category_id)
-        result = execute_query(query, tuple(params) if params else None, fetch_one=True)
-        return result['count'] if result else 0
+            return await count_rows("Post", '"Post"', '"categoryId" = %s', (category_id,), exact=exact)
+        return await count_rows("Post", '"Post"', exact=exact)
 
 
 class CommentRepository:
     @staticmethod
-    def get_all(limit: int = 50, offset: int = 0) -> List[Dict]:
+    async def get_all(limit: int = 50, offset: int = 0, after: Tuple[datetime, str] = None) -> List[Dict]:
+        """Comments newest first; pass after=(createdAt, id) to page by keyset instead of offset"""
         query = '''
             SELECT c.id, c.content, c."createdAt", c."voteScore",
                    p.title as "postTitle", pr.username as "authorUsername"
@@ -192,89 +584,180 @@ class CommentRepository:
             JOIN "Post" p ON c."postId" = p.id
             LEFT JOIN "User" u ON c."authorId" = u.id
             LEFT JOIN "Profile" pr ON u.id = pr."userId"
-            ORDER BY c."createdAt" DESC
-            LIMIT %s OFFSET %s
         '''
-        return execute_query(query, (limit, offset))
+        params = []
+        if after:
+            query += ' WHERE (c."createdAt", c.id) < (%s, %s)'
+            params.extend(after)
+        query += ' ORDER BY c."createdAt" DESC, c.id DESC LIMIT %s'
+        params.append(limit)
+        if offset and not after:
+            query += ' OFFSET %s'
+            params.append(offset)
+        return await execute_query(query, tuple(params))
 
     @staticmethod
-    def get_count() -> int:
-        result = execute_query('SELECT COUNT(*) as count FROM "Comment"', fetch_one=True)
-        return result['count'] if result else 0
+    async def get_count(exact: bool = False) -> int:
+        return await count_rows("Comment", '"Comment"', exact=exact)
 
 
 class AnalyticsRepository:
+    COUNTER_SNAPSHOT_KEY = "analytics:counter_snapshot"
+    COUNTER_TAGS = ["table:User", "table:Post", "table:Comment", "table:Vote", "table:AuditLog"]
+    DASHBOARD_FIELDS = ('total_users', 'total_posts', 'total_comments', 'total_votes',
+                        'new_users_7d', 'active_users_24h')
+    
     @staticmethod
-    def get_dashboard_stats() -> Dict:
-        stats = {}
-        
-        result = execute_query('SELECT COUNT(*) as count FROM "User"', fetch_one=True)
-        stats['total_users'] = result['count'] if result else 0
-        
-        result = execute_query('SELECT COUNT(*) as count FROM "Post"', fetch_one=True)
-        stats['total_posts'] = result['count'] if result else 0
-        
-        result = execute_query('SELECT COUNT(*) as count FROM "Comment"', fetch_one=True)
-        stats['total_comments'] = result['count'] if result else 0
-        
-        result = execute_query('SELECT COUNT(*) as count FROM "Vote"', fetch_one=True)
-        stats['total_votes'] = result['count'] if result else 0
-        
-        result = execute_query('''
-            SELECT COUNT(*) as count FROM "User" 
-            WHERE "createdAt" > NOW() - INTERVAL '7 days'
-        ''', fetch_one=True)
-        stats['new_users_7d'] = result['count'] if result else 0
-        
-        result = execute_query('''
-            SELECT COUNT(*) as count FROM "User" 
-            WHERE "lastLoginAt" > NOW() - INTERVAL '24 hours'
-        ''', fetch_one=True)
-        stats['active_users_24h'] = result['count'] if result else 0
+    async def get_counters() -> Dict:
+        """All headline counters in one round trip, scanning each table once"""
+        query = '''
+            SELECT u.total_users, u.new_users_7d, u.active_users_24h, u.active_users_30d,
+                   u.inactive_30d, u.inactive_90d,
+                   p.total_posts, p.deleted_posts, p.avg_vote_score,
+                   (SELECT COUNT(*) FROM "Comment") as total_comments,
+                   (SELECT COUNT(*) FROM "Vote") as total_votes,
+                   (SELECT COUNT(*) FROM "AuditLog"
+                    WHERE "createdAt" < NOW() - INTERVAL '90 days') as old_audit_logs
+            FROM (
+                SELECT COUNT(*) as total_users,
+                       COUNT(*) FILTER (WHERE "createdAt" > NOW() - INTERVAL '7 days') as new_users_7d,
+                       COUNT(*) FILTER (WHERE "lastLoginAt" > NOW() - INTERVAL '24 hours') as active_users_24h,
+                       COUNT(*) FILTER (WHERE "lastLoginAt" > NOW() - INTERVAL '30 days') as active_users_30d,
+                       COUNT(*) FILTER (WHERE "lastLoginAt" < NOW() - INTERVAL '30 days') as inactive_30d,
+                       COUNT(*) FILTER (WHERE "lastLoginAt" < NOW() - INTERVAL '90 days') as inactive_90d
+                FROM "User"
+            ) u, (
+                SELECT COUNT(*) as total_posts,
+                       COUNT(*) FILTER (WHERE status = 'REMOVED') as deleted_posts,
+                       COALESCE(AVG("voteScore"), 0)::float as avg_vote_score
+                FROM "Post"
+            ) p
+        '''
+        return await execute_query(query, fetch_one=True) or {}
+    
+    @staticmethod
+    async def get_counter_snapshot(max_age: int = COUNTER_SNAPSHOT_MAX_AGE) -> Dict:
+        """Shared counter snapshot, refreshed at most once per max_age seconds"""
+        global _snapshot_lock
+        snapshot = await cache.aget(AnalyticsRepository.COUNTER_SNAPSHOT_KEY)
+        if snapshot and time.time() - snapshot['fetched_at'] <= max_age:
+            return snapshot
         
-        return stats
+        if _snapshot_lock is None:
+            _snapshot_lock = asyncio.Lock()
+        async with _snapshot_lock:
+            snapshot = await cache.aget(AnalyticsRepository.COUNTER_SNAPSHOT_KEY)
+            if snapshot and time.time() - snapshot['fetched_at'] <= max_age:
+                return snapshot
+            snapshot = await AnalyticsRepository.get_counters()
+            snapshot['fetched_at'] = time.time()
+            await cache.aset(AnalyticsRepository.COUNTER_SNAPSHOT_KEY, snapshot, COUNTER_SNAPSHOT_MAX_AGE,
+                             tags=AnalyticsRepository.COUNTER_TAGS)
+            return snapshot
+    
+    @staticmethod
+    async def get_dashboard_stats() -> Dict:
+        snapshot = await AnalyticsRepository.get_counter_snapshot()
+        return {field: snapshot.get(field, 0) for field in AnalyticsRepository.DASHBOARD_FIELDS}
 
     @staticmethod
-    def get_activity_timeline(days: int = 30) -> List[Dict]:
+    async def get_daily_activity(days: int = 30) -> List[Dict]:
+        """Per-day counts for the last days days (today included), newest first
+
+        Days "DailyActivityRollup" covers come from it; days outside it (today,
+        and anything older than its backfill) are counted live from the
+        createdAt indexes, so a window longer than the backfill stays complete.
+        """
         query = '''
-            SELECT DATE("createdAt") as date,
-                   COUNT(*) FILTER (WHERE type = 'post') as posts,
-                   COUNT(*) FILTER (WHERE type = 'comment') as comments,
-                   COUNT(*) FILTER (WHERE type = 'user') as new_users
-            FROM (
-                SELECT "createdAt", 'post' as type FROM "Post"
-                UNION ALL
-                SELECT "createdAt", 'comment' as type FROM "Comment"
-                UNION ALL
-                SELECT "createdAt", 'user' as type FROM "User"
-            ) activity
-            WHERE "createdAt" > NOW() - INTERVAL '%s days'
-            GROUP BY DATE("createdAt")
+            WITH bounds AS (
+                SELECT CURRENT_DATE - %s::int + 1 AS start,
+                       MIN("date") AS rolled_from,
+                       MAX("date") + 1 AS rolled_to
+                FROM "DailyActivityRollup"
+                WHERE "date" < CURRENT_DATE
+            )
+            SELECT r."date" as date, r.posts, r.comments, r."newUsers" as new_users, r.votes
+            FROM "DailyActivityRollup" r, bounds
+            WHERE r."date" >= bounds.start AND r."date" < bounds.rolled_to
+            UNION ALL
+            SELECT day as date,
+                   (SELECT COUNT(*) FROM "Post" WHERE "createdAt" >= day AND "createdAt" < day + 1) as posts,
+                   (SELECT COUNT(*) FROM "Comment" WHERE "createdAt" >= day AND "createdAt" < day + 1) as comments,
+                   (SELECT COUNT(*) FROM "User" WHERE "createdAt" >= day AND "createdAt" < day + 1) as new_users,
+                   (SELECT COUNT(*) FROM "Vote" WHERE "createdAt" >= day AND "createdAt" < day + 1) as votes
+            FROM bounds, generate_series(bounds.start, CURRENT_DATE, INTERVAL '1 day') g,
+                 LATERAL (SELECT g::date as day) d
+            WHERE bounds.rolled_from IS NULL OR day < bounds.rolled_from OR day >= bounds.rolled_to
             ORDER BY date DESC
         '''
-        return execute_query(query, (days,))
+        return await execute_query(query, (days,))
 
     @staticmethod
-    def get_top_contributors(limit: int = 10) -> List[Dict]:
-        query = '''
-            SELECT u.id, p.username, p."displayName",
-                   COUNT(DISTINCT po.id) as "postCount",
-                   COUNT(DISTINCT c.id) as "commentCount",
-                   COALESCE(SUM(po."voteScore"), 0) as "totalScore"
-            FROM "User" u
-            LEFT JOIN "Profile" p ON u.id = p."userId"
-            LEFT JOIN "Post" po ON u.id = po."authorId"
-            LEFT JOIN "Comment" c ON u.id = c."authorId"
-            GROUP BY u.id, p.username, p."displayName"
-            ORDER BY COUNT(DISTINCT po.id) + COUNT(DISTINCT c.id) DESC
+    async def get_activity_timeline(days: int = 30) -> List[Dict]:
+        return await AnalyticsRepository.get_daily_activity(days)
+
+    @staticmethod
+    async def get_monthly_growth(months: int = 12) -> List[Dict]:
+        """New users and posts per calendar month, summed from the daily activity"""
+        today = date.today()
+        first_month = (today.year * 12 + today.month - 1) - (months - 1)
+        start = date(first_month // 12, first_month % 12 + 1, 1)
+        monthly: Dict[date, Dict] = {}
+        for day in await AnalyticsRepository.get_daily_activity((today - start).days + 1):
+            month = day['date'].replace(day=1)
+            totals = monthly.setdefault(month, {"month": month, "new_users": 0, "posts": 0})
+            totals['new_users'] += day['new_users']
+            totals['posts'] += day['posts']
+        return sorted(monthly.values(), key=lambda row: row['month'], reverse=True)
+
+    @staticmethod
+    async def get_top_contributors(limit: int = 10, window: str = "all") -> List[Dict]:
+        """Most active contributors in a window ("7d", "30d" or "all")
+
+        Reads the top of the "ContributorScore" index kept by the data-ops
+        leaderboard job. Until that job has filled a window, it is aggregated
+        live, with posts and comments counted separately rather than joined.
+        """
+        rows = await execute_query('''
+            SELECT s."userId" as id, p.username, p."displayName",
+                   s."postCount", s."commentCount", s."totalScore"
+            FROM "ContributorScore" s
+            LEFT JOIN "Profile" p ON s."userId" = p."userId"
+            WHERE s."window" = %s
+            ORDER BY s.activity DESC, s."userId"
+            LIMIT %s
+        ''', (window, limit))
+        if rows:
+            return rows
+        
+        days = CONTRIBUTOR_WINDOWS[window]
+        since = 'WHERE "createdAt" > NOW() - make_interval(days => %s)' if days else ''
+        params = (days, days, limit) if days else (limit,)
+        query = f'''
+            SELECT a."userId" as id, p.username, p."displayName",
+                   COALESCE(a.posts, 0) as "postCount", COALESCE(a.comments, 0) as "commentCount",
+                   COALESCE(a.score, 0) as "totalScore"
+            FROM (
+                SELECT COALESCE(po."authorId", c."authorId") as "userId", po.posts, po.score, c.comments
+                FROM (SELECT "authorId", COUNT(*) as posts, SUM("voteScore") as score
+                      FROM "Post" {since} GROUP BY "authorId") po
+                FULL JOIN (SELECT "authorId", COUNT(*) as comments
+                           FROM "Comment" {since} GROUP BY "authorId") c
+                  ON po."authorId" = c."authorId"
+            ) a
+            LEFT JOIN "Profile" p ON a."userId" = p."userId"
+            WHERE a."userId" IS NOT NULL
+            ORDER BY COALESCE(a.posts, 0) + COALESCE(a.comments, 0) DESC, a."userId"
             LIMIT %s
         '''
-        return execute_query(query, (limit,))
+        return await execute_query(query, params)
 
 
 class AuditRepository:
     @staticmethod
-    def get_logs(limit: int = 100, offset: int = 0, action: str = None, user_id: str = None) -> List[Dict]:
+    async def get_logs(limit: int = 100, offset: int = 0, action: str = None, user_id: str = None,
+                       after: Tuple[datetime, str] = None) -> List[Dict]:
+        """Audit logs newest first; pass after=(createdAt, id) to page by keyset instead of offset"""
         query = '''
             SELECT a.id, a.action, a."userId", a."targetType" as resource, a."targetId" as "resourceId", 
                    a.changes as details, a."createdAt", p.username
@@ -290,16 +773,23 @@ class AuditRepository:
         if user_id:
             query += ' AND a."userId" = %s'
             params.append(user_id)
-        query += ' ORDER BY a."createdAt" DESC LIMIT %s OFFSET %s'
-        params.extend([limit, offset])
-        return execute_query(query, tuple(params))
+        if after:
+            query += ' AND (a."createdAt", a.id) < (%s, %s)'
+            params.extend(after)
+        query += ' ORDER BY a."createdAt" DESC, a.id DESC LIMIT %s'
+        params.append(limit)
+        if offset and not after:
+            query += ' OFFSET %s'
+            params.append(offset)
+        return await execute_query(query, tuple(params))
 
     @staticmethod
-    def create_log(action: str, user_id: str = None, resource: str = None, 
+    async def create_log(action: str, user_id: str = None, resource: str = None, 
                    resource_id: str = None, details: dict = None) -> None:
-        import json
-        query = '''
-            INSERT INTO "AuditLog" (id, action, "userId", "targetType", "targetId", changes, "createdAt")
-            VALUES (gen_random_uuid(), %s, %s, %s, %s, %s, NOW())
-        '''
-        execute_write(query, (action, user_id, resource, resource_id, json.dumps(details) if details else None))
+        """Queue an audit entry on the buffered writer, or insert it directly if the writer is not running"""
+        from api.audit import audit_writer, audit_entry, batch_params, INSERT_AUDIT_BATCH
+        entry = audit_entry(action, user_id, resource, resource_id, details)
+        if audit_writer.running:
+            audit_writer.write(entry)
+            return
+        await execute_write(INSERT_AUDIT_BATCH, batch_params([entry]))
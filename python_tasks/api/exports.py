@@ -0,0 +1,284 @@
+"""
+Streaming GDPR exports for Python API
+NDJSON read through server-side cursors, streamed to the client or stored as a gzip artifact in Postgres
+"""
+
+import os
+import json
+import gzip
+import uuid
+import time
+import asyncio
+import logging
+import tempfile
+from datetime import datetime, date
+from decimal import Decimal
+from typing import AsyncIterator, Dict, Optional
+
+import asyncpg
+
+from api.database import to_asyncpg
+
+logger = logging.getLogger('python_api.exports')
+
+# Local staging for artifacts until they are stored in "ExportArtifact"
+EXPORT_DIR = os.environ.get('EXPORT_DIR', os.path.join(tempfile.gettempdir(), 'neurokid-exports'))
+# Rows fetched per cursor round trip, and per chunk handed to the response
+EXPORT_PREFETCH = int(os.environ.get('EXPORT_PREFETCH', 500))
+EXPORT_ARTIFACT_TTL = int(os.environ.get('EXPORT_ARTIFACT_TTL', 24 * 3600))
+# Bytes per stored artifact row, and per chunk of a download
+EXPORT_CHUNK_BYTES = int(os.environ.get('EXPORT_CHUNK_BYTES', 1024 * 1024))
+# Concurrent NDJSON streams per API worker; each holds its own connection
+EXPORT_MAX_STREAMS = int(os.environ.get('EXPORT_MAX_STREAMS', 4))
+# A stream whose client stops reading for this long is cut off by Postgres,
+# so a stalled download cannot hold its snapshot open and block vacuum
+EXPORT_STREAM_IDLE_TIMEOUT_MS = int(os.environ.get('EXPORT_STREAM_IDLE_TIMEOUT_MS', 30000))
+
+_USER_QUERY = '''
+    SELECT u.id, u.email, u."createdAt", u."lastLoginAt",
+           p.username, p."displayName", p.bio, p.location
+    FROM "User" u
+    LEFT JOIN "Profile" p ON u.id = p."userId"
+    WHERE u.id = %s
+'''
+
+_ROLES_QUERY = '''
+    SELECT role::text as role FROM "UserRole" WHERE "userId" = %s ORDER BY role DESC
+'''
+
+# (record type, count key, query) in the order they appear in the export
+_SECTIONS = (
+    ("post", "posts", '''
+        SELECT id, title, content, "createdAt", "updatedAt", status
+        FROM "Post" WHERE "authorId" = %s
+    '''),
+    ("comment", "comments", '''
+        SELECT c.id, c.content, c."createdAt", p.title as "postTitle"
+        FROM "Comment" c
+        JOIN "Post" p ON c."postId" = p.id
+        WHERE c."authorId" = %s
+    '''),
+    ("vote", "votes", '''
+        SELECT "targetType", "targetId", value, "createdAt"
+        FROM "Vote" WHERE "userId" = %s
+    '''),
+)
+
+_ARTIFACT_INSERT = '''
+    INSERT INTO "ExportArtifact" (id, seq, "userId", data, "createdAt") VALUES (%s, %s, %s, %s, NOW())
+'''
+
+_ARTIFACT_PRUNE = '''
+    DELETE FROM "ExportArtifact" WHERE "createdAt" < NOW() - make_interval(secs => %s)
+'''
+
+_ARTIFACT_CHUNK = '''
+    SELECT data FROM "ExportArtifact"
+    WHERE id = %s AND seq = %s AND "createdAt" >= NOW() - make_interval(secs => %s)
+'''
+
+_AUDIT_INSERT = '''
+    INSERT INTO "AuditLog" (id, action, "userId", "targetType", "targetId", changes, "createdAt")
+    VALUES (gen_random_uuid(), %s, %s, %s, %s, %s, NOW())
+'''
+
+
+class ExportStreamsBusy(Exception):
+    """Raised when EXPORT_MAX_STREAMS exports are already streaming from this worker"""
+    
+    def __init__(self, limit: int):
+        self.limit = limit
+        super().__init__(f"{limit} exports are already streaming")
+
+
+_stream_slots: Optional[asyncio.Semaphore] = None
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def ndjson_line(record: dict) -> bytes:
+    return json.dumps(record, default=_default, separators=(",", ":")).encode() + b"\n"
+
+
+async def fetch_export_user(conn: asyncpg.Connection, user_id: str) -> Optional[Dict]:
+    """The user's account and profile row with roles, or None if there is no such user"""
+    row = await conn.fetchrow(to_asyncpg(_USER_QUERY), user_id)
+    if row is None:
+        return None
+    user = dict(row)
+    user['roles'] = [r['role'] for r in await conn.fetch(to_asyncpg(_ROLES_QUERY), user_id)]
+    user['role'] = user['roles'][0] if user['roles'] else None
+    return user
+
+
+async def iter_user_export(conn: asyncpg.Connection, user: Dict, prefetch: int = EXPORT_PREFETCH,
+                           counts: Optional[Dict[str, int]] = None) -> AsyncIterator[bytes]:
+    """NDJSON chunks: the user record, then each post, comment and vote, then a summary
+    
+    conn must be inside a transaction (cursors need one). At most prefetch
+    rows are held at a time, and the next batch is only fetched once the
+    consumer has taken the previous chunk, so memory stays flat however
+    long the history is and a slow client slows the reads down with it.
+    """
+    counts = {} if counts is None else counts
+    yield ndjson_line({"type": "user", "data": user})
+    for kind, key, query in _SECTIONS:
+        chunk = []
+        counts[key] = 0
+        async for record in conn.cursor(to_asyncpg(query), user['id'], prefetch=prefetch):
+            chunk.append(ndjson_line({"type": kind, "data": dict(record)}))
+            counts[key] += 1
+            if len(chunk) >= prefetch:
+                yield b"".join(chunk)
+                chunk = []
+        if chunk:
+            yield b"".join(chunk)
+    yield ndjson_line({"type": "summary", "counts": counts, "exportedAt": datetime.now()})
+
+
+async def open_user_export(user_id: str, prefetch: int = EXPORT_PREFETCH) -> Optional[AsyncIterator[bytes]]:
+    """Stream of a user's export over its own connection, or None if the user does not exist
+    
+    The connection is opened for this stream rather than taken from the API
+    pool, so slow clients cannot exhaust the pool, and it stays in a
+    read-only repeatable-read snapshot until the stream is exhausted or
+    closed (e.g. the client disconnects). Statements are bounded by the
+    usual statement timeout, and Postgres ends the session if the client
+    stops reading for EXPORT_STREAM_IDLE_TIMEOUT_MS; the stream then stops
+    before its summary record. Raises ExportStreamsBusy when this worker
+    already has EXPORT_MAX_STREAMS streams open.
+    """
+    global _stream_slots
+    from api.database import DATABASE_URL, DB_STATEMENT_TIMEOUT_MS, _prepare_dsn
+    
+    if _stream_slots is None:
+        _stream_slots = asyncio.Semaphore(EXPORT_MAX_STREAMS)
+    slots = _stream_slots
+    if slots.locked():
+        raise ExportStreamsBusy(EXPORT_MAX_STREAMS)
+    await slots.acquire()
+    conn = None
+    try:
+        conn = await asyncpg.connect(_prepare_dsn(DATABASE_URL)[0], statement_cache_size=0)
+        transaction = conn.transaction(isolation='repeatable_read', readonly=True)
+        await transaction.start()
+        await conn.execute(f"SET LOCAL statement_timeout = {DB_STATEMENT_TIMEOUT_MS}")
+        await conn.execute(f"SET LOCAL idle_in_transaction_session_timeout = {EXPORT_STREAM_IDLE_TIMEOUT_MS}")
+        user = await fetch_export_user(conn, user_id)
+    except BaseException:
+        try:
+            if conn is not None:
+                await conn.close()
+        finally:
+            slots.release()
+        raise
+    if user is None:
+        try:
+            await conn.close()
+        finally:
+            slots.release()
+        return None
+    
+    async def stream():
+        try:
+            async for chunk in iter_user_export(conn, user, prefetch):
+                yield chunk
+        finally:
+            try:
+                await conn.close()
+            finally:
+                slots.release()
+    
+    return stream()
+
+
+async def open_export_artifact(artifact_id: str) -> Optional[AsyncIterator[bytes]]:
+    """Chunks of a stored export artifact, or None if it does not exist or has expired
+    
+    Each chunk is its own short query on the pool, so a slow download holds
+    no connection between chunks, and any API worker can serve it.
+    """
+    from api.database import execute_query
+    
+    first = await execute_query(_ARTIFACT_CHUNK, (artifact_id, 0, EXPORT_ARTIFACT_TTL), fetch_one=True)
+    if first is None:
+        return None
+    
+    async def chunks():
+        yield bytes(first['data'])
+        seq = 1
+        while True:
+            row = await execute_query(_ARTIFACT_CHUNK, (artifact_id, seq, EXPORT_ARTIFACT_TTL), fetch_one=True)
+            if row is None:
+                return
+            yield bytes(row['data'])
+            seq += 1
+    
+    return chunks()
+
+
+async def write_user_export(user_id: str, prefetch: int = EXPORT_PREFETCH) -> Dict:
+    """Background job: store a user's export as a gzip NDJSON artifact in "ExportArtifact"
+    
+    The export is compressed into a staging file in EXPORT_DIR while the
+    snapshot is read, then stored in EXPORT_CHUNK_BYTES rows, so the
+    download works from any API worker or host. Uses its own connection
+    rather than the API pool, which belongs to the API's event loop while
+    this runs on the task queue's (or a worker's).
+    """
+    from api.database import DATABASE_URL, _prepare_dsn
+    
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    artifact_id = uuid.uuid4().hex
+    staging = os.path.join(EXPORT_DIR, f"export-{artifact_id}.ndjson.gz.part")
+    counts: Dict[str, int] = {}
+    size = 0
+    chunks = 0
+    start = time.perf_counter()
+    
+    conn = await asyncpg.connect(_prepare_dsn(DATABASE_URL)[0], statement_cache_size=0)
+    try:
+        async with conn.transaction(isolation='repeatable_read', readonly=True):
+            user = await fetch_export_user(conn, user_id)
+            if user is None:
+                raise LookupError(f"User not found: {user_id}")
+            with gzip.open(staging, "wb", compresslevel=6) as out:
+                async for chunk in iter_user_export(conn, user, prefetch, counts):
+                    out.write(chunk)
+                    size += len(chunk)
+        
+        async with conn.transaction():
+            await conn.execute(to_asyncpg(_ARTIFACT_PRUNE), EXPORT_ARTIFACT_TTL)
+            with open(staging, "rb") as artifact:
+                while True:
+                    data = artifact.read(EXPORT_CHUNK_BYTES)
+                    if not data:
+                        break
+                    await conn.execute(to_asyncpg(_ARTIFACT_INSERT), artifact_id, chunks, user_id, data)
+                    chunks += 1
+            await conn.execute(to_asyncpg(_AUDIT_INSERT), "DATA_EXPORT", user_id, "user", user_id,
+                               json.dumps({"action": "full_data_export", "mode": "artifact", **counts}))
+        compressed = os.path.getsize(staging)
+    finally:
+        if os.path.exists(staging):
+            os.remove(staging)
+        await conn.close()
+    
+    logger.info(f"Stored export {artifact_id} for {user_id} ({size} bytes, {chunks} chunks) "
+                f"in {time.perf_counter() - start:.1f}s")
+    return {
+        "artifact_id": artifact_id,
+        "bytes": size,
+        "compressed_bytes": compressed,
+        "chunks": chunks,
+        "counts": counts,
+        "expires_in": EXPORT_ARTIFACT_TTL
+    }
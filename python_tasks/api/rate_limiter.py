@@ -1,18 +1,64 @@
 """
 Rate limiting for Python API
-Token bucket algorithm with in-memory storage
+Token bucket algorithm with in-memory storage, or GCRA in Redis when configured
 Production-ready for 100K+ users
 """
 
+import os
+import re
+import hmac
+import json
+import math
 import time
+import base64
+import hashlib
 import threading
 import logging
-from typing import Dict, Optional
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
 from functools import wraps
 from fastapi import Request, HTTPException
 
 logger = logging.getLogger('python_api.rate_limiter')
 
+RATE_LIMIT_MAX_KEYS = int(os.environ.get('RATE_LIMIT_MAX_KEYS', 100_000))
+RATE_LIMIT_IDLE_TTL = float(os.environ.get('RATE_LIMIT_IDLE_TTL', 300))
+RATE_LIMIT_REDIS_URL = os.environ.get('RATE_LIMIT_REDIS_URL',
+                                      os.environ.get('REDIS_URL', os.environ.get('KV_URL', '')))
+RATE_LIMIT_KEY_PREFIX = "neurokid:ratelimit:"
+# HS256 secret shared with the service that issues API tokens. Without it no
+# bearer token can be verified, and per-identity policies key on the client IP
+API_JWT_SECRET = os.environ.get('API_JWT_SECRET', '')
+
+# GCRA: the key holds the theoretical arrival time (TAT) in ms. Tokens this
+# worker already admitted locally (ARGV[4]) are charged unconditionally, then
+# the request's own cost is admitted if it fits within the burst allowance.
+# Returns {allowed, remaining tokens, retry after ms}.
+_GCRA_SCRIPT = """
+local interval = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2]) * interval
+local cost = tonumber(ARGV[3]) * interval
+local debt = tonumber(ARGV[4]) * interval
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local tat = tonumber(redis.call('GET', KEYS[1])) or now
+if tat < now then tat = now end
+tat = tat + debt
+local allowed = 0
+local retry_after = 0
+if tat + cost - now <= burst then
+    tat = tat + cost
+    allowed = 1
+else
+    retry_after = math.ceil(tat + cost - now - burst)
+end
+if tat > now then
+    redis.call('SET', KEYS[1], tostring(tat), 'PX', math.ceil(tat - now))
+end
+local remaining = math.max(0, math.floor((burst - (tat - now)) / interval))
+return {allowed, remaining, retry_after}
+"""
+
 
 class TokenBucket:
     """Token bucket rate limiter"""
@@ -37,63 +83,380 @@ class TokenBucket:
             return False
 
 
+class RateLimitDecision:
+    """Outcome of one rate limit check, with the values clients see as headers"""
+    
+    __slots__ = ("allowed", "limit", "remaining", "retry_after", "refill_rate")
+    
+    def __init__(self, allowed: bool, limit: int, remaining: float,
+                 retry_after: float, refill_rate: float):
+        self.allowed = allowed
+        self.limit = limit
+        self.remaining = max(0, int(remaining))
+        self.retry_after = retry_after
+        self.refill_rate = refill_rate
+    
+    def headers(self) -> Dict[str, str]:
+        reset = math.ceil((self.limit - self.remaining) / self.refill_rate)
+        headers = {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(self.remaining),
+            "X-RateLimit-Reset": str(reset),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(max(1, math.ceil(self.retry_after)))
+        return headers
+
+
+class _Shard:
+    """One stripe of the bucket store: its own lock, LRU map and counters
+    
+    Buckets are [tokens, last_seen] lists kept in last-touch order, so the
+    least recently used key is always at the front and idle keys form a
+    prefix that can be trimmed without scanning the whole map.
+    """
+    
+    __slots__ = ("lock", "buckets", "hints", "policies", "allowed", "blocked", "evictions",
+                 "expirations", "remote_checks", "prechecked", "fallbacks")
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets: "OrderedDict[str, list]" = OrderedDict()
+        # Redis mode: [pending tokens, last_sync, remaining, deny_until] per key
+        self.hints: "OrderedDict[str, list]" = OrderedDict()
+        # Policy name -> [allowed, blocked]
+        self.policies: Dict[str, list] = {}
+        self.allowed = 0
+        self.blocked = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.remote_checks = 0
+        self.prechecked = 0
+        self.fallbacks = 0
+    
+    def expire_idle(self, cutoff: float, limit: Optional[int] = None,
+                    table: Optional["OrderedDict[str, list]"] = None) -> int:
+        buckets = self.buckets if table is None else table
+        removed = 0
+        while buckets and (limit is None or removed < limit):
+            key, bucket = next(iter(buckets.items()))
+            if bucket[1] > cutoff:
+                break
+            del buckets[key]
+            removed += 1
+        if table is None:
+            self.expirations += removed
+        return removed
+
+
 class RateLimiter:
-    """Rate limiter with per-key buckets"""
+    """Rate limiter with per-key buckets
     
-    def __init__(self, default_capacity: int = 100, default_refill_rate: float = 10):
-        self._buckets: Dict[str, TokenBucket] = {}
-        self._lock = threading.Lock()
+    Keys are spread over a power-of-two number of shards, each with its own
+    lock, so concurrent requests for different clients rarely contend. Every
+    shard is capped at max_keys / shards entries with LRU eviction, and
+    buckets untouched for idle_ttl seconds are dropped by a daemon sweeper.
+    An idle bucket has refilled completely once idle_ttl exceeds
+    capacity / refill_rate, so expiring it does not change any decision.
+    
+    With a redis_url the limit is shared by every worker: each check runs one
+    GCRA script in Redis. To spare the round trip for clients far from their
+    limit, a worker may admit up to local_fraction of the remaining tokens
+    Redis last reported without asking again (for at most sync_interval
+    seconds), charging them on its next call; a key Redis rejected is
+    rejected locally until its retry time. If Redis is unreachable the local
+    buckets take over and Redis is retried after redis_retry_interval.
+    """
+    
+    def __init__(self, default_capacity: int = 100, default_refill_rate: float = 10,
+                 shards: int = 16, max_keys: int = 100_000,
+                 idle_ttl: float = 300, sweep_interval: float = 60,
+                 redis_url: str = "", local_fraction: float = 0.1,
+                 sync_interval: float = 1.0, redis_retry_interval: float = 5.0):
+        if shards < 1 or shards & (shards - 1):
+            raise ValueError("shards must be a power of two")
+        self._shards = [_Shard() for _ in range(shards)]
+        self._mask = shards - 1
+        self._shard_cap = max(1, max_keys // shards)
         self.default_capacity = default_capacity
         self.default_refill_rate = default_refill_rate
-        self._blocked = 0
-        self._allowed = 0
+        self.max_keys = max_keys
+        self.idle_ttl = idle_ttl
+        self.sweep_interval = sweep_interval
+        self._sweeper: Optional[threading.Thread] = None
+        self._sweeper_lock = threading.Lock()
+        self.redis_url = redis_url
+        self.local_fraction = local_fraction
+        self.sync_interval = sync_interval
+        self.redis_retry_interval = redis_retry_interval
+        self._script = None
+        self._async_script = None
+        self._redis_retry_at = 0.0
+        self._redis_healthy = True
+    
+    @property
+    def is_distributed(self) -> bool:
+        return bool(self.redis_url)
     
     def is_allowed(self, key: str, tokens: int = 1, 
                    capacity: Optional[int] = None, 
                    refill_rate: Optional[float] = None) -> bool:
+        return self.check(key, tokens, capacity, refill_rate).allowed
+    
+    async def ais_allowed(self, key: str, tokens: int = 1,
+                          capacity: Optional[int] = None,
+                          refill_rate: Optional[float] = None) -> bool:
+        return (await self.acheck(key, tokens, capacity, refill_rate)).allowed
+    
+    def check(self, key: str, tokens: int = 1,
+              capacity: Optional[int] = None,
+              refill_rate: Optional[float] = None,
+              policy: str = "") -> RateLimitDecision:
+        """Consume tokens for key and return the decision with its header values"""
         capacity = capacity or self.default_capacity
         refill_rate = refill_rate or self.default_refill_rate
+        shard = self._shard(key)
+        now = time.monotonic()
         
-        with self._lock:
-            if key not in self._buckets:
-                self._buckets[key] = TokenBucket(capacity, refill_rate)
+        if self.redis_url:
+            decision, debt = self._precheck(shard, key, tokens, capacity, refill_rate, now, policy)
+            if decision is None:
+                script = self._get_script()
+                if script is not None:
+                    try:
+                        result = script(keys=[RATE_LIMIT_KEY_PREFIX + key],
+                                        args=self._script_args(tokens, capacity, refill_rate, debt))
+                        decision = self._record_remote(shard, key, result, capacity, refill_rate, now, policy)
+                    except Exception as e:
+                        self._redis_failed(e)
+            if decision is not None:
+                return self._log_decision(key, decision)
         
-        bucket = self._buckets[key]
-        allowed = bucket.consume(tokens)
+        return self._log_decision(key, self._consume_local(shard, key, tokens, capacity, refill_rate, now, policy))
+    
+    async def acheck(self, key: str, tokens: int = 1,
+                     capacity: Optional[int] = None,
+                     refill_rate: Optional[float] = None,
+                     policy: str = "") -> RateLimitDecision:
+        """check for async callers; the Redis round trip does not block the event loop"""
+        capacity = capacity or self.default_capacity
+        refill_rate = refill_rate or self.default_refill_rate
+        shard = self._shard(key)
+        now = time.monotonic()
         
-        with self._lock:
-            if allowed:
-                self._allowed += 1
+        if self.redis_url:
+            decision, debt = self._precheck(shard, key, tokens, capacity, refill_rate, now, policy)
+            if decision is None:
+                script = self._get_async_script()
+                if script is not None:
+                    try:
+                        result = await script(keys=[RATE_LIMIT_KEY_PREFIX + key],
+                                              args=self._script_args(tokens, capacity, refill_rate, debt))
+                        decision = self._record_remote(shard, key, result, capacity, refill_rate, now, policy)
+                    except Exception as e:
+                        self._redis_failed(e)
+            if decision is not None:
+                return self._log_decision(key, decision)
+        
+        return self._log_decision(key, self._consume_local(shard, key, tokens, capacity, refill_rate, now, policy))
+    
+    def _shard(self, key: str) -> _Shard:
+        if self._sweeper is None:
+            self._ensure_sweeper()
+        return self._shards[hash(key) & self._mask]
+    
+    def _log_decision(self, key: str, decision: RateLimitDecision) -> RateLimitDecision:
+        if not decision.allowed:
+            logger.warning(f"Rate limit exceeded for key: {key}")
+        return decision
+    
+    def _count(self, shard: _Shard, allowed: bool, policy: str) -> None:
+        """Tally a decision; callers hold shard.lock"""
+        if allowed:
+            shard.allowed += 1
+        else:
+            shard.blocked += 1
+        if policy:
+            counts = shard.policies.get(policy)
+            if counts is None:
+                counts = shard.policies[policy] = [0, 0]
+            counts[0 if allowed else 1] += 1
+    
+    def _consume_local(self, shard: _Shard, key: str, tokens: int, capacity: int,
+                       refill_rate: float, now: float, policy: str) -> RateLimitDecision:
+        with shard.lock:
+            if self.redis_url:
+                shard.fallbacks += 1
+            buckets = shard.buckets
+            bucket = buckets.get(key)
+            if bucket is None:
+                available = capacity
+                if len(buckets) >= self._shard_cap:
+                    # Reclaim idle keys first; only evict live ones when still full
+                    if not shard.expire_idle(now - self.idle_ttl, limit=1):
+                        buckets.popitem(last=False)
+                        shard.evictions += 1
+                bucket = buckets[key] = [available, now]
             else:
-                self._blocked += 1
-                logger.warning(f"Rate limit exceeded for key: {key}")
+                available = min(capacity, bucket[0] + (now - bucket[1]) * refill_rate)
+                buckets.move_to_end(key)
+            
+            allowed = available >= tokens
+            bucket[0] = available - tokens if allowed else available
+            bucket[1] = now
+            self._count(shard, allowed, policy)
+            retry_after = 0.0 if allowed else (tokens - available) / refill_rate
+            return RateLimitDecision(allowed, capacity, bucket[0], retry_after, refill_rate)
+    
+    def _precheck(self, shard: _Shard, key: str, tokens: int, capacity: int,
+                  refill_rate: float, now: float, policy: str):
+        """Decide from the last Redis answer if possible
         
-        return allowed
+        Returns (decision, debt): decision is None when Redis must be asked,
+        and debt is the locally admitted tokens to charge with that call.
+        """
+        with shard.lock:
+            hint = shard.hints.get(key)
+            if hint is None:
+                return None, 0
+            pending, synced_at, remaining, deny_until = hint
+            if now < deny_until:
+                shard.prechecked += 1
+                self._count(shard, False, policy)
+                return RateLimitDecision(False, capacity, 0, deny_until - now, refill_rate), 0
+            if now - synced_at < self.sync_interval and pending + tokens <= remaining * self.local_fraction:
+                hint[0] = pending + tokens
+                shard.prechecked += 1
+                self._count(shard, True, policy)
+                return RateLimitDecision(True, capacity, remaining - hint[0], 0.0, refill_rate), 0
+            hint[0] = 0
+            return None, pending
     
-    def cleanup(self, max_age: float = 3600):
-        """Remove old buckets to free memory"""
-        now = time.time()
-        with self._lock:
-            keys_to_remove = [
-                key for key, bucket in self._buckets.items()
-                if now - bucket.last_refill > max_age
-            ]
-            for key in keys_to_remove:
-                del self._buckets[key]
-        if keys_to_remove:
-            logger.info(f"Cleaned up {len(keys_to_remove)} old rate limit buckets")
+    def _script_args(self, tokens: int, capacity: int, refill_rate: float, debt: int) -> list:
+        return [1000.0 / refill_rate, capacity, tokens, debt]
+    
+    def _record_remote(self, shard: _Shard, key: str, result, capacity: int,
+                       refill_rate: float, now: float, policy: str) -> RateLimitDecision:
+        allowed, remaining, retry_ms = (int(v) for v in result)
+        deny_until = 0.0 if allowed else now + retry_ms / 1000
+        with shard.lock:
+            hints = shard.hints
+            hint = hints.get(key)
+            if hint is None:
+                if len(hints) >= self._shard_cap:
+                    hints.popitem(last=False)
+                hints[key] = [0, now, remaining, deny_until]
+            else:
+                # Keep tokens other threads admitted while this call was in flight
+                hint[1:] = [now, remaining, deny_until]
+                hints.move_to_end(key)
+            shard.remote_checks += 1
+            self._count(shard, bool(allowed), policy)
+        if not self._redis_healthy:
+            self._redis_healthy = True
+            logger.info("Redis rate limiting restored")
+        return RateLimitDecision(bool(allowed), capacity, remaining, retry_ms / 1000, refill_rate)
+    
+    def _get_script(self):
+        if time.monotonic() < self._redis_retry_at:
+            return None
+        if self._script is None:
+            try:
+                import redis
+                client = redis.from_url(self.redis_url, socket_connect_timeout=0.25, socket_timeout=0.25)
+                self._script = client.register_script(_GCRA_SCRIPT)
+            except Exception as e:
+                self._redis_failed(e)
+        return self._script
+    
+    def _get_async_script(self):
+        if time.monotonic() < self._redis_retry_at:
+            return None
+        if self._async_script is None:
+            try:
+                import redis.asyncio as aioredis
+                client = aioredis.from_url(self.redis_url, socket_connect_timeout=0.25, socket_timeout=0.25)
+                self._async_script = client.register_script(_GCRA_SCRIPT)
+            except Exception as e:
+                self._redis_failed(e)
+        return self._async_script
+    
+    def _redis_failed(self, error: Exception) -> None:
+        self._redis_retry_at = time.monotonic() + self.redis_retry_interval
+        if self._redis_healthy:
+            self._redis_healthy = False
+            logger.warning(f"Redis rate limiting unavailable, using local buckets: {error}")
+    
+    def cleanup(self, max_age: Optional[float] = None) -> int:
+        """Remove buckets idle for max_age seconds (default idle_ttl) to free memory"""
+        cutoff = time.monotonic() - (self.idle_ttl if max_age is None else max_age)
+        removed = 0
+        for shard in self._shards:
+            with shard.lock:
+                removed += shard.expire_idle(cutoff)
+                shard.expire_idle(cutoff, table=shard.hints)
+        if removed:
+            logger.info(f"Cleaned up {removed} old rate limit buckets")
+        return removed
+    
+    def _ensure_sweeper(self) -> None:
+        with self._sweeper_lock:
+            if self._sweeper is None and self.sweep_interval:
+                self._sweeper = threading.Thread(target=self._sweep_loop, daemon=True,
+                                                 name="RateLimitSweeper")
+                self._sweeper.start()
+    
+    def _sweep_loop(self) -> None:
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.cleanup()
+            except Exception as e:
+                logger.error(f"Rate limit sweep error: {e}")
     
     def stats(self) -> dict:
-        with self._lock:
-            return {
-                "buckets": len(self._buckets),
-                "allowed": self._allowed,
-                "blocked": self._blocked,
-                "block_rate": f"{(self._blocked / max(1, self._allowed + self._blocked) * 100):.1f}%"
-            }
+        buckets = allowed = blocked = evictions = expirations = 0
+        remote_checks = prechecked = fallbacks = 0
+        policies: Dict[str, dict] = {}
+        for shard in self._shards:
+            with shard.lock:
+                buckets += len(shard.buckets)
+                allowed += shard.allowed
+                blocked += shard.blocked
+                evictions += shard.evictions
+                expirations += shard.expirations
+                remote_checks += shard.remote_checks
+                prechecked += shard.prechecked
+                fallbacks += shard.fallbacks
+                for name, (p_allowed, p_blocked) in shard.policies.items():
+                    counts = policies.setdefault(name, {"allowed": 0, "blocked": 0})
+                    counts["allowed"] += p_allowed
+                    counts["blocked"] += p_blocked
+        stats = {
+            "mode": "redis" if self.redis_url else "local",
+            "buckets": buckets,
+            "max_keys": self.max_keys,
+            "shards": len(self._shards),
+            "allowed": allowed,
+            "blocked": blocked,
+            "evictions": evictions,
+            "expirations": expirations,
+            "block_rate": f"{(blocked / max(1, allowed + blocked) * 100):.1f}%",
+            "policies": policies
+        }
+        if self.redis_url:
+            stats.update({
+                "redis_available": time.monotonic() >= self._redis_retry_at,
+                "redis_checks": remote_checks,
+                "prechecked": prechecked,
+                "fallbacks": fallbacks,
+            })
+        return stats
 
 
-rate_limiter = RateLimiter(default_capacity=100, default_refill_rate=10)
+rate_limiter = RateLimiter(default_capacity=100, default_refill_rate=10,
+                           max_keys=RATE_LIMIT_MAX_KEYS, idle_ttl=RATE_LIMIT_IDLE_TTL,
+                           redis_url=RATE_LIMIT_REDIS_URL)
 
 
 def get_client_ip(request: Request) -> str:
@@ -104,6 +467,141 @@ def get_client_ip(request: Request) -> str:
     return request.client.host if request.client else "unknown"
 
 
+def _b64decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def verified_claims(token: str) -> Optional[dict]:
+    """Claims of an unexpired HS256 JWT signed with API_JWT_SECRET, else None"""
+    if not API_JWT_SECRET:
+        return None
+    try:
+        header, payload, signature = token.split(".")
+        if json.loads(_b64decode(header)).get("alg") != "HS256":
+            return None
+        expected = hmac.new(API_JWT_SECRET.encode(), f"{header}.{payload}".encode(), hashlib.sha256).digest()
+        if not hmac.compare_digest(expected, _b64decode(signature)):
+            return None
+        claims = json.loads(_b64decode(payload))
+        if "exp" in claims and time.time() >= float(claims["exp"]):
+            return None
+    except (ValueError, TypeError, AttributeError):
+        return None
+    return claims if isinstance(claims, dict) else None
+
+
+def verified_subject(token: str) -> Optional[str]:
+    """The sub claim of a verified token, else None"""
+    subject = (verified_claims(token) or {}).get("sub")
+    return str(subject) if subject else None
+
+
+def bearer_claims(request: Request) -> Optional[dict]:
+    """Verified claims of the request's bearer token, if any"""
+    auth = request.headers.get("Authorization", "")
+    scheme, _, token = auth.partition(" ")
+    if scheme.lower() != "bearer" or not token.strip():
+        return None
+    return verified_claims(token.strip())
+
+
+def get_client_identity(request: Request) -> Optional[str]:
+    """Stable key for the authenticated caller, if any
+    
+    Only a verified token's subject counts: a client that could mint a
+    fresh bucket per made-up token would never be limited, so unverified
+    tokens fall back to the client IP.
+    """
+    subject = (bearer_claims(request) or {}).get("sub")
+    return f"user:{subject}" if subject else None
+
+
+class RateLimitPolicy:
+    """A named token bucket shared by the routes mapped to it
+    
+    Each route spends its own cost from the bucket, so one budget covers
+    cheap lookups and expensive reports in proportion to their DB load.
+    Policies with per_identity set key the bucket on the caller's
+    credentials when present instead of the client IP.
+    """
+    
+    def __init__(self, name: str, capacity: int, refill_rate: float, per_identity: bool = False):
+        self.name = name
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.per_identity = per_identity
+    
+    def key(self, request: Request) -> str:
+        identity = get_client_identity(request) if self.per_identity else None
+        return f"{self.name}:{identity or get_client_ip(request)}"
+
+
+RATE_LIMIT_POLICIES: Dict[str, RateLimitPolicy] = {
+    policy.name: policy for policy in [
+        RateLimitPolicy("api", capacity=100, refill_rate=10),
+        RateLimitPolicy("moderation", capacity=60, refill_rate=1, per_identity=True),
+        RateLimitPolicy("export", capacity=10, refill_rate=0.05, per_identity=True),
+        RateLimitPolicy("maintenance", capacity=2, refill_rate=1 / 300, per_identity=True),
+    ]
+}
+
+# (method, route template, policy, cost). Costs track relative query load:
+# single-row lookups and cached snapshots cost 1, paginated lists 2,
+# aggregate reports 5 and full-table rankings 10.
+ROUTE_POLICIES: List[Tuple[str, str, str, int]] = [
+    ("GET", "/api/python/users", "api", 2),
+    ("GET", "/api/python/users/{user_id}", "api", 1),
+    ("GET", "/api/python/users/{user_id}/activity", "api", 2),
+    ("DELETE", "/api/python/users/{user_id}", "moderation", 10),
+    ("POST", "/api/python/users/anonymize", "moderation", 10),
+    ("GET", "/api/python/analytics/dashboard", "api", 1),
+    ("GET", "/api/python/analytics/timeline", "api", 5),
+    ("GET", "/api/python/analytics/top-contributors", "api", 10),
+    ("GET", "/api/python/analytics/engagement", "api", 1),
+    ("GET", "/api/python/analytics/categories", "api", 2),
+    ("GET", "/api/python/analytics/growth", "api", 5),
+    ("GET", "/api/python/posts", "api", 2),
+    ("GET", "/api/python/posts/trending", "api", 2),
+    ("GET", "/api/python/posts/flagged", "api", 5),
+    ("PATCH", "/api/python/posts/{post_id}/status", "moderation", 1),
+    ("PATCH", "/api/python/posts/{post_id}/pin", "moderation", 1),
+    ("PATCH", "/api/python/posts/{post_id}/lock", "moderation", 1),
+    ("GET", "/api/python/governance/audit-logs", "api", 5),
+    ("GET", "/api/python/governance/export/{user_id}", "export", 5),
+    ("POST", "/api/python/governance/export/{user_id}/jobs", "export", 5),
+    ("GET", "/api/python/governance/export/jobs/{task_id}/download", "export", 1),
+    ("GET", "/api/python/governance/retention-stats", "api", 1),
+    ("POST", "/api/python/governance/cleanup/audit-logs", "maintenance", 1),
+    ("POST", "/api/python/governance/cleanup/sessions", "maintenance", 1),
+    ("GET", "/api/python/governance/retention", "api", 1),
+    ("POST", "/api/python/governance/retention/{policy}/run", "maintenance", 1),
+    ("GET", "/api/python/governance/data-catalog", "api", 1),
+    ("GET", "/api/python/tasks/{task_id}", "api", 1),
+]
+
+DEFAULT_ROUTE_POLICY = ("api", 1)
+
+
+def _compile_routes(routes: List[Tuple[str, str, str, int]]) -> Dict[str, list]:
+    by_method: Dict[str, list] = {}
+    for method, template, policy, cost in routes:
+        pattern = re.sub(r"\\\{[^/]+?\\\}", "[^/]+", re.escape(template))
+        by_method.setdefault(method, []).append((re.compile(pattern + "/?$"), policy, cost))
+    return by_method
+
+
+_compiled_routes = _compile_routes(ROUTE_POLICIES)
+
+
+def match_policy(method: str, path: str) -> Tuple[RateLimitPolicy, int]:
+    """Policy and token cost for a request; unlisted routes cost 1 from the api bucket"""
+    for pattern, policy, cost in _compiled_routes.get(method, ()):
+        if pattern.match(path):
+            return RATE_LIMIT_POLICIES[policy], cost
+    name, cost = DEFAULT_ROUTE_POLICY
+    return RATE_LIMIT_POLICIES[name], cost
+
+
 def rate_limit(capacity: int = 60, refill_rate: float = 1, key_func=None):
     """Decorator for rate limiting endpoints"""
     def decorator(func):
@@ -114,13 +612,15 @@ def rate_limit(capacity: int = 60, refill_rate: float = 1, key_func=None):
             else:
                 key = f"{get_client_ip(request)}:{request.url.path}"
             
-            if not rate_limiter.is_allowed(key, capacity=capacity, refill_rate=refill_rate):
+            decision = await rate_limiter.acheck(key, capacity=capacity, refill_rate=refill_rate)
+            if not decision.allowed:
                 raise HTTPException(
                     status_code=429,
                     detail={
                         "error": "Too many requests",
                         "message": "Rate limit exceeded. Please try again later."
-                    }
+                    },
+                    headers=decision.headers()
                 )
             
             return await func(request, *args, **kwargs)
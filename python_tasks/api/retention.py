@@ -0,0 +1,290 @@
+"""
+Data retention engine for Python API
+One policy table for every retention target, purged in small ctid batches with a pause between them
+"""
+
+import os
+import json
+import gzip
+import uuid
+import asyncio
+import logging
+import tempfile
+from dataclasses import dataclass, asdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+import asyncpg
+
+logger = logging.getLogger('python_api.retention')
+
+RETENTION_BATCH_SIZE = int(os.environ.get('RETENTION_BATCH_SIZE', 5000))
+# Seconds between batches, so replicas, vacuum and other writers keep up
+RETENTION_BATCH_PAUSE = float(os.environ.get('RETENTION_BATCH_PAUSE', 0.2))
+RETENTION_LOCK_TIMEOUT_MS = int(os.environ.get('RETENTION_LOCK_TIMEOUT_MS', 2000))
+RETENTION_ARCHIVE_DIR = os.environ.get('RETENTION_ARCHIVE_DIR',
+                                       os.path.join(tempfile.gettempdir(), 'neurokid-retention'))
+# Consecutive batches that may give up on a lock before the run fails
+RETENTION_MAX_LOCK_RETRIES = 5
+
+
+@dataclass(frozen=True)
+class RetentionPolicy:
+    """How long one table's rows are kept, and which timestamp their age is measured from"""
+    name: str
+    table: str
+    description: str
+    column: Optional[str] = None
+    days: Optional[int] = None
+    min_days: int = 1
+    archive: bool = False
+    
+    @property
+    def purgeable(self) -> bool:
+        """Whether rows expire by age (the rest are kept until an explicit request)"""
+        return self.column is not None and self.days is not None
+    
+    @property
+    def job_name(self) -> str:
+        return f"retention:{self.name}"
+    
+    def to_dict(self) -> dict:
+        return {**asdict(self), "purgeable": self.purgeable}
+
+
+RETENTION_POLICIES: Dict[str, RetentionPolicy] = {policy.name: policy for policy in (
+    RetentionPolicy("audit_logs", "AuditLog", "1 year", column="createdAt", days=365, min_days=30,
+                    archive=True),
+    RetentionPolicy("sessions", "UserSession", "30 days after last activity", column="lastActiveAt",
+                    days=30),
+    RetentionPolicy("export_artifacts", "ExportArtifact", "1 day after the export job", column="createdAt",
+                    days=1),
+    RetentionPolicy("deleted_content", "Post", "Anonymized, retained indefinitely"),
+    RetentionPolicy("user_data", "User", "Until deletion request"),
+)}
+
+
+def retention_cutoff(days: int) -> datetime:
+    """Naive UTC timestamp, matching how the timestamp columns are stored"""
+    return datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=days)
+
+
+def delete_batch_sql(policy: RetentionPolicy, cutoff: str, limit: str, returning: bool = False) -> str:
+    """DELETE of at most limit expired rows, located by ctid
+    
+    cutoff and limit are the caller's placeholders (e.g. "$1" or ":cutoff").
+    Each batch is its own short statement, so no long transaction holds back
+    vacuum or piles up WAL, and rows a concurrent update moved are skipped.
+    """
+    sql = f'''
+        DELETE FROM "{policy.table}" WHERE ctid = ANY(ARRAY(
+            SELECT ctid FROM "{policy.table}" WHERE "{policy.column}" < {cutoff} LIMIT {limit}
+        ))
+    '''
+    if returning:
+        sql += f' RETURNING to_jsonb("{policy.table}".*)::text AS row'
+    return sql
+
+
+def get_policy(name: str) -> RetentionPolicy:
+    """The named policy; raises KeyError if unknown and ValueError if it never expires rows"""
+    policy = RETENTION_POLICIES[name]
+    if not policy.purgeable:
+        raise ValueError(f"Retention policy '{name}' does not expire rows by age")
+    return policy
+
+
+def _archive_batch(path: str, rows: List) -> None:
+    """Append rows as one gzip member and fsync, before the batch's delete commits"""
+    with open(path, "ab") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6) as out:
+            out.write(b"".join(row['row'].encode() + b"\n" for row in rows))
+        raw.flush()
+        os.fsync(raw.fileno())
+
+
+async def _save_progress(conn: asyncpg.Connection, run_id: str, status: str, progress: dict,
+                         error: Optional[str] = None) -> None:
+    await conn.execute('''
+        UPDATE "JobExecution"
+        SET status = $2, "recordsProcessed" = $3, metadata = $4::jsonb, "errorLog" = $5,
+            "completedAt" = CASE WHEN $2 = 'RUNNING' THEN NULL ELSE NOW() END
+        WHERE id = $1
+    ''', run_id, status, progress["deleted"], json.dumps(progress, default=str), error)
+
+
+async def _start_run(conn: asyncpg.Connection, policy: RetentionPolicy, days: int,
+                     archive: bool, resume: bool) -> dict:
+    """Progress of the policy's unfinished run when resuming, else a new run's
+    
+    An unfinished run is only resumed with the same retention period; a
+    different one supersedes it with a fresh cutoff.
+    """
+    if resume:
+        last = await conn.fetchrow('''
+            SELECT id, status, metadata::text as metadata FROM "JobExecution"
+            WHERE "jobName" = $1 ORDER BY "startedAt" DESC LIMIT 1
+        ''', policy.job_name)
+        if last and last['status'] != 'SUCCESS' and last['metadata']:
+            progress = json.loads(last['metadata'])
+            if progress.get("days") == days:
+                progress.update(run_id=last['id'], resumed=True)
+                logger.info(f"Resuming retention run {last['id']} for {policy.name} "
+                            f"({progress['deleted']} rows already deleted)")
+                return progress
+            if last['status'] == 'RUNNING':
+                await _save_progress(conn, last['id'], 'FAILED', progress,
+                                     f"Superseded by a run keeping {days} days instead of {progress.get('days')}")
+            logger.info(f"Not resuming retention run {last['id']} for {policy.name}: "
+                        f"it kept {progress.get('days')} days, this run keeps {days}")
+    
+    run_id = uuid.uuid4().hex
+    archive_path = None
+    if archive:
+        os.makedirs(RETENTION_ARCHIVE_DIR, exist_ok=True)
+        archive_path = os.path.join(RETENTION_ARCHIVE_DIR, f"{policy.table}-{run_id}.ndjson.gz")
+    progress = {
+        "policy": policy.name,
+        "run_id": run_id,
+        "days": days,
+        "cutoff": retention_cutoff(days).isoformat(),
+        "deleted": 0,
+        "batches": 0,
+        "archive": archive_path,
+        "complete": False,
+        "resumed": False,
+    }
+    await conn.execute('''
+        INSERT INTO "JobExecution" (id, "jobName", status, source, "startedAt", metadata)
+        VALUES ($1, $2, 'RUNNING', 'PythonAPI', NOW(), $3::jsonb)
+    ''', run_id, policy.job_name, json.dumps(progress))
+    return progress
+
+
+async def _audit_cleanup(conn: asyncpg.Connection, policy: RetentionPolicy, progress: dict) -> None:
+    """Record a finished run in the audit trail, as the system account
+    
+    The purge itself has already committed. If this insert fails the run is
+    saved as FAILED, so the next run resumes it and retries the audit.
+    """
+    from api.audit import SYSTEM_USER_ID
+    
+    await conn.execute('''
+        INSERT INTO "AuditLog" (id, action, "userId", "targetType", "targetId", changes, "createdAt")
+        VALUES (gen_random_uuid(), 'DATA_CLEANUP', $1, $2, $3, $4, NOW())
+    ''', SYSTEM_USER_ID, policy.table, progress["run_id"],
+        json.dumps({"deleted_count": progress["deleted"], "older_than_days": progress["days"],
+                    "policy": policy.name}))
+
+
+async def run_retention(name: str, days: Optional[int] = None, batch_size: int = RETENTION_BATCH_SIZE,
+                        pause: float = RETENTION_BATCH_PAUSE, archive: Optional[bool] = None,
+                        resume: bool = True, max_batches: Optional[int] = None) -> dict:
+    """Background job: delete a policy's expired rows batch by batch
+    
+    Every batch commits on its own and records its progress in
+    "JobExecution", so an interrupted run (or one stopped by max_batches)
+    picks up with the same cutoff next time. With archive, each batch's
+    rows are appended to a gzip NDJSON file and fsynced before the delete
+    commits. Uses its own connection rather than the API pool, which belongs
+    to the API's event loop while this runs on the task queue's.
+    """
+    from api.cache import cache
+    from api.database import DATABASE_URL, _prepare_dsn, _rowcount
+    
+    policy = get_policy(name)
+    days = policy.days if days is None else days
+    if days < policy.min_days:
+        raise ValueError(f"Retention policy '{name}' keeps rows at least {policy.min_days} days")
+    archive = policy.archive if archive is None else archive
+    
+    conn = await asyncpg.connect(_prepare_dsn(DATABASE_URL)[0], statement_cache_size=0)
+    progress = None
+    try:
+        # Released with the connection; a second run would resume the same progress
+        if not await conn.fetchval('SELECT pg_try_advisory_lock(hashtext($1))', policy.job_name):
+            raise RuntimeError(f"Retention policy '{name}' is already running")
+        progress = await _start_run(conn, policy, days, archive, resume)
+        cutoff = datetime.fromisoformat(progress["cutoff"])
+        archive_path = progress["archive"]
+        sql = delete_batch_sql(policy, "$1", "$2", returning=bool(archive_path))
+        batches = 0
+        lock_retries = 0
+        
+        while max_batches is None or batches < max_batches:
+            try:
+                async with conn.transaction():
+                    await conn.execute(f"SET LOCAL lock_timeout = {RETENTION_LOCK_TIMEOUT_MS}")
+                    if archive_path:
+                        rows = await conn.fetch(sql, cutoff, batch_size)
+                        if rows:
+                            await asyncio.to_thread(_archive_batch, archive_path, rows)
+                        deleted = len(rows)
+                    else:
+                        deleted = _rowcount(await conn.execute(sql, cutoff, batch_size))
+            except asyncpg.exceptions.LockNotAvailableError:
+                lock_retries += 1
+                if lock_retries > RETENTION_MAX_LOCK_RETRIES:
+                    raise
+                logger.warning(f"Retention batch for {policy.name} hit lock_timeout, retrying")
+                await asyncio.sleep(pause * 2 ** lock_retries)
+                continue
+            
+            lock_retries = 0
+            batches += 1
+            progress["deleted"] += deleted
+            progress["batches"] += 1
+            progress["complete"] = deleted < batch_size
+            await _save_progress(conn, progress["run_id"], 'SUCCESS' if progress["complete"] else 'RUNNING',
+                                 progress)
+            if progress["complete"]:
+                break
+            await asyncio.sleep(pause)
+        
+        if progress["complete"]:
+            await _audit_cleanup(conn, policy, progress)
+    except Exception as e:
+        if progress is not None and not conn.is_closed():
+            try:
+                await _save_progress(conn, progress["run_id"], 'FAILED', progress, str(e))
+            except Exception:
+                pass
+        logger.error(f"Retention run for {name} failed: {e}")
+        raise
+    finally:
+        await conn.close()
+    
+    cache.invalidate_tags([f"table:{policy.table}"])
+    logger.info(f"Retention {policy.name}: {progress['deleted']} rows deleted in {progress['batches']} "
+                f"batches (complete={progress['complete']})")
+    return progress
+
+
+async def retention_status() -> List[dict]:
+    """Every policy with its most recent run's progress"""
+    from api.database import execute_query
+    
+    rows = await execute_query('''
+        SELECT DISTINCT ON ("jobName") "jobName", status, "recordsProcessed", "startedAt",
+               "completedAt", "errorLog", metadata
+        FROM "JobExecution"
+        WHERE "jobName" = ANY(%s)
+        ORDER BY "jobName", "startedAt" DESC
+    ''', ([policy.job_name for policy in RETENTION_POLICIES.values()],))
+    runs = {row['jobName']: row for row in rows}
+    
+    policies = []
+    for policy in RETENTION_POLICIES.values():
+        run = runs.get(policy.job_name)
+        if run is not None:
+            metadata = run['metadata']
+            run = {
+                "status": run['status'],
+                "deleted": run['recordsProcessed'],
+                "started_at": run['startedAt'],
+                "completed_at": run['completedAt'],
+                "error": run['errorLog'],
+                "progress": json.loads(metadata) if isinstance(metadata, str) else metadata,
+            }
+        policies.append({**policy.to_dict(), "last_run": run})
+    return policies
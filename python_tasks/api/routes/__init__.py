@@ -3,3 +3,4 @@ from .users import router as users_router
 from .analytics import router as analytics_router
 from .posts import router as posts_router
 from .governance import router as governance_router
+from .tasks import router as tasks_router
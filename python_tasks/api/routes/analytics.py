@@ -1,7 +1,7 @@
 """Analytics API routes with caching for performance"""
 
 from fastapi import APIRouter, Query
-from typing import List, Optional
+from typing import List, Literal, Optional
 from pydantic import BaseModel
 from datetime import date
 from api.cache import cached
@@ -23,6 +23,7 @@ class ActivityPoint(BaseModel):
     posts: int
     comments: int
     new_users: int
+    votes: int = 0
 
 
 class ContributorStats(BaseModel):
@@ -43,54 +44,37 @@ class EngagementMetrics(BaseModel):
 
 @router.get("/dashboard", response_model=DashboardStats)
 async def get_dashboard_stats():
-    """Get main dashboard statistics (cached for 60 seconds)"""
+    """Get main dashboard statistics (served from the shared counter snapshot)"""
     from api.database import AnalyticsRepository
-    return _get_cached_dashboard_stats()
-
-@cached(ttl=60, key_prefix="analytics")
-def _get_cached_dashboard_stats():
-    from api.database import AnalyticsRepository
-    return AnalyticsRepository.get_dashboard_stats()
+    return await AnalyticsRepository.get_dashboard_stats()
 
 
 @router.get("/timeline", response_model=List[ActivityPoint])
 async def get_activity_timeline(days: int = Query(30, ge=1, le=90)):
-    """Get activity timeline for the last N days"""
+    """Get activity timeline for the last N days (pre-aggregated, plus a live count for today)"""
     from api.database import AnalyticsRepository
-    return AnalyticsRepository.get_activity_timeline(days=days)
+    return await AnalyticsRepository.get_activity_timeline(days=days)
 
 
 @router.get("/top-contributors", response_model=List[ContributorStats])
-async def get_top_contributors(limit: int = Query(10, ge=1, le=50)):
-    """Get top contributors by activity"""
+async def get_top_contributors(limit: int = Query(10, ge=1, le=50),
+                               window: Literal["7d", "30d", "all"] = "all"):
+    """Get top contributors by activity over the last 7 days, 30 days or all time"""
     from api.database import AnalyticsRepository
-    return AnalyticsRepository.get_top_contributors(limit=limit)
+    return await AnalyticsRepository.get_top_contributors(limit=limit, window=window)
 
 
 @router.get("/engagement")
 async def get_engagement_metrics():
     """Get engagement metrics"""
-    from api.database import execute_query
-    
-    stats = {}
-    
-    result = execute_query('SELECT COUNT(*) as count FROM "User"', fetch_one=True)
-    total_users = result['count'] if result else 1
-    
-    result = execute_query('SELECT COUNT(*) as count FROM "Post"', fetch_one=True)
-    total_posts = result['count'] if result else 0
-    
-    result = execute_query('SELECT COUNT(*) as count FROM "Comment"', fetch_one=True)
-    total_comments = result['count'] if result else 0
-    
-    result = execute_query('SELECT AVG("voteScore") as avg FROM "Post"', fetch_one=True)
-    avg_vote = result['avg'] if result and result['avg'] else 0
+    from api.database import AnalyticsRepository
     
-    result = execute_query('''
-        SELECT COUNT(*) as count FROM "User" 
-        WHERE "lastLoginAt" > NOW() - INTERVAL '30 days'
-    ''', fetch_one=True)
-    active_users = result['count'] if result else 0
+    counters = await AnalyticsRepository.get_counter_snapshot()
+    total_users = counters.get('total_users', 0)
+    total_posts = counters.get('total_posts', 0)
+    total_comments = counters.get('total_comments', 0)
+    avg_vote = counters.get('avg_vote_score') or 0
+    active_users = counters.get('active_users_30d', 0)
     
     return {
         "posts_per_user": round(total_posts / max(total_users, 1), 2),
@@ -103,6 +87,9 @@ async def get_engagement_metrics():
 
 
 @router.get("/categories")
+# Next.js writes do not publish invalidations for the Post, Category and User
+# tags yet, so here and in /growth the TTL alone still bounds staleness
+@cached(ttl=300, key_prefix="analytics", stale_ttl=300, tags=["table:Post", "table:Category"])
 async def get_category_stats():
     """Get statistics by category"""
     from api.database import execute_query
@@ -116,33 +103,18 @@ async def get_category_stats():
         GROUP BY c.id, c.name, c.slug
         ORDER BY "postCount" DESC
     '''
-    return execute_query(query)
+    return await execute_query(query)
 
 
 @router.get("/growth")
+@cached(ttl=600, key_prefix="analytics", stale_ttl=600, tags=["table:User", "table:Post"])
 async def get_growth_metrics():
-    """Get user and content growth metrics"""
-    from api.database import execute_query
-    
-    users_by_month = execute_query('''
-        SELECT DATE_TRUNC('month', "createdAt") as month,
-               COUNT(*) as count
-        FROM "User"
-        WHERE "createdAt" > NOW() - INTERVAL '12 months'
-        GROUP BY DATE_TRUNC('month', "createdAt")
-        ORDER BY month DESC
-    ''')
+    """Get user and content growth metrics for the last 12 months"""
+    from api.database import AnalyticsRepository
     
-    posts_by_month = execute_query('''
-        SELECT DATE_TRUNC('month', "createdAt") as month,
-               COUNT(*) as count
-        FROM "Post"
-        WHERE "createdAt" > NOW() - INTERVAL '12 months'
-        GROUP BY DATE_TRUNC('month', "createdAt")
-        ORDER BY month DESC
-    ''')
+    months = await AnalyticsRepository.get_monthly_growth(months=12)
     
     return {
-        "users_by_month": users_by_month,
-        "posts_by_month": posts_by_month
+        "users_by_month": [{"month": row["month"], "count": row["new_users"]} for row in months],
+        "posts_by_month": [{"month": row["month"], "count": row["posts"]} for row in months]
     }
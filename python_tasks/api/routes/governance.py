@@ -1,7 +1,8 @@
 """Data governance API routes"""
 
 from fastapi import APIRouter, Query, HTTPException
-from typing import Optional, List
+from fastapi.responses import StreamingResponse
+from typing import Optional, List, Literal
 from pydantic import BaseModel, ConfigDict
 from datetime import datetime
 import json
@@ -26,6 +27,7 @@ class AuditLogListResponse(BaseModel):
     logs: List[AuditLogResponse]
     page: int
     limit: int
+    next_cursor: Optional[str] = None
 
 
 class DataExportResponse(BaseModel):
@@ -36,6 +38,19 @@ class DataExportResponse(BaseModel):
     exportedAt: datetime
 
 
+class ExportJobResponse(BaseModel):
+    task_id: str
+    status_url: str
+    download_url: str
+
+
+class RetentionRunResponse(BaseModel):
+    success: bool = True
+    policy: str
+    task_id: str
+    status_url: str
+
+
 class RetentionStats(BaseModel):
     total_users: int
     inactive_30d: int
@@ -49,13 +64,21 @@ async def get_audit_logs(
     page: int = Query(1, ge=1),
     limit: int = Query(50, ge=1, le=200),
     action: Optional[str] = None,
-    user_id: Optional[str] = None
+    user_id: Optional[str] = None,
+    after: Optional[str] = Query(None, description="next_cursor from the previous page")
 ):
-    """Get audit logs with filtering"""
-    from api.database import AuditRepository
+    """Get audit logs with filtering (keyset via after, or offset via page)"""
+    from api.database import AuditRepository, decode_cursor, keyset_page
+    
+    try:
+        cursor = decode_cursor(after) if after else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     
-    offset = (page - 1) * limit
-    logs = AuditRepository.get_logs(limit=limit, offset=offset, action=action, user_id=user_id)
+    offset = 0 if cursor else (page - 1) * limit
+    rows = await AuditRepository.get_logs(limit=limit + 1, offset=offset, action=action,
+                                          user_id=user_id, after=cursor)
+    logs, next_cursor = keyset_page(rows, limit)
     
     for log in logs:
         if log.get('details') and isinstance(log['details'], str):
@@ -67,19 +90,48 @@ async def get_audit_logs(
     return {
         "logs": logs,
         "page": page,
-        "limit": limit
+        "limit": limit,
+        "next_cursor": next_cursor
     }
 
 
 @router.get("/export/{user_id}", response_model=DataExportResponse)
-async def export_user_data(user_id: str):
-    """Export all data for a specific user (GDPR compliance)"""
-    from api.database import execute_query, AuditRepository
+async def export_user_data(
+    user_id: str,
+    format: Literal["json", "ndjson"] = Query("json", description="ndjson streams the export")
+):
+    """Export all data for a specific user (GDPR compliance)
+    
+    format=ndjson streams one JSON record per line from server-side cursors
+    (user, then posts, comments and votes, then a summary), so memory stays
+    flat for users with long histories.
+    """
+    from api.database import execute_query, AuditRepository, UserRepository
     
-    user = execute_query('''
+    if format == "ndjson":
+        from api.exports import open_user_export, ExportStreamsBusy
+        
+        try:
+            stream = await open_user_export(user_id)
+        except ExportStreamsBusy:
+            raise HTTPException(status_code=503, headers={"Retry-After": "30"},
+                                detail="Too many exports are streaming, try again later or queue an export job")
+        if stream is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        await AuditRepository.create_log(
+            action="DATA_EXPORT",
+            user_id=user_id,
+            resource="user",
+            resource_id=user_id,
+            details={"action": "full_data_export", "mode": "stream"}
+        )
+        return StreamingResponse(stream, media_type="application/x-ndjson", headers={
+            "Content-Disposition": f'attachment; filename="export-{user_id}.ndjson"'
+        })
+    
+    user = await execute_query('''
         SELECT u.id, u.email, u."createdAt", u."lastLoginAt",
-               p.username, p."displayName", p.bio, p.location,
-               (SELECT r.role FROM "UserRole" r WHERE r."userId" = u.id LIMIT 1) as role
+               p.username, p."displayName", p.bio, p.location
         FROM "User" u
         LEFT JOIN "Profile" p ON u.id = p."userId"
         WHERE u.id = %s
@@ -87,25 +139,26 @@ async def export_user_data(user_id: str):
     
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    await UserRepository.attach_roles([user])
     
-    posts = execute_query('''
+    posts = await execute_query('''
         SELECT id, title, content, "createdAt", "updatedAt", status
         FROM "Post" WHERE "authorId" = %s
     ''', (user_id,))
     
-    comments = execute_query('''
+    comments = await execute_query('''
         SELECT c.id, c.content, c."createdAt", p.title as "postTitle"
         FROM "Comment" c
         JOIN "Post" p ON c."postId" = p.id
         WHERE c."authorId" = %s
     ''', (user_id,))
     
-    votes = execute_query('''
+    votes = await execute_query('''
         SELECT "targetType", "targetId", value, "createdAt"
         FROM "Vote" WHERE "userId" = %s
     ''', (user_id,))
     
-    AuditRepository.create_log(
+    await AuditRepository.create_log(
         action="DATA_EXPORT",
         user_id=user_id,
         resource="user",
@@ -122,70 +175,128 @@ async def export_user_data(user_id: str):
     }
 
 
+@router.post("/export/{user_id}/jobs", response_model=ExportJobResponse, status_code=202)
+async def create_export_job(user_id: str):
+    """Write a user's export to a downloadable gzip NDJSON artifact in the background"""
+    from api.database import execute_query
+    from api.exports import write_user_export
+    from api.task_queue import enqueue_task, TaskQueueFull
+    
+    user = await execute_query('SELECT id FROM "User" WHERE id = %s', (user_id,), fetch_one=True)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    try:
+        task_id = enqueue_task(write_user_export, user_id, lane="async", group="gdpr-export",
+                               max_retries=1)
+    except TaskQueueFull:
+        raise HTTPException(status_code=503, detail="Export queue is full, try again later")
+    
+    return {
+        "task_id": task_id,
+        "status_url": f"/api/python/tasks/{task_id}",
+        "download_url": f"/api/python/governance/export/jobs/{task_id}/download"
+    }
+
+
+@router.get("/export/jobs/{task_id}/download")
+async def download_export(task_id: str):
+    """Download the artifact stored by an export job"""
+    from api.exports import open_export_artifact
+    from api.task_queue import task_queue
+    
+    status = task_queue.get_status(task_id)
+    if not status:
+        raise HTTPException(status_code=404, detail="Export job not found or expired")
+    if status["status"] != "completed":
+        raise HTTPException(status_code=409, detail=f"Export job is {status['status']}")
+    
+    result = status.get("result") or {}
+    chunks = await open_export_artifact(result["artifact_id"]) if result.get("artifact_id") else None
+    if chunks is None:
+        raise HTTPException(status_code=410, detail="Export artifact has expired")
+    return StreamingResponse(chunks, media_type="application/gzip", headers={
+        "Content-Disposition": f'attachment; filename="export-{result["artifact_id"]}.ndjson.gz"',
+        "Content-Length": str(result["compressed_bytes"]),
+    })
+
+
 @router.get("/retention-stats", response_model=RetentionStats)
 async def get_retention_stats():
     """Get data retention statistics"""
-    from api.database import execute_query
+    from api.database import AnalyticsRepository
     
-    total = execute_query('SELECT COUNT(*) as count FROM "User"', fetch_one=True)
-    inactive_30 = execute_query('''
-        SELECT COUNT(*) as count FROM "User" 
-        WHERE "lastLoginAt" < NOW() - INTERVAL '30 days'
-    ''', fetch_one=True)
-    inactive_90 = execute_query('''
-        SELECT COUNT(*) as count FROM "User" 
-        WHERE "lastLoginAt" < NOW() - INTERVAL '90 days'
-    ''', fetch_one=True)
-    deleted = execute_query('''
-        SELECT COUNT(*) as count FROM "Post" WHERE status = 'REMOVED'
-    ''', fetch_one=True)
-    old_logs = execute_query('''
-        SELECT COUNT(*) as count FROM "AuditLog" 
-        WHERE "createdAt" < NOW() - INTERVAL '90 days'
-    ''', fetch_one=True)
+    counters = await AnalyticsRepository.get_counter_snapshot()
     
     return {
-        "total_users": total['count'] if total else 0,
-        "inactive_30d": inactive_30['count'] if inactive_30 else 0,
-        "inactive_90d": inactive_90['count'] if inactive_90 else 0,
-        "deleted_posts": deleted['count'] if deleted else 0,
-        "old_audit_logs": old_logs['count'] if old_logs else 0
+        "total_users": counters.get('total_users', 0),
+        "inactive_30d": counters.get('inactive_30d', 0),
+        "inactive_90d": counters.get('inactive_90d', 0),
+        "deleted_posts": counters.get('deleted_posts', 0),
+        "old_audit_logs": counters.get('old_audit_logs', 0)
     }
 
 
-@router.post("/cleanup/audit-logs")
-async def cleanup_audit_logs(days: int = Query(365, ge=30)):
-    """Clean up old audit logs"""
-    from api.database import execute_write, AuditRepository
+async def queue_retention(policy: str, days: Optional[int] = None, archive: Optional[bool] = None,
+                          batch_size: Optional[int] = None) -> dict:
+    """Queue a batched purge of a retention policy's expired rows"""
+    from api.retention import get_policy, run_retention, RETENTION_BATCH_SIZE
+    from api.task_queue import enqueue_task, TaskQueueFull
     
-    deleted = execute_write('''
-        DELETE FROM "AuditLog" WHERE "createdAt" < NOW() - INTERVAL '%s days'
-    ''', (days,))
+    try:
+        target = get_policy(policy)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown retention policy '{policy}'")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if days is not None and days < target.min_days:
+        raise HTTPException(status_code=422, detail=f"{policy} keeps rows at least {target.min_days} days")
     
-    AuditRepository.create_log(
-        action="DATA_CLEANUP",
-        resource="audit_log",
-        details={"deleted_count": deleted, "older_than_days": days}
-    )
+    try:
+        task_id = enqueue_task(run_retention, policy, days=days, archive=archive,
+                               batch_size=batch_size or RETENTION_BATCH_SIZE,
+                               lane="async", group="retention", max_retries=0)
+    except TaskQueueFull:
+        raise HTTPException(status_code=503, detail="Task queue is full, try again later")
     
-    return {"success": True, "deleted_count": deleted}
+    return {"success": True, "policy": policy, "task_id": task_id, "status_url": f"/api/python/tasks/{task_id}"}
 
 
-@router.post("/cleanup/sessions")
-async def cleanup_expired_sessions():
-    """Clean up expired sessions"""
-    from api.database import execute_write
+@router.get("/retention")
+async def get_retention_policies():
+    """Retention policies with the progress of each one's latest run"""
+    from api.retention import retention_status
     
-    deleted = execute_write('''
-        DELETE FROM "Session" WHERE "expires" < NOW()
-    ''')
-    
-    return {"success": True, "deleted_count": deleted}
+    return {"policies": await retention_status()}
+
+
+@router.post("/retention/{policy}/run", response_model=RetentionRunResponse, status_code=202)
+async def run_retention_policy(
+    policy: str,
+    days: Optional[int] = Query(None, ge=1, description="Override the policy's retention period"),
+    archive: Optional[bool] = Query(None, description="Archive rows to gzip NDJSON before deleting"),
+    batch_size: Optional[int] = Query(None, ge=100, le=50000)
+):
+    """Purge a policy's expired rows in the background, in batches (resumes an unfinished run)"""
+    return await queue_retention(policy, days=days, archive=archive, batch_size=batch_size)
+
+
+@router.post("/cleanup/audit-logs", response_model=RetentionRunResponse, status_code=202)
+async def cleanup_audit_logs(days: int = Query(365, ge=30)):
+    """Clean up old audit logs (queued on the audit_logs retention policy)"""
+    return await queue_retention("audit_logs", days=days)
+
+
+@router.post("/cleanup/sessions", response_model=RetentionRunResponse, status_code=202)
+async def cleanup_expired_sessions():
+    """Clean up expired sessions (queued on the sessions retention policy)"""
+    return await queue_retention("sessions")
 
 
 @router.get("/data-catalog")
 async def get_data_catalog():
     """Get data catalog - list of all tables and their purposes"""
+    from api.retention import RETENTION_POLICIES
+    
     return {
         "tables": [
             {"name": "User", "purpose": "User accounts and authentication", "pii": True},
@@ -198,13 +309,10 @@ async def get_data_catalog():
             {"name": "Provider", "purpose": "Healthcare providers directory", "pii": False},
             {"name": "Resource", "purpose": "Educational resources", "pii": False},
             {"name": "AuditLog", "purpose": "Security and activity audit trail", "pii": True},
-            {"name": "Session", "purpose": "User sessions", "pii": True},
+            {"name": "UserSession", "purpose": "User sessions", "pii": True},
             {"name": "DirectMessage", "purpose": "Private messages between users", "pii": True},
         ],
         "retention_policies": {
-            "audit_logs": "1 year",
-            "sessions": "30 days after expiry",
-            "deleted_content": "Anonymized, retained indefinitely",
-            "user_data": "Until deletion request"
+            name: policy.description for name, policy in RETENTION_POLICIES.items()
         }
     }
@@ -1,9 +1,11 @@
 """Posts management API routes"""
 
+import asyncio
 from fastapi import APIRouter, Query, HTTPException
 from typing import Optional, List
 from pydantic import BaseModel, ConfigDict
 from datetime import datetime
+from api.cache import invalidates
 
 router = APIRouter(prefix="/posts", tags=["posts"])
 
@@ -26,51 +28,48 @@ class PostListResponse(BaseModel):
     total: int
     page: int
     limit: int
+    next_cursor: Optional[str] = None
+    total_is_estimate: bool = False
 
 
 @router.get("", response_model=PostListResponse)
 async def list_posts(
     page: int = Query(1, ge=1),
     limit: int = Query(20, ge=1, le=100),
-    category_id: Optional[str] = None
+    category_id: Optional[str] = None,
+    after: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    exact_total: bool = False
 ):
-    """List all posts with pagination"""
-    from api.database import PostRepository
-    
-    offset = (page - 1) * limit
-    posts = PostRepository.get_all(limit=limit, offset=offset, category_id=category_id)
-    total = PostRepository.get_count(category_id=category_id)
+    """List all posts with pagination (keyset via after, or offset via page)"""
+    from api.database import PostRepository, decode_cursor, keyset_page
+    
+    try:
+        cursor = decode_cursor(after) if after else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    offset = 0 if cursor else (page - 1) * limit
+    rows, total = await asyncio.gather(
+        PostRepository.get_all(limit=limit + 1, offset=offset, category_id=category_id, after=cursor),
+        PostRepository.get_count(category_id=category_id, exact=exact_total)
+    )
+    posts, next_cursor = keyset_page(rows, limit)
     
     return {
         "posts": posts,
         "total": total,
         "page": page,
-        "limit": limit
+        "limit": limit,
+        "next_cursor": next_cursor,
+        "total_is_estimate": not exact_total
     }
 
 
 @router.get("/trending")
-async def get_trending_posts(limit: int = Query(10, ge=1, le=50)):
-    """Get trending posts by recent vote activity"""
-    from api.database import execute_query
-    
-    query = '''
-        SELECT p.id, p.title, p."createdAt", p."voteScore", p.status,
-               c.name as "categoryName", pr.username as "authorUsername",
-               COUNT(v.id) as "recentVotes"
-        FROM "Post" p
-        LEFT JOIN "Category" c ON p."categoryId" = c.id
-        LEFT JOIN "User" u ON p."authorId" = u.id
-        LEFT JOIN "Profile" pr ON u.id = pr."userId"
-        LEFT JOIN "Vote" v ON p.id = v."targetId" AND v."targetType" = 'POST'
-            AND v."createdAt" > NOW() - INTERVAL '24 hours'
-        WHERE p.status = 'ACTIVE'
-        GROUP BY p.id, p.title, p."createdAt", p."voteScore", p.status,
-                 c.name, pr.username
-        ORDER BY "recentVotes" DESC, p."voteScore" DESC
-        LIMIT %s
-    '''
-    return execute_query(query, (limit,))
+async def get_trending_posts(limit: int = Query(10, ge=1, le=50), category_id: Optional[str] = None):
+    """Get trending posts by decayed recent vote velocity, optionally within one category"""
+    from api.trending import trending_engine
+    return await trending_engine.top(limit=limit, category_id=category_id)
 
 
 @router.get("/flagged")
@@ -93,10 +92,11 @@ async def get_flagged_posts(limit: int = Query(20, ge=1, le=100)):
         ORDER BY "reportCount" DESC
         LIMIT %s
     '''
-    return execute_query(query, (limit,))
+    return await execute_query(query, (limit,))
 
 
 @router.patch("/{post_id}/status")
+@invalidates("table:Post", "post:{post_id}")
 async def update_post_status(post_id: str, status: str):
     """Update post status (moderate)"""
     from api.database import execute_write, AuditRepository
@@ -105,12 +105,12 @@ async def update_post_status(post_id: str, status: str):
     if status not in valid_statuses:
         raise HTTPException(status_code=400, detail=f"Invalid status. Must be one of: {valid_statuses}")
     
-    rows = execute_write('UPDATE "Post" SET status = %s WHERE id = %s', (status, post_id))
+    rows = await execute_write('UPDATE "Post" SET status = %s WHERE id = %s', (status, post_id))
     
     if rows == 0:
         raise HTTPException(status_code=404, detail="Post not found")
     
-    AuditRepository.create_log(
+    await AuditRepository.create_log(
         action="CONTENT_MODERATION",
         resource="post",
         resource_id=post_id,
@@ -121,11 +121,12 @@ async def update_post_status(post_id: str, status: str):
 
 
 @router.patch("/{post_id}/pin")
+@invalidates("table:Post", "post:{post_id}")
 async def toggle_pin_post(post_id: str, pinned: bool):
     """Pin or unpin a post"""
     from api.database import execute_write
     
-    rows = execute_write('UPDATE "Post" SET "isPinned" = %s WHERE id = %s', (pinned, post_id))
+    rows = await execute_write('UPDATE "Post" SET "isPinned" = %s WHERE id = %s', (pinned, post_id))
     
     if rows == 0:
         raise HTTPException(status_code=404, detail="Post not found")
@@ -134,11 +135,12 @@ async def toggle_pin_post(post_id: str, pinned: bool):
 
 
 @router.patch("/{post_id}/lock")
+@invalidates("table:Post", "post:{post_id}")
 async def toggle_lock_post(post_id: str, locked: bool):
     """Lock or unlock a post"""
     from api.database import execute_write
     
-    rows = execute_write('UPDATE "Post" SET "isLocked" = %s WHERE id = %s', (locked, post_id))
+    rows = await execute_write('UPDATE "Post" SET "isLocked" = %s WHERE id = %s', (locked, post_id))
     
     if rows == 0:
         raise HTTPException(status_code=404, detail="Post not found")
@@ -0,0 +1,35 @@
+"""Background task status API routes"""
+
+from fastapi import APIRouter, HTTPException
+from typing import Optional, Any
+from pydantic import BaseModel
+
+router = APIRouter(prefix="/tasks", tags=["tasks"])
+
+
+class TaskStatusResponse(BaseModel):
+    id: str
+    name: Optional[str] = None
+    status: str
+    priority: int
+    lane: Optional[str] = None
+    group: Optional[str] = None
+    deadline: Optional[str] = None
+    attempts: int
+    max_retries: int
+    created_at: Optional[str] = None
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    result: Optional[Any] = None
+    error: Optional[str] = None
+
+
+@router.get("/{task_id}", response_model=TaskStatusResponse)
+async def get_task_status(task_id: str):
+    """Get the status and result of a background task"""
+    from api.task_queue import task_queue
+    
+    status = task_queue.get_status(task_id)
+    if not status:
+        raise HTTPException(status_code=404, detail="Task not found or result expired")
+    return status
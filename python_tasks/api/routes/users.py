@@ -1,9 +1,11 @@
 """User management API routes"""
 
+import asyncio
 from fastapi import APIRouter, Query, HTTPException
 from typing import Optional, List
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
 from datetime import datetime
+from api.cache import cache, invalidates
 
 router = APIRouter(prefix="/users", tags=["users"])
 
@@ -16,6 +18,7 @@ class UserResponse(BaseModel):
     createdAt: datetime
     lastLoginAt: Optional[datetime] = None
     role: Optional[str] = None
+    roles: List[str] = []
     username: Optional[str] = None
     displayName: Optional[str] = None
     avatarUrl: Optional[str] = None
@@ -26,11 +29,26 @@ class UserDetailResponse(UserResponse):
     location: Optional[str] = None
 
 
+class AnonymizeRequest(BaseModel):
+    user_ids: List[str] = Field(..., min_length=1, max_length=5000)
+    reason: Optional[str] = None
+
+
+class AnonymizeResponse(BaseModel):
+    success: bool = True
+    anonymized: List[str]
+    not_found: List[str]
+    posts: int
+    comments: int
+
+
 class UserListResponse(BaseModel):
     users: List[UserResponse]
     total: int
     page: int
     limit: int
+    next_cursor: Optional[str] = None
+    total_is_estimate: bool = False
 
 
 class UserActivityResponse(BaseModel):
@@ -42,20 +60,43 @@ class UserActivityResponse(BaseModel):
 async def list_users(
     page: int = Query(1, ge=1),
     limit: int = Query(20, ge=1, le=100),
-    search: Optional[str] = None
+    search: Optional[str] = None,
+    after: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    exact_total: bool = False
 ):
-    """List all users with pagination"""
-    from api.database import UserRepository
+    """List all users with pagination
     
-    offset = (page - 1) * limit
-    users = UserRepository.get_all(limit=limit, offset=offset, search=search)
-    total = UserRepository.get_count(search=search)
+    Pass after=<next_cursor> to page by keyset, which costs the same at any
+    depth; page is kept for offset paging. total is an estimate unless
+    exact_total is set. search matches email or username as a substring, or
+    as a prefix for terms under three characters.
+    """
+    from api.database import UserRepository, decode_cursor, keyset_page
+    
+    try:
+        cursor = decode_cursor(after) if after else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    offset = 0 if cursor else (page - 1) * limit
+    if search:
+        rows, total, total_is_estimate = await UserRepository.search(
+            search, limit=limit + 1, offset=offset, after=cursor, exact=exact_total)
+    else:
+        rows, total = await asyncio.gather(
+            UserRepository.get_all(limit=limit + 1, offset=offset, after=cursor),
+            UserRepository.get_count(exact=exact_total)
+        )
+        total_is_estimate = not exact_total
+    users, next_cursor = keyset_page(rows, limit)
     
     return {
         "users": users,
         "total": total,
         "page": page,
-        "limit": limit
+        "limit": limit,
+        "next_cursor": next_cursor,
+        "total_is_estimate": total_is_estimate
     }
 
 
@@ -64,7 +105,7 @@ async def get_user(user_id: str):
     """Get user details by ID"""
     from api.database import UserRepository
     
-    user = UserRepository.get_by_id(user_id)
+    user = await UserRepository.get_by_id(user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
@@ -75,12 +116,12 @@ async def get_user_activity(user_id: str, limit: int = Query(20, ge=1, le=50)):
     """Get user's posts and comments"""
     from api.database import UserRepository
     
-    user = UserRepository.get_by_id(user_id)
+    user = await UserRepository.get_by_id(user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    posts = UserRepository.get_user_posts(user_id, limit=limit)
-    comments = UserRepository.get_user_comments(user_id, limit=limit)
+    posts = await UserRepository.get_user_posts(user_id, limit=limit)
+    comments = await UserRepository.get_user_comments(user_id, limit=limit)
     
     return {
         "posts": posts,
@@ -88,36 +129,49 @@ async def get_user_activity(user_id: str, limit: int = Query(20, ge=1, le=50)):
     }
 
 
+@router.post("/anonymize", response_model=AnonymizeResponse)
+@invalidates("table:User", "table:Post", "table:Comment")
+async def anonymize_users(request: AnonymizeRequest):
+    """Anonymize many users at once (e.g. inactive accounts found by a retention job)"""
+    from api.database import UserRepository
+    
+    details = {"reason": request.reason, "batch": True} if request.reason else {"batch": True}
+    result = await UserRepository.anonymize(request.user_ids, details)
+    await cache.ainvalidate_tags([f"user:{user_id}" for user_id in result["users"]])
+    
+    anonymized = set(result["users"])
+    return {
+        "success": True,
+        "anonymized": result["users"],
+        "not_found": [user_id for user_id in dict.fromkeys(request.user_ids) if user_id not in anonymized],
+        "posts": result["posts"],
+        "comments": result["comments"]
+    }
+
+
 @router.delete("/{user_id}")
+@invalidates("table:User", "table:Post", "table:Comment", "user:{user_id}")
 async def delete_user(user_id: str, anonymize: bool = Query(True)):
     """Delete or anonymize a user"""
     from api.database import UserRepository, execute_write, AuditRepository
     
-    user = UserRepository.get_by_id(user_id)
+    if anonymize:
+        result = await UserRepository.anonymize([user_id])
+        if not result["users"]:
+            raise HTTPException(status_code=404, detail="User not found")
+        return {"success": True, "action": "user_anonymized"}
+    
+    user = await UserRepository.get_by_id(user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    if anonymize:
-        execute_write('''
-            UPDATE "Post" SET "isAnonymous" = true WHERE "authorId" = %s
-        ''', (user_id,))
-        execute_write('''
-            UPDATE "Comment" SET "isAnonymous" = true WHERE "authorId" = %s
-        ''', (user_id,))
-        execute_write('''
-            UPDATE "User" SET email = %s, "hashedPassword" = NULL WHERE id = %s
-        ''', (f'deleted_{user_id}@deleted.neurokid.help', user_id))
-        action = "user_anonymized"
-    else:
-        execute_write('DELETE FROM "User" WHERE id = %s', (user_id,))
-        action = "user_deleted"
-    
-    AuditRepository.create_log(
+    await execute_write('DELETE FROM "User" WHERE id = %s', (user_id,))
+    await AuditRepository.create_log(
         action="ACCOUNT_DELETED",
         user_id=user_id,
         resource="user",
         resource_id=user_id,
-        details={"action": action}
+        details={"action": "user_deleted"}
     )
     
-    return {"success": True, "action": action}
+    return {"success": True, "action": "user_deleted"}
@@ -1,43 +1,143 @@
 """
 Background task queue for Python API
-Simple in-process queue with Redis support when available
+Durable Redis-backed queue when available, in-process queue otherwise
 Production-ready for 100K+ users
 """
 
 import os
 import time
 import json
+import uuid
+import heapq
+import itertools
 import threading
 import queue
+import asyncio
+import inspect
+import importlib
 import logging
-from typing import Callable, Any, Dict, Optional
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from collections import OrderedDict
+from typing import Callable, Any, Dict, List, Optional
 from datetime import datetime
-from functools import wraps
+from functools import wraps, partial
+
+from api.codecs import JSONCodec
 
 logger = logging.getLogger('python_api.task_queue')
 
 REDIS_URL = os.environ.get('REDIS_URL', os.environ.get('KV_URL', ''))
+TASK_VISIBILITY_TIMEOUT = int(os.environ.get('TASK_VISIBILITY_TIMEOUT', 300))
+TASK_RESULT_TTL = int(os.environ.get('TASK_RESULT_TTL', 3600))
+TASK_MAX_RESULTS = int(os.environ.get('TASK_MAX_RESULTS', 10000))
+TASK_MAX_RETRIES = int(os.environ.get('TASK_MAX_RETRIES', 3))
+TASK_RETRY_BACKOFF = float(os.environ.get('TASK_RETRY_BACKOFF', 2))
+TASK_MAX_BACKOFF = 300
+TASK_KEY_PREFIX = "neurokid:tasks:"
+TASK_ASYNC_WORKERS = int(os.environ.get('TASK_ASYNC_WORKERS', 8))
+TASK_PROCESS_WORKERS = int(os.environ.get('TASK_PROCESS_WORKERS', os.cpu_count() or 2))
+TASK_PROCESS_START_METHOD = os.environ.get('TASK_PROCESS_START_METHOD', 'spawn')
+TASK_MAX_QUEUE_DEPTH = int(os.environ.get('TASK_MAX_QUEUE_DEPTH', 10000))
+
+# Execution lanes: "async" runs coroutines on a dedicated event loop, "thread"
+# runs blocking I/O on worker threads, "process" runs CPU-bound work in a
+# process pool so it does not hold the API worker's GIL
+LANES = ("async", "thread", "process")
+
+# Registered task functions by name, so Redis workers can resolve payloads
+_registry: Dict[str, Callable] = {}
+
+
+def task_name(func: Callable) -> str:
+    qualname = getattr(func, "__qualname__", type(func).__qualname__)
+    return f"{func.__module__}:{qualname}"
+
+
+def register_task(func: Callable) -> str:
+    name = task_name(func)
+    _registry[name] = func
+    return name
+
+
+def resolve_task(name: str) -> Callable:
+    """Look up a task function by name, importing its module if needed"""
+    func = _registry.get(name)
+    if func is None:
+        module_name, _, qualname = name.partition(":")
+        func = importlib.import_module(module_name)
+        for attr in qualname.split("."):
+            func = getattr(func, attr)
+        # Decorated tasks resolve to the wrapper; run the original function
+        func = getattr(func, "sync", func)
+        _registry[name] = func
+    return func
+
+
+class TaskQueueFull(Exception):
+    """Raised by enqueue when a lane is at its maximum depth"""
+    
+    def __init__(self, lane: str, depth: int):
+        super().__init__(f"Task queue lane '{lane}' is full ({depth} tasks queued)")
+        self.lane = lane
+        self.depth = depth
+
+
+def retry_delay(attempts: int, base: float = TASK_RETRY_BACKOFF) -> float:
+    """Exponential backoff before retry number `attempts`"""
+    return min(TASK_MAX_BACKOFF, base * 2 ** max(0, attempts - 1))
+
+
+def _iso(value) -> Optional[str]:
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return datetime.fromtimestamp(float(value) / 1000).isoformat()
 
 
 class Task:
     """Represents a background task"""
     
-    def __init__(self, func: Callable, args: tuple = (), kwargs: dict = None, 
-                 priority: int = 5, task_id: str = None):
-        self.id = task_id or f"task_{int(time.time() * 1000)}"
+    def __init__(self, func: Callable, args: tuple = (), kwargs: dict = None,
+                 priority: int = 5, task_id: str = None, max_retries: int = TASK_MAX_RETRIES,
+                 lane: Optional[str] = None, group: Optional[str] = None,
+                 deadline: Optional[float] = None):
+        if lane is None:
+            lane = "async" if inspect.iscoroutinefunction(func) else "thread"
+        if lane not in LANES:
+            raise ValueError(f"Unknown task lane '{lane}', expected one of {LANES}")
+        self.id = task_id or uuid.uuid4().hex
         self.func = func
+        self.name = task_name(func)
         self.args = args
         self.kwargs = kwargs or {}
         self.priority = priority
+        self.max_retries = max_retries
+        self.lane = lane
+        # Fairness group (tenant or job type); defaults to the job type
+        self.group = group or self.name
+        # Absolute epoch seconds after which the task is dropped unrun
+        self.deadline = time.time() + deadline if deadline is not None else None
+        self.enqueued_at = 0.0
+        self.attempts = 0
         self.created_at = datetime.now()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
         self.status = "pending"
         self.result = None
         self.error = None
     
-    def execute(self) -> Any:
+    def execute(self, call: Optional[Callable] = None) -> Any:
+        """Run the task, through a lane's call(func, args, kwargs) if given"""
         try:
             self.status = "running"
-            self.result = self.func(*self.args, **self.kwargs)
+            self.attempts += 1
+            self.started_at = datetime.now()
+            if call is None:
+                self.result = self.func(*self.args, **self.kwargs)
+            else:
+                self.result = call(self.func, self.args, self.kwargs)
             self.status = "completed"
             return self.result
         except Exception as e:
@@ -45,90 +145,793 @@ class Task:
             self.error = str(e)
             logger.error(f"Task {self.id} failed: {e}")
             raise
+        finally:
+            self.finished_at = datetime.now()
+    
+    @property
+    def can_retry(self) -> bool:
+        return self.attempts <= self.max_retries
+    
+    @property
+    def is_expired(self) -> bool:
+        return self.deadline is not None and time.time() > self.deadline
+    
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "priority": self.priority,
+            "lane": self.lane,
+            "group": self.group,
+            "deadline": _iso(datetime.fromtimestamp(self.deadline)) if self.deadline else None,
+            "attempts": self.attempts,
+            "max_retries": self.max_retries,
+            "created_at": _iso(self.created_at),
+            "started_at": _iso(self.started_at),
+            "finished_at": _iso(self.finished_at),
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class _FairScheduler:
+    """Priority queue with per-group fairness, deadlines and a depth limit
+    
+    Tasks are ordered by (priority, sequence) so equal priorities run FIFO
+    and Task objects are never compared. Within a priority level, groups
+    (tenants or job types) take turns by virtual time: every task served
+    advances its group's clock, and the group with the lowest clock goes
+    next, so one noisy producer cannot starve the rest. Inside a group,
+    tasks with earlier deadlines run first.
+    """
+    
+    def __init__(self, max_depth: int = TASK_MAX_QUEUE_DEPTH):
+        self.max_depth = max_depth
+        self._cond = threading.Condition()
+        self._groups: Dict[str, list] = {}
+        self._vtime: Dict[str, int] = {}
+        self._ready: List[tuple] = []
+        self._seq = itertools.count()
+        self._clock = 0
+        self._size = 0
+        self._stops = 0
+    
+    def qsize(self) -> int:
+        return self._size
+    
+    def put(self, task: "Task", force: bool = False) -> None:
+        """Queue a task; raises queue.Full at max_depth unless force is set"""
+        with self._cond:
+            if not force and self._size >= self.max_depth:
+                raise queue.Full
+            group = task.group
+            heap = self._groups.get(group)
+            if heap is None:
+                heap = self._groups[group] = []
+                # A returning group resumes at the current clock, not with saved credit
+                self._vtime[group] = self._clock
+            entry = (task.priority, task.deadline or float("inf"), next(self._seq), task)
+            heapq.heappush(heap, entry)
+            if heap[0] is entry:
+                self._push_ready(group)
+            self._size += 1
+            self._cond.notify()
+    
+    def get(self, timeout: Optional[float] = None) -> Optional["Task"]:
+        """Next task, or None when a worker is asked to stop; raises queue.Empty"""
+        with self._cond:
+            if not self._wait(timeout):
+                raise queue.Empty
+            if self._stops:
+                self._stops -= 1
+                return None
+            while True:
+                _, vtime, _, seq, group = heapq.heappop(self._ready)
+                heap = self._groups.get(group)
+                # Entries go stale when a better task arrives or the group is served
+                if heap and heap[0][2] == seq and self._vtime[group] == vtime:
+                    break
+            task = heapq.heappop(heap)[3]
+            self._size -= 1
+            self._clock = vtime
+            self._vtime[group] = vtime + 1
+            if heap:
+                self._push_ready(group)
+            else:
+                del self._groups[group]
+                del self._vtime[group]
+            return task
+    
+    def stop(self, workers: int) -> None:
+        with self._cond:
+            self._stops += workers
+            self._cond.notify_all()
+    
+    def _wait(self, timeout: Optional[float]) -> bool:
+        return self._cond.wait_for(lambda: self._size or self._stops, timeout)
+    
+    def _push_ready(self, group: str) -> None:
+        priority, deadline, seq, _ = self._groups[group][0]
+        heapq.heappush(self._ready, (priority, self._vtime[group], deadline, seq, group))
+    
+    def groups(self) -> int:
+        return len(self._groups)
+
+
+class _Lane:
+    """Queue, worker threads and latency stats for one execution mode"""
+    
+    def __init__(self, name: str, workers: int, call: Callable, max_depth: int = TASK_MAX_QUEUE_DEPTH):
+        self.name = name
+        self.workers = workers
+        self.call = call
+        self.queue = _FairScheduler(max_depth)
+        self.threads: List[threading.Thread] = []
+        self.processed = 0
+        self.failed = 0
+        self.expired = 0
+        self.rejected = 0
+        self.wait_total = 0.0
+        self.run_total = 0.0
+        self.run_max = 0.0
+    
+    def record(self, wait: float, run: float, ok: bool) -> None:
+        if ok:
+            self.processed += 1
+        else:
+            self.failed += 1
+        self.wait_total += wait
+        self.run_total += run
+        self.run_max = max(self.run_max, run)
+    
+    def stats(self) -> dict:
+        runs = max(1, self.processed + self.failed)
+        return {
+            "workers": len(self.threads),
+            "max_workers": self.workers,
+            "queue_depth": self.queue.qsize(),
+            "max_depth": self.queue.max_depth,
+            "groups": self.queue.groups(),
+            "processed": self.processed,
+            "failed": self.failed,
+            "expired": self.expired,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.wait_total / runs * 1000, 2),
+            "avg_run_ms": round(self.run_total / runs * 1000, 2),
+            "max_run_ms": round(self.run_max * 1000, 2),
+        }
 
 
 class InProcessQueue:
-    """Simple in-process task queue with worker threads"""
+    """Simple in-process task queue with worker threads
+    
+    Each execution lane has its own queue and worker count: coroutines run
+    on a dedicated event loop, blocking calls on threads, and CPU-bound work
+    in a process pool (functions and arguments must be picklable). The async
+    and process lanes start on first use.
+    
+    Failed tasks are retried with exponential backoff. Finished tasks are
+    kept for result_ttl seconds, and at most max_results of them, so status
+    lookups work without retaining every task forever. Tasks do not survive
+    a restart; use RedisTaskQueue for that.
+    """
     
-    def __init__(self, num_workers: int = 2):
-        self._queue = queue.PriorityQueue()
-        self._workers = []
+    def __init__(self, num_workers: int = 2, result_ttl: int = TASK_RESULT_TTL,
+                 max_results: int = TASK_MAX_RESULTS, retry_backoff: float = TASK_RETRY_BACKOFF,
+                 async_workers: int = TASK_ASYNC_WORKERS, process_workers: int = TASK_PROCESS_WORKERS,
+                 max_depth: int = TASK_MAX_QUEUE_DEPTH):
+        self._lanes: Dict[str, _Lane] = {
+            "async": _Lane("async", async_workers, self._call_async, max_depth),
+            "thread": _Lane("thread", num_workers, self._call_thread, max_depth),
+            "process": _Lane("process", process_workers, self._call_process, max_depth),
+        }
         self._running = False
         self._tasks: Dict[str, Task] = {}
+        self._results: "OrderedDict[str, tuple]" = OrderedDict()
+        self._delayed: List[tuple] = []
         self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pool: Optional[ProcessPoolExecutor] = None
         self._processed = 0
         self._failed = 0
+        self._retried = 0
         self.num_workers = num_workers
+        self.result_ttl = result_ttl
+        self.max_results = max_results
+        self.retry_backoff = retry_backoff
     
     def start(self):
         if self._running:
             return
         self._running = True
-        for i in range(self.num_workers):
-            worker = threading.Thread(target=self._worker, daemon=True, name=f"TaskWorker-{i}")
-            worker.start()
-            self._workers.append(worker)
+        self._start_lane(self._lanes["thread"])
         logger.info(f"Task queue started with {self.num_workers} workers")
     
     def stop(self):
         self._running = False
-        for _ in self._workers:
-            self._queue.put((0, None))
-        for worker in self._workers:
-            worker.join(timeout=5)
-        self._workers.clear()
+        for lane in self._lanes.values():
+            lane.queue.stop(len(lane.threads))
+        for lane in self._lanes.values():
+            for worker in lane.threads:
+                worker.join(timeout=5)
+            lane.threads.clear()
+        with self._lock:
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._loop = None
+            if self._pool is not None:
+                self._pool.shutdown(wait=False)
+                self._pool = None
         logger.info("Task queue stopped")
     
-    def _worker(self):
+    def _start_lane(self, lane: _Lane) -> None:
+        with self._lock:
+            if lane.threads or not self._running:
+                return
+            for i in range(lane.workers):
+                worker = threading.Thread(target=self._worker, args=(lane,), daemon=True,
+                                          name=f"TaskWorker-{lane.name}-{i}")
+                worker.start()
+                lane.threads.append(worker)
+    
+    def _worker(self, lane: _Lane):
         while self._running:
             try:
-                priority, task = self._queue.get(timeout=1)
+                timeout = self._promote_due()
+                task = lane.queue.get(timeout=timeout)
                 if task is None:
                     break
-                task.execute()
-                with self._lock:
-                    self._processed += 1
-                logger.debug(f"Task {task.id} completed")
+                if task.is_expired:
+                    self._expire(lane, task)
+                    continue
+                self._run(lane, task)
             except queue.Empty:
                 continue
             except Exception as e:
-                with self._lock:
-                    self._failed += 1
                 logger.error(f"Worker error: {e}")
     
+    def _run(self, lane: _Lane, task: Task) -> None:
+        wait = time.time() - task.enqueued_at
+        started = time.perf_counter()
+        try:
+            task.execute(lane.call)
+        except Exception:
+            with self._lock:
+                lane.record(wait, time.perf_counter() - started, ok=False)
+            if task.can_retry and not task.is_expired:
+                delay = retry_delay(task.attempts, self.retry_backoff)
+                task.status = "retrying"
+                with self._lock:
+                    self._retried += 1
+                    heapq.heappush(self._delayed, (time.time() + delay, task.id, task))
+                logger.info(f"Task {task.id} retrying in {delay:.0f}s (attempt {task.attempts})")
+                return
+            with self._lock:
+                self._failed += 1
+                self._finish(task)
+            return
+        with self._lock:
+            lane.record(wait, time.perf_counter() - started, ok=True)
+            self._processed += 1
+            self._finish(task)
+        logger.debug(f"Task {task.id} completed")
+    
+    def _expire(self, lane: _Lane, task: Task) -> None:
+        task.status = "expired"
+        task.error = "Deadline passed before the task could run"
+        with self._lock:
+            lane.expired += 1
+            self._finish(task)
+        logger.warning(f"Task {task.id} expired before running")
+    
+    def call(self, lane: str, func: Callable, args: tuple = (), kwargs: dict = None) -> Any:
+        """Run func synchronously in a lane's executor (used by the Redis workers)"""
+        return self._lanes[lane].call(func, args, kwargs or {})
+    
+    def _call_thread(self, func: Callable, args: tuple, kwargs: dict) -> Any:
+        return func(*args, **kwargs)
+    
+    def _call_async(self, func: Callable, args: tuple, kwargs: dict) -> Any:
+        result = func(*args, **kwargs)
+        if inspect.isawaitable(result):
+            return asyncio.run_coroutine_threadsafe(result, self._event_loop()).result()
+        return result
+    
+    def _call_process(self, func: Callable, args: tuple, kwargs: dict) -> Any:
+        return self._process_pool().submit(func, *args, **kwargs).result()
+    
+    def _event_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, daemon=True, name="TaskEventLoop").start()
+                self._loop = loop
+            return self._loop
+    
+    def _process_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                context = multiprocessing.get_context(TASK_PROCESS_START_METHOD)
+                self._pool = ProcessPoolExecutor(max_workers=self._lanes["process"].workers,
+                                                 mp_context=context)
+            return self._pool
+    
+    def _promote_due(self) -> float:
+        """Move retries whose backoff has elapsed back onto the queue
+        
+        Returns how long a worker may block before the next retry is due.
+        """
+        if not self._delayed:
+            return 1.0
+        now = time.time()
+        with self._lock:
+            while self._delayed and self._delayed[0][0] <= now:
+                _, _, task = heapq.heappop(self._delayed)
+                task.status = "pending"
+                task.enqueued_at = now
+                # Retries were already admitted, so they bypass the depth limit
+                self._lanes[task.lane].queue.put(task, force=True)
+            if self._delayed:
+                return min(1.0, max(0.01, self._delayed[0][0] - now))
+            return 1.0
+    
+    def _finish(self, task: Task) -> None:
+        """Move a finished task to bounded result storage; callers hold _lock"""
+        self._tasks.pop(task.id, None)
+        self._results[task.id] = (task, time.time() + self.result_ttl)
+        self._prune_results()
+    
+    def _prune_results(self) -> None:
+        now = time.time()
+        results = self._results
+        while results:
+            _, expires_at = next(iter(results.values()))
+            if expires_at > now and len(results) <= self.max_results:
+                break
+            results.popitem(last=False)
+    
     def enqueue(self, task: Task) -> str:
+        lane = self._lanes[task.lane]
+        if not lane.threads:
+            self._start_lane(lane)
+        task.enqueued_at = time.time()
         with self._lock:
             self._tasks[task.id] = task
-        self._queue.put((task.priority, task))
-        logger.debug(f"Task {task.id} enqueued with priority {task.priority}")
+        try:
+            lane.queue.put(task)
+        except queue.Full:
+            with self._lock:
+                self._tasks.pop(task.id, None)
+                lane.rejected += 1
+            raise TaskQueueFull(task.lane, lane.queue.qsize())
+        logger.debug(f"Task {task.id} enqueued on {task.lane} lane with priority {task.priority}")
         return task.id
     
     def get_task(self, task_id: str) -> Optional[Task]:
         with self._lock:
-            return self._tasks.get(task_id)
+            task = self._tasks.get(task_id)
+            if task is not None:
+                return task
+            self._prune_results()
+            entry = self._results.get(task_id)
+            return entry[0] if entry else None
+    
+    def get_status(self, task_id: str) -> Optional[dict]:
+        task = self.get_task(task_id)
+        return task.to_dict() if task else None
     
     def stats(self) -> dict:
         with self._lock:
             return {
                 "type": "in-process",
-                "queue_size": self._queue.qsize(),
-                "workers": len(self._workers),
+                "queue_size": sum(lane.queue.qsize() for lane in self._lanes.values()),
+                "delayed": len(self._delayed),
+                "workers": sum(len(lane.threads) for lane in self._lanes.values()),
+                "processed": self._processed,
+                "failed": self._failed,
+                "retried": self._retried,
+                "results": len(self._results),
+                "running": self._running,
+                "lanes": {name: lane.stats() for name, lane in self._lanes.items()}
+            }
+
+
+# Redis counterpart of _FairScheduler. Per lane, "ready:<lane>" is a sorted set
+# of groups scored by their head task's priority * 1e13 + the group's virtual
+# time ("ready:<lane>:vtime"), and "ready:<lane>:g:<group>" holds the group's
+# tasks scored by priority * 1e13 + deadline in ms, or 5e12 + enqueue time for
+# tasks without one, so deadlines go first and the rest run in arrival order.
+# "ready:<lane>:depth" counts queued tasks for the depth limit. push() queues a
+# task from the fields of its hash.
+_PUSH_LUA = """
+local function push(prefix, ready_prefix, id, now)
+    local key = prefix .. id
+    local fields = redis.call('HMGET', key, 'priority', 'lane', 'group', 'deadline')
+    local priority = tonumber(fields[1]) or 5
+    local ready = ready_prefix .. (fields[2] or 'thread')
+    local group = fields[3] or ''
+    local order = tonumber(fields[4]) or (5e12 + now)
+    local group_key = ready .. ':g:' .. group
+    if redis.call('ZADD', group_key, priority * 1e13 + order, id) == 1 then
+        redis.call('INCR', ready .. ':depth')
+    end
+    local vtime = tonumber(redis.call('HGET', ready .. ':vtime', group))
+    if not vtime then
+        -- A returning group resumes at the current clock, not with saved credit
+        vtime = tonumber(redis.call('GET', ready .. ':clock')) or 0
+        redis.call('HSET', ready .. ':vtime', group, vtime)
+    end
+    local head = redis.call('ZRANGE', group_key, 0, 0, 'WITHSCORES')
+    redis.call('ZADD', ready, math.floor(tonumber(head[2]) / 1e13) * 1e13 + vtime, group)
+    redis.call('HSET', key, 'status', 'pending', 'enqueued_at', now)
+end
+
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+"""
+
+# Write a task's hash and queue it, unless its lane is at the depth limit.
+# KEYS: task hash, lane ready. ARGV: max depth, task id, task key prefix, ready
+# key prefix, then the hash's field/value pairs. Returns {queued, depth}.
+_ENQUEUE_SCRIPT = _PUSH_LUA + """
+local depth = tonumber(redis.call('GET', KEYS[2] .. ':depth')) or 0
+if depth >= tonumber(ARGV[1]) then
+    return {0, depth}
+end
+redis.call('HSET', KEYS[1], unpack(ARGV, 5))
+push(ARGV[3], ARGV[4], ARGV[2], now)
+return {1, depth + 1}
+"""
+
+# Move tasks from the single ready set used before lanes and groups had their
+# own onto the fair queues. KEYS: old ready set. ARGV: task key prefix, ready
+# key prefix. Returns how many were moved.
+_REQUEUE_SCRIPT = _PUSH_LUA + """
+local ids = redis.call('ZRANGE', KEYS[1], 0, 999)
+for _, id in ipairs(ids) do
+    redis.call('ZREM', KEYS[1], id)
+    push(ARGV[1], ARGV[2], id, now)
+end
+return #ids
+"""
+
+# Promote due retries and expired leases, then lease the next ready task of
+# the lane, skipping (and marking expired) tasks whose deadline has passed.
+# KEYS: lane ready, delayed, inflight. ARGV: visibility timeout ms, task key
+# prefix, result ttl seconds, ready key prefix (promoted tasks go back to their
+# own lane and group).
+_CLAIM_SCRIPT = _PUSH_LUA + """
+local prefix = ARGV[2]
+
+for _, id in ipairs(redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', now, 'LIMIT', 0, 100)) do
+    redis.call('ZREM', KEYS[2], id)
+    push(prefix, ARGV[4], id, now)
+end
+
+for _, id in ipairs(redis.call('ZRANGEBYSCORE', KEYS[3], '-inf', now, 'LIMIT', 0, 100)) do
+    redis.call('ZREM', KEYS[3], id)
+    local key = prefix .. id
+    local attempts = tonumber(redis.call('HGET', key, 'attempts')) or 0
+    local max_retries = tonumber(redis.call('HGET', key, 'max_retries')) or 0
+    if attempts > max_retries then
+        redis.call('HSET', key, 'status', 'failed', 'error', 'Lease expired', 'finished_at', now)
+        redis.call('EXPIRE', key, tonumber(ARGV[3]))
+    else
+        push(prefix, ARGV[4], id, now)
+    end
+end
+
+while true do
+    local head = redis.call('ZRANGE', KEYS[1], 0, 0)
+    if #head == 0 then
+        return nil
+    end
+    local group = head[1]
+    local group_key = KEYS[1] .. ':g:' .. group
+    local vtime = tonumber(redis.call('HGET', KEYS[1] .. ':vtime', group)) or 0
+    local popped = redis.call('ZPOPMIN', group_key)
+    redis.call('SET', KEYS[1] .. ':clock', vtime)
+    local next_task = redis.call('ZRANGE', group_key, 0, 0, 'WITHSCORES')
+    if #next_task == 0 then
+        redis.call('ZREM', KEYS[1], group)
+        redis.call('HDEL', KEYS[1] .. ':vtime', group)
+    else
+        redis.call('HSET', KEYS[1] .. ':vtime', group, vtime + 1)
+        redis.call('ZADD', KEYS[1], math.floor(tonumber(next_task[2]) / 1e13) * 1e13 + vtime + 1, group)
+    end
+    if #popped > 0 then
+        redis.call('DECR', KEYS[1] .. ':depth')
+        local id = popped[1]
+        local key = prefix .. id
+        local fields = redis.call('HMGET', key, 'payload', 'deadline', 'enqueued_at')
+        local deadline = tonumber(fields[2])
+        if fields[1] and deadline and deadline < now then
+            redis.call('HSET', key, 'status', 'expired', 'error', 'Deadline passed before the task could run',
+                       'finished_at', now)
+            redis.call('EXPIRE', key, tonumber(ARGV[3]))
+            redis.call('INCR', KEYS[1] .. ':expired')
+        elseif fields[1] then
+            redis.call('ZADD', KEYS[3], now + tonumber(ARGV[1]), id)
+            local attempts = redis.call('HINCRBY', key, 'attempts', 1)
+            redis.call('HSET', key, 'status', 'running', 'started_at', now)
+            return {id, fields[1], attempts, fields[3] or now}
+        end
+    end
+end
+"""
+
+
+class RedisTaskQueue:
+    """Durable task queue in Redis with at-least-once delivery
+    
+    A worker leases a task for visibility_timeout seconds; if it dies
+    before acknowledging, the lease expires and another worker picks the
+    task up. Failures are retried with exponential backoff up to each
+    task's max_retries, and finished tasks keep their status and result for
+    result_ttl seconds.
+    
+    Payloads name the task function instead of pickling it, so tasks must be
+    module-level functions with JSON-encodable arguments. Anything else runs
+    on a local InProcessQueue instead.
+    
+    Each lane has its own ready set and its own workers, sized like the
+    in-process lanes, so a backlog on one lane never delays another. Claimed
+    tasks run through the local queue's executors (its event loop and
+    process pool). Within a lane, groups take turns and deadlines are
+    honoured as in _FairScheduler, and the depth limit is checked in the
+    same script that queues the task.
+    """
+    
+    def __init__(self, url: str, num_workers: int = 2,
+                 visibility_timeout: int = TASK_VISIBILITY_TIMEOUT,
+                 result_ttl: int = TASK_RESULT_TTL, retry_backoff: float = TASK_RETRY_BACKOFF,
+                 poll_interval: float = 0.5, max_depth: int = TASK_MAX_QUEUE_DEPTH,
+                 async_workers: int = TASK_ASYNC_WORKERS, process_workers: int = TASK_PROCESS_WORKERS):
+        import redis
+        self._client = redis.from_url(url)
+        self._client.ping()
+        self._claim = self._client.register_script(_CLAIM_SCRIPT)
+        self._enqueue = self._client.register_script(_ENQUEUE_SCRIPT)
+        self._requeue = self._client.register_script(_REQUEUE_SCRIPT)
+        self._codec = JSONCodec()
+        self._local = InProcessQueue(num_workers=1, result_ttl=result_ttl, async_workers=async_workers,
+                                     process_workers=process_workers)
+        workers = {"async": async_workers, "thread": num_workers, "process": process_workers}
+        self._lanes: Dict[str, _Lane] = {
+            name: _Lane(name, workers[name], partial(self._local.call, name), max_depth) for name in LANES
+        }
+        self._running = False
+        self._lock = threading.Lock()
+        self._processed = 0
+        self._failed = 0
+        self._retried = 0
+        self.num_workers = num_workers
+        self.visibility_timeout = visibility_timeout
+        self.result_ttl = result_ttl
+        self.retry_backoff = retry_backoff
+        self.poll_interval = poll_interval
+        self.max_depth = max_depth
+        # Single ready set used before lanes and groups were split; drained on start
+        self.ready_key = TASK_KEY_PREFIX + "ready"
+        self.ready_prefix = TASK_KEY_PREFIX + "ready:"
+        self.ready_keys = {name: self.ready_prefix + name for name in LANES}
+        self.delayed_key = TASK_KEY_PREFIX + "delayed"
+        self.inflight_key = TASK_KEY_PREFIX + "inflight"
+        self.task_prefix = TASK_KEY_PREFIX + "task:"
+    
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._local.start()
+        self._drain_legacy_ready()
+        for lane in self._lanes.values():
+            for i in range(lane.workers):
+                worker = threading.Thread(target=self._worker, args=(lane,), daemon=True,
+                                          name=f"RedisTaskWorker-{lane.name}-{i}")
+                worker.start()
+                lane.threads.append(worker)
+        logger.info("Redis task queue started with " +
+                    ", ".join(f"{lane.workers} {lane.name}" for lane in self._lanes.values()) + " workers")
+    
+    def stop(self):
+        self._running = False
+        for lane in self._lanes.values():
+            for worker in lane.threads:
+                worker.join(timeout=5)
+            lane.threads.clear()
+        self._local.stop()
+        logger.info("Redis task queue stopped")
+    
+    def _drain_legacy_ready(self) -> None:
+        """Move tasks queued in the old single ready set onto their lane's fair queue"""
+        try:
+            moved = total = 1
+            while moved:
+                moved = self._requeue(keys=[self.ready_key], args=[self.task_prefix, self.ready_prefix])
+                total += moved
+            if total > 1:
+                logger.info(f"Moved {total - 1} queued tasks onto per-lane ready sets")
+        except Exception as e:
+            logger.warning(f"Could not move queued tasks onto per-lane ready sets: {e}")
+    
+    def enqueue(self, task: Task) -> str:
+        try:
+            resolve_task(task.name)
+            payload = self._codec.dumps({"name": task.name, "args": list(task.args),
+                                         "kwargs": task.kwargs, "lane": task.lane})
+        except (ImportError, AttributeError, TypeError, ValueError) as e:
+            logger.warning(f"Task {task.name} cannot be queued in Redis, running locally: {e}")
+            return self._local.enqueue(task)
+        
+        fields = {
+            "payload": payload,
+            "name": task.name,
+            "status": "pending",
+            "priority": task.priority,
+            "lane": task.lane,
+            "group": task.group,
+            "attempts": 0,
+            "max_retries": task.max_retries,
+            "created_at": int(time.time() * 1000),
+        }
+        if task.deadline is not None:
+            fields["deadline"] = int(task.deadline * 1000)
+        queued, depth = self._enqueue(
+            keys=[self.task_prefix + task.id, self.ready_keys[task.lane]],
+            args=[self.max_depth, task.id, self.task_prefix, self.ready_prefix,
+                  *itertools.chain.from_iterable(fields.items())])
+        if not queued:
+            with self._lock:
+                self._lanes[task.lane].rejected += 1
+            raise TaskQueueFull(task.lane, depth)
+        logger.debug(f"Task {task.id} enqueued on {task.lane} lane with priority {task.priority}")
+        return task.id
+    
+    def _worker(self, lane: _Lane):
+        keys = [self.ready_keys[lane.name], self.delayed_key, self.inflight_key]
+        while self._running:
+            try:
+                claimed = self._claim(keys=keys, args=[self.visibility_timeout * 1000, self.task_prefix,
+                                                       self.result_ttl, self.ready_prefix])
+                if not claimed:
+                    time.sleep(self.poll_interval)
+                    continue
+                task_id, payload, attempts, enqueued_at = claimed
+                wait = max(0.0, time.time() - int(enqueued_at) / 1000)
+                self._run(lane, task_id.decode(), self._codec.loads(payload), int(attempts), wait)
+            except Exception as e:
+                logger.error(f"Worker error: {e}")
+                time.sleep(self.poll_interval)
+    
+    def _run(self, lane: _Lane, task_id: str, payload: dict, attempts: int, wait: float = 0.0) -> None:
+        key = self.task_prefix + task_id
+        started = time.perf_counter()
+        try:
+            func = resolve_task(payload["name"])
+            result = lane.call(func, tuple(payload["args"]), payload["kwargs"])
+        except Exception as e:
+            with self._lock:
+                lane.record(wait, time.perf_counter() - started, ok=False)
+            logger.error(f"Task {task_id} failed: {e}")
+            max_retries = int(self._client.hget(key, "max_retries") or 0)
+            pipe = self._client.pipeline()
+            pipe.zrem(self.inflight_key, task_id)
+            if attempts <= max_retries:
+                delay = retry_delay(attempts, self.retry_backoff)
+                pipe.hset(key, mapping={"status": "retrying", "error": str(e)})
+                pipe.zadd(self.delayed_key, {task_id: (time.time() + delay) * 1000})
+                with self._lock:
+                    self._retried += 1
+                logger.info(f"Task {task_id} retrying in {delay:.0f}s (attempt {attempts})")
+            else:
+                pipe.hset(key, mapping={"status": "failed", "error": str(e),
+                                        "finished_at": int(time.time() * 1000)})
+                pipe.expire(key, self.result_ttl)
+                with self._lock:
+                    self._failed += 1
+            pipe.execute()
+            return
+        
+        pipe = self._client.pipeline()
+        pipe.zrem(self.inflight_key, task_id)
+        pipe.hset(key, mapping={"status": "completed", "result": self._codec.dumps(result),
+                                "finished_at": int(time.time() * 1000)})
+        pipe.hdel(key, "error")
+        pipe.expire(key, self.result_ttl)
+        pipe.execute()
+        with self._lock:
+            lane.record(wait, time.perf_counter() - started, ok=True)
+            self._processed += 1
+        logger.debug(f"Task {task_id} completed")
+    
+    def get_status(self, task_id: str) -> Optional[dict]:
+        data = self._client.hgetall(self.task_prefix + task_id)
+        if not data:
+            return self._local.get_status(task_id)
+        data = {k.decode(): v.decode() if k != b"result" else v for k, v in data.items()}
+        result = data.get("result")
+        return {
+            "id": task_id,
+            "name": data.get("name"),
+            "status": data.get("status"),
+            "priority": int(data.get("priority", 5)),
+            "lane": data.get("lane", "thread"),
+            "group": data.get("group"),
+            "deadline": _iso(data.get("deadline")),
+            "attempts": int(data.get("attempts", 0)),
+            "max_retries": int(data.get("max_retries", 0)),
+            "created_at": _iso(data.get("created_at")),
+            "started_at": _iso(data.get("started_at")),
+            "finished_at": _iso(data.get("finished_at")),
+            "result": self._codec.loads(result) if result else None,
+            "error": data.get("error"),
+        }
+    
+    def stats(self) -> dict:
+        pipe = self._client.pipeline()
+        for name in LANES:
+            pipe.get(self.ready_keys[name] + ":depth")
+            pipe.zcard(self.ready_keys[name])
+            pipe.get(self.ready_keys[name] + ":expired")
+        pipe.zcard(self.delayed_key)
+        pipe.zcard(self.inflight_key)
+        *per_lane, delayed, inflight = pipe.execute()
+        with self._lock:
+            lanes = {}
+            for i, name in enumerate(LANES):
+                depth, groups, expired = per_lane[3 * i:3 * i + 3]
+                lanes[name] = {**self._lanes[name].stats(), "queue_depth": int(depth or 0),
+                               "groups": groups, "expired": int(expired or 0)}
+            return {
+                "type": "redis",
+                "queue_size": sum(lane["queue_depth"] for lane in lanes.values()),
+                "delayed": delayed,
+                "inflight": inflight,
+                "workers": sum(len(lane.threads) for lane in self._lanes.values()),
                 "processed": self._processed,
                 "failed": self._failed,
-                "running": self._running
+                "retried": self._retried,
+                "running": self._running,
+                "lanes": lanes,
+                "local": self._local.stats()
             }
 
 
-task_queue = InProcessQueue(num_workers=2)
+def create_task_queue(redis_url: str = REDIS_URL, num_workers: int = 2):
+    """Redis-backed queue when Redis is reachable, in-process otherwise"""
+    if redis_url:
+        try:
+            queue_ = RedisTaskQueue(redis_url, num_workers=num_workers)
+            logger.info("Using Redis task queue (durable)")
+            return queue_
+        except Exception as e:
+            logger.warning(f"Redis task queue unavailable, using in-process queue: {e}")
+    logger.info("Using in-process task queue")
+    return InProcessQueue(num_workers=num_workers)
+
+
+task_queue = create_task_queue(num_workers=2)
 task_queue.start()
 
 
-def background_task(priority: int = 5):
-    """Decorator to run a function as a background task"""
+def background_task(priority: int = 5, max_retries: int = TASK_MAX_RETRIES, lane: Optional[str] = None,
+                    deadline: Optional[float] = None):
+    """Decorator to run a function as a background task
+    
+    lane picks the executor ("async", "thread" or "process"); by default
+    coroutine functions run on the async lane and everything else on threads.
+    deadline is seconds from enqueue after which the task is dropped unrun.
+    Calls raise TaskQueueFull when the lane is at its maximum depth.
+    """
     def decorator(func):
+        register_task(func)
+        
         @wraps(func)
         def wrapper(*args, **kwargs):
-            task = Task(func, args, kwargs, priority)
+            task = Task(func, args, kwargs, priority, max_retries=max_retries, lane=lane,
+                        deadline=deadline)
             task_queue.enqueue(task)
             return task.id
         
@@ -137,7 +940,18 @@ def background_task(priority: int = 5):
     return decorator
 
 
-def enqueue_task(func: Callable, *args, priority: int = 5, **kwargs) -> str:
-    """Enqueue a function to run in the background"""
-    task = Task(func, args, kwargs, priority)
+def enqueue_task(func: Callable, *args, priority: int = 5, max_retries: int = TASK_MAX_RETRIES,
+                 lane: Optional[str] = None, group: Optional[str] = None,
+                 deadline: Optional[float] = None, **kwargs) -> str:
+    """Enqueue a function to run in the background on the given (or inferred) lane
+    
+    group is the fairness key (e.g. a tenant id; defaults to the job type) and
+    deadline the seconds after which the task is dropped if it has not run.
+    Raises TaskQueueFull when the lane is at its maximum depth, so callers can
+    shed load or answer 503 instead of queueing without bound.
+    """
+    func = getattr(func, "sync", func)
+    register_task(func)
+    task = Task(func, args, kwargs, priority, max_retries=max_retries, lane=lane,
+                group=group, deadline=deadline)
     return task_queue.enqueue(task)
@@ -0,0 +1,269 @@
+"""
+Trending posts engine for Python API
+Exponentially decayed vote velocity per post, fed in small batches from recent Vote rows
+and periodically re-synced from the whole window
+"""
+
+import os
+import time
+import heapq
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger('python_api.trending')
+
+TRENDING_HALF_LIFE = float(os.environ.get('TRENDING_HALF_LIFE_HOURS', 6)) * 3600
+TRENDING_REFRESH_INTERVAL = float(os.environ.get('TRENDING_REFRESH_INTERVAL', 30))
+TRENDING_BATCH_SIZE = int(os.environ.get('TRENDING_BATCH_SIZE', 2000))
+TRENDING_WINDOW_HOURS = float(os.environ.get('TRENDING_WINDOW_HOURS', 72))
+# Incremental loads only see new Vote rows; a re-sync also drops unvotes, changed
+# values and votes that committed behind the watermark
+TRENDING_RESYNC_INTERVAL = float(os.environ.get('TRENDING_RESYNC_INTERVAL', 300))
+TRENDING_TOP_K = 50
+# Posts whose decayed score falls below this many votes are forgotten
+TRENDING_MIN_SCORE = 0.05
+# Rebase the weights once they reach 2**64, long before floats lose range
+TRENDING_MAX_HALF_LIVES = 64
+
+_VOTES_QUERY = '''
+    SELECT v.id, v."targetId" as "postId", v.value, v."createdAt", p."categoryId"
+    FROM "Vote" v
+    JOIN "Post" p ON p.id = v."targetId"
+    WHERE v."targetType" = 'POST' AND (v."createdAt", v.id) > (%s, %s)
+    ORDER BY v."createdAt", v.id
+    LIMIT %s
+'''
+
+# Decayed weight per post relative to the engine epoch, for votes before the cursor
+_RESYNC_QUERY = '''
+    SELECT v."targetId" as "postId", p."categoryId", COUNT(*) as votes,
+           SUM(v.value * POWER(2, (EXTRACT(EPOCH FROM v."createdAt") - %s) / %s)) as weight
+    FROM "Vote" v
+    JOIN "Post" p ON p.id = v."targetId"
+    WHERE v."targetType" = 'POST' AND v."createdAt" > %s AND v."createdAt" < %s
+    GROUP BY v."targetId", p."categoryId"
+'''
+
+_NOW_QUERY = '''SELECT NOW() AT TIME ZONE 'UTC' as now'''
+
+_POSTS_QUERY = '''
+    SELECT p.id, p.title, p."createdAt", p."voteScore", p.status, p."categoryId",
+           c.name as "categoryName", pr.username as "authorUsername"
+    FROM "Post" p
+    LEFT JOIN "Category" c ON p."categoryId" = c.id
+    LEFT JOIN "Profile" pr ON p."authorId" = pr."userId"
+    WHERE p.id = ANY(%s)
+'''
+
+
+def _timestamp(value: datetime) -> float:
+    """Epoch seconds for a createdAt column (UTC, stored without a zone)"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+class TrendingEngine:
+    """Decayed trending scores per post, with the top lists precomputed per category
+    
+    A vote of value v cast at time t adds v * 2**((t - epoch) / half_life) to
+    its post. Every post decays by the same factor over time, so rankings only
+    change when votes arrive: the top lists are rebuilt once per refresh and
+    a request just slices one. epoch is moved forward before weights grow large.
+    Between re-syncs, which recompute every score from the window, refreshes
+    only add votes created after the watermark.
+    """
+    
+    def __init__(self, half_life: float = TRENDING_HALF_LIFE,
+                 refresh_interval: float = TRENDING_REFRESH_INTERVAL,
+                 batch_size: int = TRENDING_BATCH_SIZE, window_hours: float = TRENDING_WINDOW_HOURS,
+                 top_k: int = TRENDING_TOP_K, max_batches: int = 10,
+                 resync_interval: float = TRENDING_RESYNC_INTERVAL):
+        self.half_life = half_life
+        self.refresh_interval = refresh_interval
+        self.batch_size = batch_size
+        self.window_hours = window_hours
+        self.top_k = top_k
+        self.max_batches = max_batches
+        self.resync_interval = resync_interval
+        self._scores: Dict[str, float] = {}
+        self._categories: Dict[str, Optional[str]] = {}
+        self._posts: Dict[str, Dict] = {}
+        self._top: Dict[Optional[str], List[str]] = {None: []}
+        self._epoch = time.time()
+        self._watermark: Optional[Tuple[datetime, str]] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+        self.refreshed_at = 0.0
+        self.resynced_at = 0.0
+        self._votes_applied = 0
+        self._refreshes = 0
+        self._resyncs = 0
+        self._errors = 0
+    
+    def add_vote(self, post_id: str, category_id: Optional[str], value: int, at: float) -> None:
+        if (at - self._epoch) / self.half_life > TRENDING_MAX_HALF_LIVES:
+            self._rebase(at)
+        self._scores[post_id] = self._scores.get(post_id, 0.0) + value * 2 ** ((at - self._epoch) / self.half_life)
+        self._categories[post_id] = category_id
+        self._votes_applied += 1
+    
+    def score(self, post_id: str, now: Optional[float] = None) -> float:
+        """Current decayed score, in votes"""
+        now = time.time() if now is None else now
+        return self._scores.get(post_id, 0.0) * 2 ** ((self._epoch - now) / self.half_life)
+    
+    def _rebase(self, now: float) -> None:
+        factor = 2 ** ((self._epoch - now) / self.half_life)
+        self._scores = {post_id: score * factor for post_id, score in self._scores.items()}
+        self._epoch = now
+    
+    def _prune(self, now: float) -> int:
+        """Forget posts whose decayed score has faded below TRENDING_MIN_SCORE"""
+        threshold = TRENDING_MIN_SCORE * 2 ** ((now - self._epoch) / self.half_life)
+        faded = [post_id for post_id, score in self._scores.items() if abs(score) < threshold]
+        for post_id in faded:
+            del self._scores[post_id]
+            self._categories.pop(post_id, None)
+        return len(faded)
+    
+    def _rank(self) -> Dict[Optional[str], List[str]]:
+        """Best candidates overall and per category, with headroom for inactive posts"""
+        by_category: Dict[Optional[str], List[str]] = {None: list(self._scores)}
+        for post_id in self._scores:
+            category = self._categories.get(post_id)
+            if category is not None:
+                by_category.setdefault(category, []).append(post_id)
+        return {
+            category: heapq.nlargest(self.top_k * 2, post_ids, key=self._scores.__getitem__)
+            for category, post_ids in by_category.items()
+        }
+    
+    async def _resync(self, execute_query) -> int:
+        """Recompute every score from the votes in the window and restart the watermark
+        
+        The cursor is read first, so votes created after it are left to the
+        incremental loads instead of being counted twice.
+        """
+        cursor = (await execute_query(_NOW_QUERY, fetch_one=True))['now']
+        epoch = time.time()
+        rows = await execute_query(_RESYNC_QUERY, (epoch, self.half_life,
+                                                   cursor - timedelta(hours=self.window_hours), cursor))
+        self._epoch = epoch
+        self._scores = {row['postId']: float(row['weight']) for row in rows}
+        self._categories = {row['postId']: row['categoryId'] for row in rows}
+        self._watermark = (cursor, "")
+        self.resynced_at = epoch
+        self._resyncs += 1
+        loaded = sum(row['votes'] for row in rows)
+        self._votes_applied += loaded
+        return loaded
+    
+    async def _load_votes(self, execute_query) -> int:
+        loaded = 0
+        for _ in range(self.max_batches):
+            rows = await execute_query(_VOTES_QUERY, (*self._watermark, self.batch_size))
+            for row in rows:
+                self.add_vote(row['postId'], row['categoryId'], row['value'], _timestamp(row['createdAt']))
+            if rows:
+                self._watermark = (rows[-1]['createdAt'], rows[-1]['id'])
+            loaded += len(rows)
+            if len(rows) < self.batch_size:
+                break
+        return loaded
+    
+    async def refresh(self, max_age: Optional[float] = None) -> int:
+        """Apply votes cast since the last refresh and rebuild the top lists
+        
+        With max_age, a snapshot refreshed that recently by a concurrent
+        caller is kept as is.
+        """
+        from api.database import execute_query
+        
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if max_age is not None and self.refreshed_at and time.time() - self.refreshed_at <= max_age:
+                return 0
+            if self._watermark is None or time.time() - self.resynced_at >= self.resync_interval:
+                loaded = await self._resync(execute_query)
+            else:
+                loaded = await self._load_votes(execute_query)
+            now = time.time()
+            if (now - self._epoch) / self.half_life > TRENDING_MAX_HALF_LIVES / 2:
+                self._rebase(now)
+            self._prune(now)
+            
+            ranked = self._rank()
+            candidates = list({post_id for post_ids in ranked.values() for post_id in post_ids})
+            posts = {}
+            if candidates:
+                for row in await execute_query(_POSTS_QUERY, (candidates,)):
+                    posts[row['id']] = row
+                    self._categories[row['id']] = row['categoryId']
+            
+            self._posts = posts
+            self._top = {
+                category: [post_id for post_id in post_ids
+                           if post_id in posts and posts[post_id]['status'] == 'ACTIVE'][:self.top_k]
+                for category, post_ids in ranked.items()
+            }
+            self.refreshed_at = now
+            self._refreshes += 1
+            return loaded
+    
+    async def top(self, limit: int = 10, category_id: Optional[str] = None) -> List[Dict]:
+        """Trending posts, optionally within a category, from the precomputed lists
+        
+        Without the background refresher running (e.g. a one-off script) a
+        stale snapshot is refreshed inline first, as is a missing one when the
+        refresher has not succeeded yet.
+        """
+        stale = time.time() - self.refreshed_at > self.refresh_interval
+        if not self.refreshed_at or (self._task is None and stale):
+            await self.refresh(max_age=self.refresh_interval)
+        now = time.time()
+        return [
+            {**self._posts[post_id], "trendingScore": round(self.score(post_id, now), 3)}
+            for post_id in self._top.get(category_id, [])[:limit]
+        ]
+    
+    def start(self) -> None:
+        """Refresh every refresh_interval seconds on the running event loop"""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._refresh_loop())
+    
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+    
+    async def _refresh_loop(self) -> None:
+        while True:
+            try:
+                loaded = await self.refresh()
+                if loaded:
+                    logger.debug(f"Applied {loaded} votes to trending scores")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._errors += 1
+                logger.error(f"Trending refresh error: {e}")
+            await asyncio.sleep(self.refresh_interval)
+    
+    def stats(self) -> dict:
+        return {
+            "posts_tracked": len(self._scores),
+            "categories": len(self._top) - 1,
+            "half_life_hours": self.half_life / 3600,
+            "votes_applied": self._votes_applied,
+            "refreshes": self._refreshes,
+            "resyncs": self._resyncs,
+            "errors": self._errors,
+            "age_seconds": round(time.time() - self.refreshed_at, 1) if self.refreshed_at else None
+        }
+
+
+trending_engine = TrendingEngine()
@@ -0,0 +1 @@
+"""Micro-benchmarks for the Python API hot paths"""
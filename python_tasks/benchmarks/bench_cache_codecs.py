@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Benchmark cache codecs on payloads shaped like real API responses
+
+Usage: python -m benchmarks.bench_cache_codecs [--rows N] [--iterations N]
+"""
+
+import os
+import sys
+import time
+import json
+import random
+import argparse
+from datetime import datetime, date, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.codecs import available_codecs, CompressedCodec
+
+
+def activity_timeline(rows: int) -> list:
+    """Rows as returned by AnalyticsRepository.get_activity_timeline"""
+    today = date.today()
+    return [
+        {"date": today - timedelta(days=i), "posts": random.randint(0, 500),
+         "comments": random.randint(0, 3000), "new_users": random.randint(0, 200)}
+        for i in range(rows)
+    ]
+
+
+def top_contributors(rows: int) -> list:
+    """Rows as returned by AnalyticsRepository.get_top_contributors"""
+    return [
+        {"id": f"ckv{i:022d}", "username": f"parent_{i}", "displayName": f"Parent {i}",
+         "postCount": random.randint(0, 400), "commentCount": random.randint(0, 2000),
+         "totalScore": Decimal(random.randint(0, 10000))}
+        for i in range(rows)
+    ]
+
+
+def user_page(rows: int) -> list:
+    """Rows as returned by UserRepository.get_all"""
+    now = datetime.now()
+    return [
+        {"id": f"ckv{i:022d}", "email": f"user{i}@example.com",
+         "createdAt": now - timedelta(days=random.randint(0, 900)),
+         "lastLoginAt": now - timedelta(hours=random.randint(0, 2000)),
+         "username": f"user_{i}", "displayName": f"User {i}",
+         "avatarUrl": None, "role": "PARENT"}
+        for i in range(rows)
+    ]
+
+
+def bench(codec, payload, iterations: int) -> dict:
+    encoded = codec.dumps(payload)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        codec.dumps(payload)
+    encode_us = (time.perf_counter() - start) / iterations * 1e6
+    start = time.perf_counter()
+    for _ in range(iterations):
+        decoded = codec.loads(encoded)
+    decode_us = (time.perf_counter() - start) / iterations * 1e6
+    return {"bytes": len(encoded), "encode_us": encode_us, "decode_us": decode_us,
+            "round_trip": decoded == payload}
+
+
+class Legacy:
+    """The previous json.dumps(default=str) path, for comparison (lossy)"""
+    name = "json(default=str)"
+
+    def dumps(self, value):
+        return json.dumps(value, default=str).encode()
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=500)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+    random.seed(7)
+
+    payloads = {
+        "activity_timeline(90)": activity_timeline(90),
+        f"top_contributors({args.rows})": top_contributors(args.rows),
+        f"user_page({args.rows})": user_page(args.rows),
+    }
+    codecs = [Legacy()]
+    for inner in available_codecs().values():
+        codecs.append(CompressedCodec(inner, threshold=0))
+        codecs.append(CompressedCodec(inner, threshold=4096))
+
+    print(f"{'payload':<24} {'codec':<20} {'bytes':>9} {'encode us':>11} {'decode us':>11}  typed")
+    for label, payload in payloads.items():
+        for codec in codecs:
+            result = bench(codec, payload, args.iterations)
+            print(f"{label:<24} {codec.name:<20} {result['bytes']:>9} "
+                  f"{result['encode_us']:>11.1f} {result['decode_us']:>11.1f}  "
+                  f"{'yes' if result['round_trip'] else 'no'}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark PHI/PII scanning throughput in MB/s: per-pattern loop vs single-pass scanner
+
+Builds a corpus of forum-post-like texts, some containing identifiers, and
+times the old findall + sub loop per pattern against scan_and_redact and
+scan_many. Audit logging is silenced so only scanning is measured.
+
+Usage: python -m benchmarks.bench_phi_scanner [--docs N] [--phi-rate R] [--repeat N]
+"""
+
+import os
+import re
+import sys
+import time
+import random
+import logging
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.governance import PrivacyService
+
+WORDS = ("our son started a new sensory diet this week and the occupational therapist "
+         "suggested weighted blankets for bedtime routines school meetings went well "
+         "thanks everyone for the advice about transitions and visual schedules").split()
+
+IDENTIFIERS = [
+    lambda: f"{random.randint(100, 999)}-{random.randint(10, 99)}-{random.randint(1000, 9999)}",
+    lambda: f"{random.randint(1, 12)}/{random.randint(1, 28)}/{random.randint(1990, 2024)}",
+    lambda: f"MRN: {random.randint(10 ** 6, 10 ** 9)}",
+    lambda: f"{random.randint(200, 999)}-{random.randint(200, 999)}-{random.randint(1000, 9999)}",
+    lambda: f"parent{random.randint(1, 9999)}@example.org",
+]
+
+
+def make_corpus(docs: int, phi_rate: float) -> list:
+    corpus = []
+    for _ in range(docs):
+        words = random.choices(WORDS, k=random.randint(40, 400))
+        if random.random() < phi_rate:
+            for _ in range(random.randint(1, 3)):
+                words.insert(random.randrange(len(words)), random.choice(IDENTIFIERS)())
+        corpus.append(" ".join(words))
+    return corpus
+
+
+def legacy_scan(text: str):
+    """The previous implementation: findall then sub, per pattern"""
+    redacted_text = text
+    findings = []
+    for label, (pattern, mask) in PrivacyService.PATTERNS.items():
+        count = len(re.findall(pattern, text))
+        if count > 0:
+            redacted_text = re.sub(pattern, mask, redacted_text)
+            findings.append({'type': label, 'count': count, 'confidence': 'HIGH'})
+    return redacted_text, findings
+
+
+def timed(fn, repeat: int) -> float:
+    """Best wall time of repeat runs, in seconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--phi-rate", type=float, default=0.1, help="fraction of texts with identifiers")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    logging.getLogger('privacy_service').setLevel(logging.WARNING)
+    corpus = make_corpus(args.docs, args.phi_rate)
+    megabytes = sum(len(text.encode()) for text in corpus) / 1e6
+    service = PrivacyService()
+
+    runs = [
+        ("per-pattern loop", lambda: [legacy_scan(text) for text in corpus]),
+        ("scan_and_redact", lambda: [service.scan_and_redact(text) for text in corpus]),
+        ("scan_many", lambda: service.scan_many(corpus)),
+    ]
+    print(f"{args.docs} texts, {megabytes:.1f} MB, {args.phi_rate:.0%} with identifiers")
+    print(f"{'scanner':<18} {'seconds':>8} {'MB/s':>8} {'speedup':>8}")
+    baseline = None
+    for name, fn in runs:
+        seconds = timed(fn, args.repeat)
+        baseline = baseline or seconds
+        print(f"{name:<18} {seconds:>8.3f} {megabytes / seconds:>8.1f} {baseline / seconds:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
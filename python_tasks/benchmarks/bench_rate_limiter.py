@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Benchmark per-request rate limiter overhead across many distinct client keys
+
+Usage: python -m benchmarks.bench_rate_limiter [--keys N] [--requests N] [--threads N]
+"""
+
+import os
+import sys
+import time
+import random
+import logging
+import argparse
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.rate_limiter import RateLimiter, TokenBucket
+
+
+class LegacyRateLimiter:
+    """The previous global-lock, bucket-per-key limiter, for comparison"""
+
+    def __init__(self, capacity: int = 100, refill_rate: float = 10):
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+
+    def is_allowed(self, key: str, tokens: int = 1, capacity=None, refill_rate=None) -> bool:
+        with self._lock:
+            if key not in self._buckets:
+                self._buckets[key] = TokenBucket(self.capacity, self.refill_rate)
+        allowed = self._buckets[key].consume(tokens)
+        with self._lock:
+            pass
+        return allowed
+
+    def stats(self) -> dict:
+        return {"buckets": len(self._buckets)}
+
+
+def run(limiter, keys: list, requests: int, threads: int) -> float:
+    """Mean microseconds per is_allowed call across all threads"""
+    per_thread = requests // threads
+
+    def worker(seed: int):
+        rng = random.Random(seed)
+        sample = [rng.choice(keys) for _ in range(per_thread)]
+        for key in sample:
+            limiter.is_allowed(key)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return (time.perf_counter() - start) / (per_thread * threads) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--keys", type=int, default=10_000)
+    parser.add_argument("--requests", type=int, default=200_000)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    keys = [f"10.{i // 65536}.{i // 256 % 256}.{i % 256}:/api/python/users/{i}" for i in range(args.keys)]
+    limiters = {
+        "legacy (global lock)": lambda: LegacyRateLimiter(),
+        "sharded x16": lambda: RateLimiter(shards=16, sweep_interval=0),
+        "sharded x16, cap keys/2": lambda: RateLimiter(shards=16, max_keys=args.keys // 2, sweep_interval=0),
+    }
+
+    print(f"{args.keys} keys, {args.requests} requests")
+    print(f"{'limiter':<26} {'threads':>7} {'us/request':>11} {'buckets':>9}")
+    for label, factory in limiters.items():
+        for threads in sorted({1, args.threads}):
+            limiter = factory()
+            us = run(limiter, keys, args.requests, threads)
+            print(f"{label:<26} {threads:>7} {us:>11.2f} {limiter.stats()['buckets']:>9}")
+
+
+if __name__ == "__main__":
+    main()
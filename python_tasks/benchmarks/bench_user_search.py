@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Benchmark /users search against a seeded user table: legacy ILIKE vs trigram path
+
+Seeds a scratch schema in the database at DATABASE_URL (1M users by default),
+then times the old two-query ILIKE listing against the single trigram-indexed
+search query for a mix of prefix, common and rare terms.
+
+Usage: python -m benchmarks.bench_user_search [--users N] [--repeat N] [--keep]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncpg
+
+from api.database import build_user_search, to_asyncpg, _prepare_dsn
+
+SCHEMA = "bench_user_search"
+TERMS = ["jo", "ol", "smith", "olivia.garcia", "example.org", "zq9x"]
+
+LEGACY_PAGE = '''
+    SELECT u.id, u.email, u."createdAt", u."lastLoginAt",
+           p.username, p."displayName", p."avatarUrl",
+           (SELECT r.role FROM "UserRole" r WHERE r."userId" = u.id LIMIT 1) as role
+    FROM "User" u
+    LEFT JOIN "Profile" p ON u.id = p."userId"
+    WHERE u.email ILIKE %s OR p.username ILIKE %s
+    ORDER BY u."createdAt" DESC LIMIT %s OFFSET %s
+'''
+LEGACY_COUNT = '''
+    SELECT COUNT(*) as count FROM "User" u
+    LEFT JOIN "Profile" p ON u.id = p."userId" WHERE u.email ILIKE %s OR p.username ILIKE %s
+'''
+
+SEED = [
+    f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE',
+    f'CREATE SCHEMA {SCHEMA}',
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm WITH SCHEMA public',
+    '''CREATE TABLE "User" (id text PRIMARY KEY, email text NOT NULL UNIQUE,
+                            "createdAt" timestamp NOT NULL, "lastLoginAt" timestamp)''',
+    '''CREATE TABLE "Profile" ("userId" text NOT NULL UNIQUE, username varchar(50) NOT NULL UNIQUE,
+                               "displayName" varchar(255) NOT NULL, "avatarUrl" text)''',
+    'CREATE TABLE "UserRole" ("userId" text NOT NULL, role text NOT NULL)',
+    '''INSERT INTO "User" (id, email, "createdAt", "lastLoginAt")
+       SELECT 'u' || g,
+              (ARRAY['olivia','liam','emma','noah','ava','jonah','mia','lucas','zoe','joseph'])[1 + g % 10]
+              || '.' || (ARRAY['smith','garcia','nguyen','kowalski','okafor','jones','tanaka'])[1 + g % 7]
+              || g || '@' || (ARRAY['example.com','example.org','mail.test'])[1 + g % 3],
+              now() - g * interval '1 minute',
+              CASE WHEN g % 4 = 0 THEN NULL ELSE now() - g * interval '10 seconds' END
+       FROM generate_series(1, $1) g''',
+    '''INSERT INTO "Profile" ("userId", username, "displayName")
+       SELECT id, split_part(email, '@', 1), initcap(split_part(email, '.', 1)) FROM "User"''',
+    '''INSERT INTO "UserRole" ("userId", role)
+       SELECT id, 'MODERATOR' FROM "User" WHERE substr(id, 2)::int % 50 = 0''',
+    'CREATE INDEX ON "User" ("createdAt", id)',
+    'CREATE INDEX ON "UserRole" ("userId")',
+    'CREATE INDEX "User_email_trgm_idx" ON "User" USING GIN (email public.gin_trgm_ops)',
+    'CREATE INDEX "Profile_username_trgm_idx" ON "Profile" USING GIN (username public.gin_trgm_ops)',
+    'ANALYZE',
+]
+
+
+async def seed(conn, users: int):
+    start = time.perf_counter()
+    for statement in SEED:
+        if '$1' in statement:
+            await conn.execute(statement, users)
+        else:
+            await conn.execute(statement)
+    print(f"seeded {users} users in {time.perf_counter() - start:.1f}s")
+
+
+async def legacy(conn, term: str, limit: int, offset: int) -> int:
+    pattern = f"%{term}%"
+    await conn.fetch(to_asyncpg(LEGACY_PAGE), pattern, pattern, limit, offset)
+    return (await conn.fetchrow(to_asyncpg(LEGACY_COUNT), pattern, pattern))['count']
+
+
+async def trigram(conn, term: str, limit: int, offset: int) -> int:
+    query, params = build_user_search(term, limit + 1, offset)
+    rows = await conn.fetch(to_asyncpg(query), *params)
+    return rows[0]['searchTotal'] if rows else 0
+
+
+async def timed(fn, conn, term: str, repeat: int, offset: int = 0):
+    """Median milliseconds per search and the total it reported"""
+    samples = []
+    total = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        total = await fn(conn, term, 20, offset)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), total
+
+
+async def main_async(args):
+    if not os.environ.get('DATABASE_URL'):
+        sys.exit("DATABASE_URL must point at a scratch PostgreSQL database")
+    conn = await asyncpg.connect(_prepare_dsn(os.environ["DATABASE_URL"])[0])
+    try:
+        await conn.execute(f'SET search_path TO {SCHEMA}, public')
+        await seed(conn, args.users)
+        print(f"{'term':<16} {'offset':>6} {'legacy ms':>10} {'trigram ms':>11} {'speedup':>8} "
+              f"{'legacy total':>13} {'trigram total':>14}")
+        for term in TERMS:
+            for offset in (0, 200):
+                legacy_ms, legacy_total = await timed(legacy, conn, term, args.repeat, offset)
+                trigram_ms, trigram_total = await timed(trigram, conn, term, args.repeat, offset)
+                print(f"{term:<16} {offset:>6} {legacy_ms:>10.1f} {trigram_ms:>11.1f} "
+                      f"{legacy_ms / trigram_ms:>7.1f}x {legacy_total:>13} {trigram_total:>14}")
+    finally:
+        if not args.keep:
+            await conn.execute(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE')
+        await conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--keep", action="store_true", help="leave the seeded schema in place")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -11,7 +11,7 @@ from pydantic import BaseModel
 
 # Services
 from services.quality import run_quality_checks
-from services.jobs import run_daily_analytics_etl
+from services.jobs import run_daily_analytics_etl, refresh_activity_rollup, refresh_contributor_scores
 from services.unstructured import scan_policies
 from services.ingestion import router as ingestion_router
 from services.ml_models import (
@@ -49,6 +49,11 @@ def run_scheduler():
 def setup_schedule():
     # Schedule ETL to run every night at 2 AM
     schedule.every().day.at("02:00").do(lambda: run_async(run_daily_analytics_etl))
+    # Hourly, so yesterday is rolled up soon after midnight and late writes are picked up
+    schedule.every().hour.at(":05").do(lambda: run_async(refresh_activity_rollup))
+    # Leaderboard deltas every 15 minutes, with a nightly full rebuild to correct drift
+    schedule.every(15).minutes.do(lambda: run_async(refresh_contributor_scores))
+    schedule.every().day.at("03:00").do(lambda: run_async(lambda: refresh_contributor_scores(full=True)))
     # Run Quality Checks every 6 hours
     schedule.every(6).hours.do(lambda: run_async(run_quality_checks))
     # Scan policies daily
@@ -99,6 +104,16 @@ async def trigger_etl(background_tasks: BackgroundTasks):
     background_tasks.add_task(run_daily_analytics_etl)
     return {"status": "triggered", "job": "daily_analytics_etl"}
 
+@app.post("/api/jobs/rollup/activity")
+async def trigger_activity_rollup(background_tasks: BackgroundTasks):
+    background_tasks.add_task(refresh_activity_rollup)
+    return {"status": "triggered", "job": "activity_rollup"}
+
+@app.post("/api/jobs/leaderboard/contributors")
+async def trigger_contributor_scores(background_tasks: BackgroundTasks, full: bool = False):
+    background_tasks.add_task(refresh_contributor_scores, full)
+    return {"status": "triggered", "job": "contributor_leaderboard", "full": full}
+
 @app.post("/api/catalog/scan")
 async def trigger_scan(background_tasks: BackgroundTasks):
     background_tasks.add_task(scan_policies)
@@ -9,7 +9,7 @@ import logging
 import json
 import re
 from datetime import datetime
-from typing import List, Dict, Any, Tuple, Optional
+from typing import List, Dict, Any, Tuple, Optional, Iterator
 from enum import Enum
 
 class RiskLevel(str, Enum):
@@ -82,6 +82,86 @@ class RiskEngine:
 
         return RiskLevel.LOW
 
+class PHIScanner:
+    """
+    Single-pass PHI/PII scanner.
+    Compiles every pattern into one named-group alternation and runs it only over the
+    whitespace-delimited windows around candidate characters, so each text is scanned
+    once for all identifier types and redacted in the same pass.
+    """
+
+    def __init__(self, patterns: Dict[str, Tuple[str, str]], candidate_chars: str = r'[\d@]'):
+        """
+        Args:
+            patterns: Label -> (regex, mask). Earlier labels win where two patterns
+                match at the same position.
+            candidate_chars: Character class every whitespace-separated part of a match
+                contains at least one of, apart from a single leading label token
+                (the "MRN:" in "MRN: 1234567"). Text away from these characters is skipped.
+        """
+        self.labels = list(patterns)
+        self.masks = {label: mask for label, (_, mask) in patterns.items()}
+        self.regex = re.compile('|'.join(f'(?P<{label}>{pattern})' for label, (pattern, _) in patterns.items()))
+        self.prefilter = re.compile(candidate_chars)
+        # A token holding a candidate and every directly following token that holds one too
+        self.run = re.compile(rf'\S*(?:\s+\S*{candidate_chars}\S*)*')
+
+    def windows(self, text: str) -> Iterator[Tuple[int, int]]:
+        """
+        Yields (start, end) spans that together contain every possible match.
+
+        Each span starts at a token boundary one token before a run of candidate
+        tokens and ends at a token boundary, so word boundaries inside a span
+        behave exactly as they do in the whole text.
+        """
+        pos = 0
+        while True:
+            hit = self.prefilter.search(text, pos)
+            if hit is None:
+                return
+            start = hit.start()
+            while start > pos and not text[start - 1].isspace():
+                start -= 1
+            end = self.run.match(text, start).end()
+            # Include the preceding token, for labels such as "MRN:"
+            while start > pos and text[start - 1].isspace():
+                start -= 1
+            while start > pos and not text[start - 1].isspace():
+                start -= 1
+            yield start, end
+            pos = end
+
+    def scan(self, text: str) -> Tuple[str, Dict[str, int]]:
+        """
+        Finds all identifier spans in one pass and rewrites the text around them.
+
+        Returns:
+            Tuple of the redacted text and a count per label found.
+        """
+        counts: Dict[str, int] = {}
+        parts = []
+        last = 0
+        for start, end in self.windows(text):
+            for match in self.regex.finditer(text, start, end):
+                label = match.lastgroup
+                counts[label] = counts.get(label, 0) + 1
+                parts.append(text[last:match.start()])
+                parts.append(self.masks[label])
+                last = match.end()
+
+        if not counts:
+            return text, counts
+        parts.append(text[last:])
+        return ''.join(parts), counts
+
+    def findings(self, counts: Dict[str, int]) -> List[Dict[str, Any]]:
+        """Findings in pattern order, in the shape RiskEngine expects."""
+        return [
+            {'type': label, 'count': counts[label], 'confidence': 'HIGH'}
+            for label in self.labels if label in counts
+        ]
+
+
 class PrivacyService:
     """
     Core Service for Healthcare Data Privacy operations.
@@ -97,8 +177,14 @@ class PrivacyService:
         'EMAIL': (r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b', '[REDACTED_EMAIL]')
     }
 
+    # Compiled once for every instance
+    _scanner: Optional[PHIScanner] = None
+
     def __init__(self):
         self.risk_engine = RiskEngine()
+        if PrivacyService._scanner is None:
+            PrivacyService._scanner = PHIScanner(self.PATTERNS)
+        self.scanner = PrivacyService._scanner
 
     def scan_and_redact(self, text: str, action_id: str = "unknown") -> Tuple[str, List[Dict[str, Any]], str]:
         """
@@ -118,23 +204,8 @@ class PrivacyService:
              Implements 'De-identification' via the Safe Harbor method by removing/masking
              specified identifiers to minimize re-identification risk.
         """
-        redacted_text = text
-        findings = []
-
-        for label, (pattern, mask) in self.PATTERNS.items():
-            matches = re.findall(pattern, text)
-            count = len(matches)
-            
-            if count > 0:
-                # Perform substitution (Masking)
-                redacted_text = re.sub(pattern, mask, redacted_text)
-                
-                findings.append({
-                    'type': label,
-                    'count': count,
-                    'confidence': 'HIGH'
-                })
-
+        redacted_text, counts = self.scanner.scan(text)
+        findings = self.scanner.findings(counts)
         risk_level = self.risk_engine.calculate_risk(findings)
         
         # Structured Audit Logging
@@ -147,6 +218,43 @@ class PrivacyService:
 
         return redacted_text, findings, risk_level
 
+    def scan_many(self, texts: List[str], action_id: str = "unknown") -> List[Tuple[str, List[Dict[str, Any]], str]]:
+        """
+        Scans and redacts a batch of texts.
+
+        Args:
+            texts: Raw input strings to process.
+            action_id: A unique identifier for the trace/request (for audit logs).
+
+        Returns:
+            A (redacted text, findings, risk level) tuple per input text, in order.
+
+        Compliance Rationale:
+             Same de-identification as scan_and_redact. The batch is recorded as one
+             audit event carrying its totals and highest risk level, instead of one per text.
+        """
+        results = []
+        findings_count = 0
+        highest = RiskLevel.LOW
+        severity = list(RiskLevel)
+
+        for text in texts:
+            redacted_text, counts = self.scanner.scan(text)
+            findings = self.scanner.findings(counts)
+            risk_level = self.risk_engine.calculate_risk(findings) if findings else RiskLevel.LOW
+            if severity.index(risk_level) > severity.index(highest):
+                highest = risk_level
+            findings_count += len(findings)
+            results.append((redacted_text, findings, risk_level))
+
+        self._log_audit_event(
+            action="PHI_SCAN_AND_REDACT_BATCH",
+            action_id=action_id,
+            findings_count=findings_count,
+            risk_level=highest
+        )
+        return results
+
     def _log_audit_event(self, action: str, action_id: str, findings_count: int, risk_level: str):
         """
         Writes a structured JSON audit log entry.
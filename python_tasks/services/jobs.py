@@ -4,6 +4,7 @@ from database import get_session
 import logging
 import json
 import uuid
+from datetime import datetime, timedelta
 
 logger = logging.getLogger(__name__)
 
@@ -75,3 +76,234 @@ async def run_daily_analytics_etl():
             """), {"id": run_id, "error": str(e)})
             await session.commit()
             raise e
+
+
+# The longest window read from the rollup: 12 months of /analytics/growth
+ROLLUP_BACKFILL_DAYS = 366
+
+# Re-aggregates every completed day from the newest rolled-up day onwards (that
+# day included, to pick up late writes) into "DailyActivityRollup", or the whole
+# backfill when the table does not reach back that far yet. Each source table is
+# range-scanned on its createdAt index instead of unioned and filtered.
+ACTIVITY_ROLLUP_SQL = """
+    WITH bounds AS (
+        SELECT CASE WHEN MIN("date") <= CURRENT_DATE - CAST(:backfill_days AS int) THEN MAX("date")
+                    ELSE CURRENT_DATE - CAST(:backfill_days AS int) END AS start
+        FROM "DailyActivityRollup"
+    ),
+    days AS (
+        SELECT generate_series(start, CURRENT_DATE - 1, INTERVAL '1 day')::date AS day FROM bounds
+    ),
+    posts AS (
+        SELECT "createdAt"::date AS day, COUNT(*) AS n FROM "Post", bounds
+        WHERE "createdAt" >= bounds.start AND "createdAt" < CURRENT_DATE GROUP BY 1
+    ),
+    comments AS (
+        SELECT "createdAt"::date AS day, COUNT(*) AS n FROM "Comment", bounds
+        WHERE "createdAt" >= bounds.start AND "createdAt" < CURRENT_DATE GROUP BY 1
+    ),
+    users AS (
+        SELECT "createdAt"::date AS day, COUNT(*) AS n FROM "User", bounds
+        WHERE "createdAt" >= bounds.start AND "createdAt" < CURRENT_DATE GROUP BY 1
+    ),
+    votes AS (
+        SELECT "createdAt"::date AS day, COUNT(*) AS n FROM "Vote", bounds
+        WHERE "createdAt" >= bounds.start AND "createdAt" < CURRENT_DATE GROUP BY 1
+    )
+    INSERT INTO "DailyActivityRollup" ("date", "posts", "comments", "newUsers", "votes", "updatedAt")
+    SELECT days.day, COALESCE(posts.n, 0), COALESCE(comments.n, 0),
+           COALESCE(users.n, 0), COALESCE(votes.n, 0), NOW()
+    FROM days
+    LEFT JOIN posts USING (day)
+    LEFT JOIN comments USING (day)
+    LEFT JOIN users USING (day)
+    LEFT JOIN votes USING (day)
+    ON CONFLICT ("date") DO UPDATE
+    SET "posts" = EXCLUDED."posts", "comments" = EXCLUDED."comments",
+        "newUsers" = EXCLUDED."newUsers", "votes" = EXCLUDED."votes", "updatedAt" = NOW()
+"""
+
+
+async def refresh_activity_rollup(backfill_days: int = ROLLUP_BACKFILL_DAYS):
+    """
+    Rollup Job: Brings "DailyActivityRollup" up to yesterday, so the analytics
+    timeline reads pre-aggregated days plus a live count for today only.
+    An empty table is backfilled for backfill_days.
+    """
+    job_name = "Daily Activity Rollup"
+    run_id = str(uuid.uuid4())
+    
+    async with get_session() as session:
+        await session.execute(text("""
+            INSERT INTO "JobExecution" ("id", "jobName", "status", "source", "startedAt")
+            VALUES (:id, :name, 'RUNNING', 'PythonETL', NOW())
+        """), {"id": run_id, "name": job_name})
+        await session.commit()
+        
+        try:
+            result = await session.execute(text(ACTIVITY_ROLLUP_SQL), {"backfill_days": backfill_days})
+            days_rolled = result.rowcount
+            
+            await session.execute(text("""
+                UPDATE "JobExecution" 
+                SET "status" = 'SUCCESS', 
+                    "completedAt" = NOW(), 
+                    "recordsProcessed" = :count
+                WHERE "id" = :id
+            """), {"id": run_id, "count": days_rolled})
+            await session.commit()
+            
+            logger.info(f"Activity rollup refreshed {days_rolled} days")
+            return {"status": "success", "days": days_rolled}
+            
+        except Exception as e:
+            logger.error(f"Rollup Job Failed: {e}")
+            await session.rollback()
+            await session.execute(text("""
+                UPDATE "JobExecution" 
+                SET "status" = 'FAILED', 
+                    "completedAt" = NOW(), 
+                    "errorLog" = :error
+                WHERE "id" = :id
+            """), {"id": run_id, "error": str(e)})
+            await session.commit()
+            raise e
+
+
+LEADERBOARD_WINDOWS = {"7d": 7, "30d": 30}
+LEADERBOARD_EPOCH = datetime(1970, 1, 1)
+# The all-time watermark trails NOW() so rows whose transactions started before
+# a run but committed after it are still ahead of the watermark on the next run
+LEADERBOARD_WATERMARK_LAG = timedelta(minutes=5)
+
+# Posts and comments are aggregated separately and then combined, so a prolific
+# user costs posts + comments rows rather than posts x comments
+CONTRIBUTOR_ACTIVITY_SQL = """
+    SELECT uid, SUM(posts) AS posts, SUM(comments) AS comments, SUM(score) AS score
+    FROM (
+        SELECT "authorId" AS uid, COUNT(*) AS posts, 0 AS comments, COALESCE(SUM("voteScore"), 0) AS score
+        FROM "Post"
+        WHERE "authorId" IS NOT NULL AND "createdAt" > :since AND "createdAt" <= :through
+        GROUP BY "authorId"
+        UNION ALL
+        SELECT "authorId", 0, COUNT(*), 0
+        FROM "Comment"
+        WHERE "createdAt" > :since AND "createdAt" <= :through
+        GROUP BY "authorId"
+        {extra}
+    ) activity
+    GROUP BY uid
+"""
+
+# Votes cast since the last run on posts that were already counted; newer
+# posts bring their whole voteScore with them
+POST_VOTE_DELTA_SQL = """
+        UNION ALL
+        SELECT p."authorId", 0, 0, SUM(v.value)
+        FROM "Vote" v
+        JOIN "Post" p ON p.id = v."targetId"
+        WHERE v."targetType" = 'POST' AND v."createdAt" > :since AND v."createdAt" <= :through
+          AND p."authorId" IS NOT NULL AND p."createdAt" <= :since
+        GROUP BY p."authorId"
+"""
+
+REBUILD_WINDOW_SQL = """
+    INSERT INTO "ContributorScore"
+        ("window", "userId", "postCount", "commentCount", "totalScore", "activity", "updatedAt")
+    SELECT :window, uid, posts, comments, score, posts + comments, NOW()
+    FROM ({activity}) a
+""".format(activity=CONTRIBUTOR_ACTIVITY_SQL.format(extra=""))
+
+APPLY_ALL_TIME_DELTA_SQL = """
+    INSERT INTO "ContributorScore"
+        ("window", "userId", "postCount", "commentCount", "totalScore", "activity", "updatedAt")
+    SELECT 'all', uid, posts, comments, score, posts + comments, NOW()
+    FROM ({activity}) a
+    ON CONFLICT ("window", "userId") DO UPDATE
+    SET "postCount" = "ContributorScore"."postCount" + EXCLUDED."postCount",
+        "commentCount" = "ContributorScore"."commentCount" + EXCLUDED."commentCount",
+        "totalScore" = "ContributorScore"."totalScore" + EXCLUDED."totalScore",
+        "activity" = "ContributorScore"."activity" + EXCLUDED."activity",
+        "updatedAt" = NOW()
+""".format(activity=CONTRIBUTOR_ACTIVITY_SQL.format(extra=POST_VOTE_DELTA_SQL))
+
+
+async def _last_watermark(session, job_name: str):
+    """'through' timestamp recorded by the last successful run of job_name, if any"""
+    result = await session.execute(text("""
+        SELECT "metadata"->>'through' FROM "JobExecution"
+        WHERE "jobName" = :name AND "status" = 'SUCCESS'
+        ORDER BY "startedAt" DESC LIMIT 1
+    """), {"name": job_name})
+    through = result.scalar()
+    return datetime.fromisoformat(through) if through else None
+
+
+async def refresh_contributor_scores(full: bool = False):
+    """
+    Leaderboard Job: Maintains "ContributorScore" for /analytics/top-contributors.
+    The 7d and 30d windows are rebuilt from an index range each run; all-time
+    applies only the posts, comments and post votes since the previous run,
+    and is rebuilt from scratch when full is set or no previous run exists.
+    Runs are serialized by an advisory lock so a delta is never applied twice.
+    """
+    job_name = "Contributor Leaderboard"
+    run_id = str(uuid.uuid4())
+    
+    async with get_session() as session:
+        await session.execute(text("""
+            INSERT INTO "JobExecution" ("id", "jobName", "status", "source", "startedAt")
+            VALUES (:id, :name, 'RUNNING', 'PythonETL', NOW())
+        """), {"id": run_id, "name": job_name})
+        await session.commit()
+        
+        try:
+            # Held until commit, which also records the watermark; an overlapping
+            # run waits here and then reads that watermark
+            await session.execute(text("SELECT pg_advisory_xact_lock(hashtext(:name))"), {"name": job_name})
+            # createdAt columns are UTC timestamps without a zone
+            now = (await session.execute(text("SELECT NOW() AT TIME ZONE 'UTC'"))).scalar()
+            through = now - LEADERBOARD_WATERMARK_LAG
+            since = None if full else await _last_watermark(session, job_name)
+            
+            windows = [(window, now - timedelta(days=days), now) for window, days in LEADERBOARD_WINDOWS.items()]
+            if since is None:
+                windows.append(("all", LEADERBOARD_EPOCH, through))
+            processed = 0
+            for window, window_start, window_end in windows:
+                await session.execute(text('DELETE FROM "ContributorScore" WHERE "window" = :window'),
+                                      {"window": window})
+                result = await session.execute(text(REBUILD_WINDOW_SQL),
+                                               {"window": window, "since": window_start, "through": window_end})
+                processed += result.rowcount
+            if since is not None:
+                result = await session.execute(text(APPLY_ALL_TIME_DELTA_SQL),
+                                               {"since": since, "through": through})
+                processed += result.rowcount
+            
+            metadata = {"through": through.isoformat(), "mode": "delta" if since else "full"}
+            await session.execute(text("""
+                UPDATE "JobExecution" 
+                SET "status" = 'SUCCESS', 
+                    "completedAt" = NOW(), 
+                    "recordsProcessed" = :count,
+                    "metadata" = :meta
+                WHERE "id" = :id
+            """), {"id": run_id, "count": processed, "meta": json.dumps(metadata)})
+            await session.commit()
+            
+            logger.info(f"Contributor leaderboard refreshed ({metadata['mode']}, {processed} rows)")
+            return {"status": "success", "rows": processed, **metadata}
+            
+        except Exception as e:
+            logger.error(f"Leaderboard Job Failed: {e}")
+            await session.rollback()
+            await session.execute(text("""
+                UPDATE "JobExecution" 
+                SET "status" = 'FAILED', 
+                    "completedAt" = NOW(), 
+                    "errorLog" = :error
+                WHERE "id" = :id
+            """), {"id": run_id, "error": str(e)})
+            await session.commit()
+            raise e
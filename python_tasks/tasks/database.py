@@ -1,27 +1,42 @@
 
 """Database cleanup and maintenance tasks - Refactored for Async"""
 
+import asyncio
 import logging
-from datetime import datetime, timedelta
 from sqlalchemy import text
 
 from database import get_session
+from api.retention import (
+    RETENTION_BATCH_SIZE, RETENTION_BATCH_PAUSE, get_policy, retention_cutoff, delete_batch_sql
+)
 
 logger = logging.getLogger("background_tasks.database")
 
+async def purge_expired(policy_name: str, days: int = None, batch_size: int = RETENTION_BATCH_SIZE,
+                        pause: float = RETENTION_BATCH_PAUSE) -> int:
+    """Delete a retention policy's expired rows in bounded batches, committing each one"""
+    policy = get_policy(policy_name)
+    days = policy.days if days is None else days
+    cutoff_date = retention_cutoff(days)
+    stmt = text(delete_batch_sql(policy, ":cutoff", ":batch_size"))
+    deleted_count = 0
+    
+    async with get_session() as session:
+        while True:
+            result = await session.execute(stmt, {"cutoff": cutoff_date, "batch_size": batch_size})
+            await session.commit()
+            deleted_count += result.rowcount
+            if result.rowcount < batch_size:
+                break
+            await asyncio.sleep(pause)
+    
+    return deleted_count
+
+
 async def cleanup_audit_logs(days: int = 365) -> int:
-    """Delete audit logs older than specified days using Async Session"""
+    """Delete audit logs older than specified days, in batches"""
     try:
-        cutoff_date = datetime.now() - timedelta(days=days)
-        
-        async with get_session() as session:
-            # Note: "AuditLog" table needs to exist in ORM or we use raw SQL.
-            # Using raw SQL for efficient bulk delete is fine and often preferred for cleanup.
-            stmt = text('DELETE FROM "AuditLog" WHERE "createdAt" < :cutoff')
-            result = await session.execute(stmt, {"cutoff": cutoff_date})
-            deleted_count = result.rowcount
-            await session.commit()
-        
+        deleted_count = await purge_expired("audit_logs", days)
         logger.info(f"Deleted {deleted_count} audit logs older than {days} days")
         return deleted_count
         
@@ -31,21 +46,9 @@ async def cleanup_audit_logs(days: int = 365) -> int:
 
 
 async def cleanup_expired_sessions(days: int = 30) -> int:
-    """Clean up expired user sessions"""
+    """Clean up sessions inactive for longer than specified days, in batches"""
     try:
-        cutoff_date = datetime.now() - timedelta(days=days)
-        
-        async with get_session() as session:
-            # Assuming "UserSession" table exists (Session is reserved keyword often)
-            # Prisma schema calls it "UserSession" relation but table might be "Session"?
-            # Prompt schema: "model UserSession" was NOT in the truncated output view, 
-            # but usually it's there. 
-            # Current file had 'DELETE FROM "Session"'. I will stick to that.
-            stmt = text('DELETE FROM "Session" WHERE "expires" < :cutoff')
-            result = await session.execute(stmt, {"cutoff": cutoff_date})
-            deleted_count = result.rowcount
-            await session.commit()
-        
+        deleted_count = await purge_expired("sessions", days)
         logger.info(f"Deleted {deleted_count} expired sessions")
         return deleted_count
         
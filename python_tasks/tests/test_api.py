@@ -21,6 +21,13 @@ from api.app import app
 with patch('api.database.init_connection_pool'):
     client = TestClient(app, raise_server_exceptions=False)
 
+
+@pytest.fixture(autouse=True)
+def reset_rate_limits():
+    """Every test starts with full buckets so suite size never trips the limiter"""
+    from api.rate_limiter import rate_limiter
+    rate_limiter.cleanup(max_age=0)
+
 class TestRootEndpoints:
     """Test root and health endpoints"""
     
@@ -80,18 +87,66 @@ class TestUsersAPI:
         assert data["page"] == 1
         assert data["limit"] == 20
     
-    @patch('api.database.UserRepository.get_all')
-    @patch('api.database.UserRepository.get_count')
-    def test_list_users_with_search(self, mock_count, mock_get_all):
+    @patch('api.database.UserRepository.search')
+    def test_list_users_with_search(self, mock_search):
         """Test listing users with search parameter"""
-        mock_get_all.return_value = []
-        mock_count.return_value = 0
+        mock_search.return_value = ([], 0, False)
         
         response = client.get("/api/python/users?search=nonexistent_user_xyz")
         assert response.status_code == 200
         data = response.json()
         assert "users" in data
         assert "total" in data
+        assert data["total_is_estimate"] is False
+    
+    @patch('api.database.execute_query')
+    def test_search_returns_page_and_total_in_one_query(self, mock_query):
+        """Test search rows carry the total, and an empty page still reports it"""
+        from api.database import _role_cache
+        _role_cache.clear()
+        mock_query.side_effect = [
+            [{"searchTotal": 10000, "id": "1", "email": "jo@test.com", "username": "jo",
+              "displayName": "Jo", "createdAt": "2023-01-01T00:00:00",
+              "lastLoginAt": None, "avatarUrl": None}],
+            [{"userId": "1", "roles": ["MODERATOR", "PARENT"]}]
+        ]
+        response = client.get("/api/python/users?search=jo")
+        data = response.json()
+        assert mock_query.call_count == 2
+        assert data["total"] == 10000
+        assert data["total_is_estimate"] is True
+        assert data["users"][0]["username"] == "jo"
+        assert data["users"][0]["role"] == "MODERATOR"
+        
+        mock_query.side_effect = None
+        mock_query.return_value = [{"searchTotal": 3, "id": None}]
+        data = client.get("/api/python/users?search=jo&page=5").json()
+        assert data["users"] == []
+        assert data["total"] == 3
+    
+    @patch('api.database.execute_query')
+    def test_roles_loaded_once_per_page_and_cached(self, mock_query):
+        """Test a page's roles come from one query, then from cache until invalidated"""
+        import asyncio
+        from api.cache import invalidate_tags
+        from api.database import UserRepository, _role_cache
+        _role_cache.clear()
+        mock_query.return_value = [{"userId": "u1", "roles": ["ADMIN", "PARENT"]}]
+        users = [{"id": "u1"}, {"id": "u2"}]
+        
+        asyncio.run(UserRepository.attach_roles(users))
+        assert users[0]["roles"] == ["ADMIN", "PARENT"]
+        assert users[0]["role"] == "ADMIN"
+        assert users[1]["roles"] == [] and users[1]["role"] is None
+        assert mock_query.call_args[0][1] == (["u1", "u2"],)
+        
+        asyncio.run(UserRepository.attach_roles([{"id": "u1"}, {"id": "u2"}]))
+        assert mock_query.call_count == 1
+        
+        invalidate_tags("user:u1")
+        asyncio.run(UserRepository.attach_roles([{"id": "u1"}, {"id": "u2"}]))
+        assert mock_query.call_count == 2
+        assert mock_query.call_args[0][1] == (["u1"],)
     
     def test_list_users_pagination_validation(self):
         """Test pagination parameter validation"""
@@ -114,6 +169,51 @@ class TestUsersAPI:
         mock_get_by_id.return_value = None
         response = client.get("/api/python/users/nonexistent-id/activity")
         assert response.status_code == 404
+    
+    @patch('api.database.execute_query')
+    def test_delete_user_anonymizes_in_one_statement(self, mock_query):
+        """Test anonymization and its audit entry are a single round trip"""
+        mock_query.return_value = {"users": ["u1"], "posts": 2, "comments": 3}
+        response = client.delete("/api/python/users/u1")
+        assert response.status_code == 200
+        assert response.json()["action"] == "user_anonymized"
+        assert mock_query.call_count == 1
+        query, params = mock_query.call_args.args
+        assert 'INSERT INTO "AuditLog"' in query and 'UPDATE "Post"' in query
+        assert params[0] == ["u1"]
+    
+    @patch('api.database.execute_query')
+    def test_delete_user_anonymize_not_found(self, mock_query):
+        """Test anonymizing a missing user is a 404"""
+        mock_query.return_value = {"users": [], "posts": 0, "comments": 0}
+        response = client.delete("/api/python/users/missing")
+        assert response.status_code == 404
+    
+    @patch('api.database.execute_query')
+    def test_anonymize_users_batch(self, mock_query):
+        """Test batch anonymization reports anonymized and unknown ids"""
+        mock_query.return_value = {"users": ["u1", "u2"], "posts": 4, "comments": 1}
+        response = client.post("/api/python/users/anonymize",
+                               json={"user_ids": ["u1", "u2", "ghost", "u1"], "reason": "inactive"})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["anonymized"] == ["u1", "u2"]
+        assert data["not_found"] == ["ghost"]
+        assert data["posts"] == 4
+        assert '"reason": "inactive"' in mock_query.call_args.args[1][1]
+    
+    @patch('api.database.execute_query')
+    def test_anonymize_chunks_large_batches(self, mock_query):
+        """Test large id lists run as one statement per batch"""
+        import asyncio
+        from api.database import UserRepository
+        mock_query.side_effect = lambda query, params, fetch_one: {
+            "users": params[0], "posts": len(params[0]), "comments": 0}
+        
+        result = asyncio.run(UserRepository.anonymize([f"u{i}" for i in range(5)], batch_size=2))
+        assert mock_query.call_count == 3
+        assert result["users"] == ["u0", "u1", "u2", "u3", "u4"]
+        assert result["posts"] == 5
 
 
 class TestAnalyticsAPI:
@@ -156,6 +256,38 @@ class TestAnalyticsAPI:
         response = client.get("/api/python/analytics/timeline?days=100")
         assert response.status_code == 422
     
+    @patch('api.database.execute_query')
+    def test_timeline_reads_rollup_with_live_tail(self, mock_query):
+        """Test the timeline is one query over the rollup plus a live count for unrolled days"""
+        import asyncio
+        from api.database import AnalyticsRepository
+        mock_query.return_value = []
+        asyncio.run(AnalyticsRepository.get_activity_timeline(days=30))
+        query, params = mock_query.call_args[0]
+        assert '"DailyActivityRollup"' in query
+        assert 'UNION' in query and 'generate_series' in query
+        assert params == (30,)
+    
+    @patch('api.database.execute_query')
+    def test_top_contributors_read_leaderboard_table(self, mock_query):
+        """Test the leaderboard is read from ContributorScore, falling back to a live aggregate"""
+        mock_query.return_value = [{"id": "u1", "username": "a", "displayName": "A",
+                                    "postCount": 3, "commentCount": 4, "totalScore": 9}]
+        response = client.get("/api/python/analytics/top-contributors?limit=5&window=7d")
+        assert response.status_code == 200
+        assert response.json()[0]["commentCount"] == 4
+        query, params = mock_query.call_args[0]
+        assert '"ContributorScore"' in query and params == ("7d", 5)
+        
+        mock_query.side_effect = [[], []]
+        response = client.get("/api/python/analytics/top-contributors?limit=5&window=30d")
+        assert response.status_code == 200
+        query, params = mock_query.call_args[0]
+        assert 'FULL JOIN' in query and params == (30, 30, 5)
+        
+        response = client.get("/api/python/analytics/top-contributors?window=1y")
+        assert response.status_code == 422
+    
     @patch('api.database.AnalyticsRepository.get_top_contributors')
     def test_top_contributors(self, mock_top):
         """Test top contributors endpoint"""
@@ -164,22 +296,16 @@ class TestAnalyticsAPI:
         assert response.status_code == 200
         assert isinstance(response.json(), list)
     
-    @patch('api.database.execute_query')
-    def test_engagement_metrics(self, mock_query):
+    @patch('api.database.AnalyticsRepository.get_counter_snapshot')
+    def test_engagement_metrics(self, mock_snapshot):
         """Test engagement metrics endpoint"""
-        # Route logic:
-        # 1. total_users
-        # 2. total_posts
-        # 3. total_comments
-        # 4. avg_vote
-        # 5. active_users
-        mock_query.side_effect = [
-            {'count': 100},  # total_users
-            {'count': 500},  # total_posts
-            {'count': 1250}, # total_comments
-            {'avg': 10.0},   # avg_vote
-            {'count': 50}    # active_users
-        ]
+        mock_snapshot.return_value = {
+            'total_users': 100,
+            'total_posts': 500,
+            'total_comments': 1250,
+            'avg_vote_score': 10.0,
+            'active_users_30d': 50
+        }
         
         response = client.get("/api/python/analytics/engagement")
         assert response.status_code == 200, response.text
@@ -188,6 +314,30 @@ class TestAnalyticsAPI:
         assert "comments_per_post" in data
         assert data["posts_per_user"] == 5.0
         assert data["comments_per_post"] == 2.5
+        assert data["engagement_rate"] == 50.0
+    
+    @patch('api.database.execute_query')
+    def test_counter_snapshot_single_query(self, mock_query):
+        """Test the counter snapshot is computed once and shared until stale"""
+        import asyncio
+        from api.cache import cache
+        from api.database import AnalyticsRepository
+        
+        cache.delete(AnalyticsRepository.COUNTER_SNAPSHOT_KEY)
+        mock_query.return_value = {'total_users': 7, 'total_posts': 3}
+        
+        async def read_twice():
+            first = await AnalyticsRepository.get_dashboard_stats()
+            second = await AnalyticsRepository.get_counter_snapshot()
+            return first, second
+        
+        first, second = asyncio.run(read_twice())
+        cache.delete(AnalyticsRepository.COUNTER_SNAPSHOT_KEY)
+        
+        assert mock_query.call_count == 1
+        assert first["total_users"] == 7
+        assert first["total_votes"] == 0
+        assert second["total_posts"] == 3
     
     @patch('api.database.execute_query')
     def test_category_stats(self, mock_query):
@@ -197,18 +347,77 @@ class TestAnalyticsAPI:
         assert response.status_code == 200, response.text
         assert isinstance(response.json(), list)
     
+    @patch('api.app.INTERNAL_API_TOKEN', 'internal-secret')
+    @patch('api.database.execute_query')
+    def test_category_stats_cached(self, mock_query):
+        """Test category stats are cached and X-Cache-Control: no-cache forces a refresh for internal callers"""
+        internal = {"X-Cache-Control": "no-cache", "X-Internal-Token": "internal-secret"}
+        mock_query.return_value = [{"id": "1", "name": "General", "postCount": 10, "totalVotes": 50}]
+        client.get("/api/python/analytics/categories", headers=internal)
+        client.get("/api/python/analytics/categories")
+        assert mock_query.call_count == 1
+        
+        client.get("/api/python/analytics/categories", headers=internal)
+        assert mock_query.call_count == 2
+    
+    @patch('api.app.INTERNAL_API_TOKEN', 'internal-secret')
+    @patch('api.database.execute_query')
+    def test_cache_override_ignored_for_untrusted_callers(self, mock_query):
+        """Test anonymous, wrong-token and non-admin callers cannot force a recomputation"""
+        import json
+        import hmac
+        import base64
+        import hashlib
+        
+        def token(claims: dict) -> str:
+            encode = lambda data: base64.urlsafe_b64encode(json.dumps(data).encode()).rstrip(b"=").decode()
+            signing_input = f"{encode({'alg': 'HS256'})}.{encode(claims)}"
+            signature = hmac.new(b"s3cret", signing_input.encode(), hashlib.sha256).digest()
+            return signing_input + "." + base64.urlsafe_b64encode(signature).rstrip(b"=").decode()
+        
+        mock_query.return_value = [{"id": "1", "name": "General", "postCount": 10, "totalVotes": 50}]
+        with patch("api.rate_limiter.API_JWT_SECRET", "s3cret"):
+            client.get("/api/python/analytics/categories", headers={"X-Cache-Control": "no-cache",
+                                                                    "X-Internal-Token": "internal-secret"})
+            for headers in ({}, {"X-Internal-Token": "guess"},
+                            {"Authorization": f"Bearer {token({'sub': 'u1', 'role': 'PARENT'})}"}):
+                client.get("/api/python/analytics/categories", headers={"X-Cache-Control": "no-cache", **headers})
+            assert mock_query.call_count == 1
+            
+            client.get("/api/python/analytics/categories", headers={
+                "X-Cache-Control": "no-cache", "Authorization": f"Bearer {token({'sub': 'u2', 'role': 'ADMIN'})}"})
+            assert mock_query.call_count == 2
+    
     @patch('api.database.execute_query')
     def test_growth_metrics(self, mock_query):
-        """Test growth metrics endpoint"""
-        mock_query.side_effect = [
-            [{"month": "2023-01-01", "count": 10}], # users
-            [{"month": "2023-01-01", "count": 50}]  # posts
+        """Test growth metrics are summed per month from the daily rollup"""
+        from datetime import date, timedelta
+        today = date.today()
+        last_month = today.replace(day=1) - timedelta(days=1)
+        mock_query.return_value = [
+            {"date": today, "posts": 5, "comments": 0, "new_users": 1, "votes": 0},
+            {"date": last_month, "posts": 20, "comments": 0, "new_users": 4, "votes": 0},
+            {"date": last_month.replace(day=1), "posts": 30, "comments": 0, "new_users": 6, "votes": 0},
         ]
         response = client.get("/api/python/analytics/growth")
         assert response.status_code == 200, response.text
         data = response.json()
-        assert "users_by_month" in data
-        assert "posts_by_month" in data
+        assert mock_query.call_count == 1
+        assert [row["count"] for row in data["users_by_month"]] == [1, 10]
+        assert [row["count"] for row in data["posts_by_month"]] == [5, 50]
+        assert data["posts_by_month"][1]["month"] == last_month.replace(day=1).isoformat()
+    
+    @patch('api.database.execute_query')
+    def test_growth_window_longer_than_backfill_counts_older_days_live(self, mock_query):
+        """Test 12 months of growth are read even where the rollup stops short of them"""
+        import asyncio
+        from api.database import AnalyticsRepository
+        from services.jobs import ROLLUP_BACKFILL_DAYS
+        mock_query.return_value = []
+        asyncio.run(AnalyticsRepository.get_monthly_growth(12))
+        query, params = mock_query.call_args[0]
+        assert 334 <= params[0] <= ROLLUP_BACKFILL_DAYS
+        assert 'day < bounds.rolled_from' in query
 
 
 class TestPostsAPI:
@@ -222,6 +431,8 @@ class TestPostsAPI:
         def query_side_effect(query, params=None, fetch_one=False):
             if "COUNT(*)" in query:
                 return {'count': 1}
+            if "reltuples" in query:
+                return {'estimate': 1}
             return [{
                 "id": "post1", 
                 "title": "Test Post", 
@@ -244,12 +455,43 @@ class TestPostsAPI:
         assert "limit" in data
     
     @patch('api.database.execute_query')
-    def test_trending_posts(self, mock_query):
+    def test_list_posts_keyset_cursor(self, mock_query):
+        """Test a full page returns a cursor that pages by (createdAt, id)"""
+        from datetime import datetime
+        rows = [{"id": f"post{i}", "title": "Post", "voteScore": 0, "status": "ACTIVE",
+                 "isPinned": False, "createdAt": datetime(2023, 1, 10 - i)} for i in range(3)]
+        
+        def query_side_effect(query, params=None, fetch_one=False):
+            if "reltuples" in query:
+                return {'estimate': 1000}
+            return rows
+        mock_query.side_effect = query_side_effect
+        
+        data = client.get("/api/python/posts?limit=2").json()
+        assert [p["id"] for p in data["posts"]] == ["post0", "post1"]
+        assert data["total"] == 1000
+        assert data["total_is_estimate"] is True
+        
+        mock_query.reset_mock()
+        client.get(f"/api/python/posts?limit=2&after={data['next_cursor']}")
+        page_query, params = next(c.args[:2] for c in mock_query.call_args_list if "ORDER BY" in c.args[0])
+        assert '(p."createdAt", p.id) < (%s, %s)' in page_query
+        assert "OFFSET" not in page_query
+        assert params == (datetime(2023, 1, 9), "post1", 3)
+    
+    def test_list_posts_invalid_cursor(self):
+        """Test a malformed cursor is rejected"""
+        response = client.get("/api/python/posts?after=not-a-cursor")
+        assert response.status_code == 400
+    
+    @patch('api.trending.trending_engine.top', new_callable=AsyncMock)
+    def test_trending_posts(self, mock_top):
         """Test trending posts endpoint"""
-        mock_query.return_value = [{"id": "p1", "title": "Trending", "voteScore": 100}]
-        response = client.get("/api/python/posts/trending?limit=10")
+        mock_top.return_value = [{"id": "p1", "title": "Trending", "voteScore": 100, "trendingScore": 4.2}]
+        response = client.get("/api/python/posts/trending?limit=10&category_id=c1")
         assert response.status_code == 200
         assert isinstance(response.json(), list)
+        mock_top.assert_called_once_with(limit=10, category_id="c1")
     
     @patch('api.database.execute_query')
     def test_flagged_posts(self, mock_query):
@@ -318,10 +560,149 @@ class TestGovernanceAPI:
         response = client.get("/api/python/governance/export/nonexistent-user-id")
         assert response.status_code == 404, response.text
     
+    @patch('api.database.AuditRepository.create_log', new_callable=AsyncMock)
+    @patch('api.exports.open_user_export', new_callable=AsyncMock)
+    def test_export_user_data_streams_ndjson(self, mock_open, mock_log):
+        """Test format=ndjson streams one JSON record per line"""
+        import json
+        
+        async def stream():
+            yield b'{"type":"user","data":{"id":"u1"}}\n'
+            yield b'{"type":"post","data":{"id":"p1"}}\n{"type":"post","data":{"id":"p2"}}\n'
+            yield b'{"type":"summary","counts":{"posts":2}}\n'
+        
+        mock_open.return_value = stream()
+        response = client.get("/api/python/governance/export/u1?format=ndjson")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        records = [json.loads(line) for line in response.text.splitlines()]
+        assert [r["type"] for r in records] == ["user", "post", "post", "summary"]
+        assert mock_log.call_args.kwargs["details"]["mode"] == "stream"
+    
+    @patch('api.exports.open_user_export', new_callable=AsyncMock)
+    def test_export_user_data_ndjson_not_found(self, mock_open):
+        """Test streaming export of a missing user is a 404"""
+        mock_open.return_value = None
+        response = client.get("/api/python/governance/export/missing?format=ndjson")
+        assert response.status_code == 404
+    
+    def test_iter_user_export_chunks_cursor_rows(self):
+        """Test the export reads each section through a cursor in prefetch-sized chunks"""
+        import asyncio
+        import json
+        from api.exports import iter_user_export
+        
+        class FakeCursor:
+            def __init__(self, rows):
+                self.rows = rows
+            
+            async def __aiter__(self):
+                for row in self.rows:
+                    yield row
+        
+        sections = {
+            "Post": [{"id": f"p{i}"} for i in range(5)],
+            "Comment": [{"id": "c1"}],
+            "Vote": [],
+        }
+        conn = MagicMock()
+        conn.cursor.side_effect = lambda query, *args, prefetch: FakeCursor(
+            next(rows for table, rows in sections.items() if f'FROM "{table}"' in query))
+        
+        async def collect():
+            counts = {}
+            chunks = [chunk async for chunk in iter_user_export(conn, {"id": "u1"}, prefetch=2,
+                                                                counts=counts)]
+            return chunks, counts
+        
+        chunks, counts = asyncio.run(collect())
+        assert counts == {"posts": 5, "comments": 1, "votes": 0}
+        # user, 3 post chunks (2 + 2 + 1), 1 comment chunk, summary
+        assert len(chunks) == 6
+        records = [json.loads(line) for chunk in chunks for line in chunk.splitlines()]
+        assert records[0] == {"type": "user", "data": {"id": "u1"}}
+        assert records[-1]["counts"] == counts
+        assert all(call.kwargs["prefetch"] == 2 for call in conn.cursor.call_args_list)
+    
+    @patch('api.task_queue.enqueue_task')
+    @patch('api.database.execute_query')
+    def test_create_export_job(self, mock_query, mock_enqueue):
+        """Test large exports can be queued as a background job"""
+        mock_query.return_value = {"id": "u1"}
+        mock_enqueue.return_value = "t123"
+        response = client.post("/api/python/governance/export/u1/jobs")
+        assert response.status_code == 202
+        data = response.json()
+        assert data["task_id"] == "t123"
+        assert data["download_url"].endswith("/export/jobs/t123/download")
+        assert mock_enqueue.call_args.kwargs["lane"] == "async"
+    
+    @patch('api.database.execute_query')
+    def test_create_export_job_user_not_found(self, mock_query):
+        """Test queueing an export for a missing user is a 404"""
+        mock_query.return_value = None
+        response = client.post("/api/python/governance/export/missing/jobs")
+        assert response.status_code == 404
+    
     @patch('api.database.execute_query')
-    def test_retention_stats(self, mock_query):
+    def test_download_export_artifact(self, mock_query):
+        """Test a finished job's artifact downloads from the database in chunks, and pending jobs answer 409"""
+        chunks = {("abc", 0): b"gzip-", ("abc", 1): b"bytes"}
+        mock_query.side_effect = lambda query, params, fetch_one: (
+            {"data": chunks[params[:2]]} if params[:2] in chunks else None)
+        statuses = {
+            "done": {"status": "completed", "result": {"artifact_id": "abc", "compressed_bytes": 10}},
+            "busy": {"status": "running", "result": None},
+            "gone": {"status": "completed", "result": {"artifact_id": "old", "compressed_bytes": 3}},
+        }
+        with patch('api.task_queue.task_queue.get_status', side_effect=statuses.get):
+            response = client.get("/api/python/governance/export/jobs/done/download")
+            assert response.content == b"gzip-bytes"
+            assert response.headers["content-length"] == "10"
+            assert client.get("/api/python/governance/export/jobs/busy/download").status_code == 409
+            assert client.get("/api/python/governance/export/jobs/gone/download").status_code == 410
+            assert client.get("/api/python/governance/export/jobs/nope/download").status_code == 404
+    
+    def test_export_streams_limited_per_worker(self):
+        """Test streams beyond EXPORT_MAX_STREAMS are refused with a 503 instead of queueing on connections"""
+        import asyncio
+        
+        slots = asyncio.Semaphore(1)
+        asyncio.run(slots.acquire())
+        with patch('api.exports._stream_slots', slots), \
+             patch('api.exports.asyncpg.connect', new_callable=AsyncMock) as mock_connect:
+            response = client.get("/api/python/governance/export/u1?format=ndjson")
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "30"
+        mock_connect.assert_not_awaited()
+        assert slots.locked(), "a refused stream must not release a slot it never took"
+    
+    def test_export_stream_uses_own_connection_with_timeouts(self):
+        """Test a stream opens a dedicated connection bounded by statement and idle timeouts"""
+        import asyncio
+        from api.exports import open_user_export
+        
+        conn = MagicMock()
+        conn.transaction.return_value.start = AsyncMock()
+        conn.execute = AsyncMock()
+        conn.fetchrow = AsyncMock(return_value=None)
+        conn.close = AsyncMock()
+        with patch('api.exports.asyncpg.connect', AsyncMock(return_value=conn)), \
+             patch('api.exports._stream_slots', asyncio.Semaphore(1)) as slots:
+            assert asyncio.run(open_user_export("missing")) is None
+            assert not slots.locked()
+        settings = [c.args[0] for c in conn.execute.await_args_list]
+        assert any("statement_timeout" in sql for sql in settings)
+        assert any("idle_in_transaction_session_timeout" in sql for sql in settings)
+        conn.close.assert_awaited_once()
+    
+    @patch('api.database.AnalyticsRepository.get_counter_snapshot')
+    def test_retention_stats(self, mock_snapshot):
         """Test retention statistics endpoint"""
-        mock_query.return_value = {"count": 100} # Mock simple count return
+        mock_snapshot.return_value = {
+            "total_users": 100, "inactive_30d": 40, "inactive_90d": 20,
+            "deleted_posts": 3, "old_audit_logs": 900
+        }
         response = client.get("/api/python/governance/retention-stats")
         assert response.status_code == 200
         data = response.json()
@@ -330,12 +711,57 @@ class TestGovernanceAPI:
         assert "inactive_90d" in data
         assert "deleted_posts" in data
         assert "old_audit_logs" in data
+        assert data["old_audit_logs"] == 900
     
     def test_cleanup_audit_logs_validation(self):
         """Test cleanup requires minimum 30 days"""
         response = client.post("/api/python/governance/cleanup/audit-logs?days=10")
         assert response.status_code == 422
     
+    @patch('api.task_queue.enqueue_task')
+    def test_cleanup_audit_logs_queues_batched_run(self, mock_enqueue):
+        """Test cleanup is queued on the audit_logs retention policy"""
+        mock_enqueue.return_value = "t1"
+        response = client.post("/api/python/governance/cleanup/audit-logs?days=400")
+        assert response.status_code == 202
+        assert response.json()["task_id"] == "t1"
+        assert mock_enqueue.call_args.args[1] == "audit_logs"
+        assert mock_enqueue.call_args.kwargs["days"] == 400
+    
+    @patch('api.task_queue.enqueue_task')
+    def test_run_retention_policy(self, mock_enqueue):
+        """Test retention runs are queued by policy name"""
+        mock_enqueue.return_value = "t2"
+        response = client.post("/api/python/governance/retention/sessions/run?archive=true")
+        assert response.status_code == 202
+        assert response.json()["policy"] == "sessions"
+        assert mock_enqueue.call_args.kwargs["archive"] is True
+    
+    @pytest.mark.parametrize("path,status", [
+        ("nope/run", 404),
+        ("user_data/run", 400),
+        ("audit_logs/run?days=5", 422),
+    ])
+    def test_run_retention_policy_rejected(self, path, status):
+        """Test unknown policies, non-expiring policies and too-short periods are refused"""
+        response = client.post(f"/api/python/governance/retention/{path}")
+        assert response.status_code == status
+    
+    @patch('api.database.execute_query')
+    def test_retention_status(self, mock_query):
+        """Test every policy is listed with its latest run's progress"""
+        mock_query.return_value = [{
+            "jobName": "retention:audit_logs", "status": "RUNNING", "recordsProcessed": 5000,
+            "startedAt": "2026-01-01T00:00:00", "completedAt": None, "errorLog": None,
+            "metadata": '{"deleted": 5000, "batches": 1}'
+        }]
+        response = client.get("/api/python/governance/retention")
+        assert response.status_code == 200
+        policies = {p["name"]: p for p in response.json()["policies"]}
+        assert policies["audit_logs"]["last_run"]["progress"]["batches"] == 1
+        assert policies["sessions"]["last_run"] is None
+        assert policies["user_data"]["purgeable"] is False
+    
     @patch('api.database.execute_query')
     def test_data_catalog(self, mock_query):
         """Test data catalog endpoint"""
@@ -345,6 +771,7 @@ class TestGovernanceAPI:
         data = response.json()
         assert "tables" in data
         assert "retention_policies" in data
+        assert data["retention_policies"]["audit_logs"] == "1 year"
         assert len(data["tables"]) > 0
         
         user_table = next((t for t in data["tables"] if t["name"] == "User"), None)
@@ -352,6 +779,90 @@ class TestGovernanceAPI:
         assert user_table["pii"] is True
 
 
+class TestTasksAPI:
+    """Test background task status endpoint"""
+    
+    def test_task_status(self):
+        """Test a finished task reports its result"""
+        import time
+        from api.task_queue import enqueue_task
+        
+        task_id = enqueue_task(sorted, [3, 1, 2])
+        for _ in range(100):
+            data = client.get(f"/api/python/tasks/{task_id}").json()
+            if data.get("status") == "completed":
+                break
+            time.sleep(0.02)
+        assert data["result"] == [1, 2, 3]
+        assert data["attempts"] == 1
+    
+    def test_task_status_not_found(self):
+        """Test unknown or expired task ids return 404"""
+        response = client.get("/api/python/tasks/does-not-exist")
+        assert response.status_code == 404
+
+
+class TestDatabaseLayer:
+    """Test the asyncpg execution helpers"""
+    
+    def test_placeholders_converted_to_positional(self):
+        """Test psycopg-style placeholders are rewritten for asyncpg"""
+        from api.database import to_asyncpg
+        sql = to_asyncpg('SELECT * FROM "User" WHERE id = %s AND email ILIKE %s LIMIT %s')
+        assert sql == 'SELECT * FROM "User" WHERE id = $1 AND email ILIKE $2 LIMIT $3'
+    
+    @patch('api.database.execute_query')
+    def test_filtered_counts_cached(self, mock_query):
+        """Test filtered totals are counted once and then served from cache"""
+        import asyncio
+        from api.cache import cache
+        from api.database import PostRepository
+        cache.clear()
+        mock_query.return_value = {'count': 7}
+        
+        async def run():
+            return [await PostRepository.get_count(category_id="c1"),
+                    await PostRepository.get_count(category_id="c1"),
+                    await PostRepository.get_count(category_id="c1", exact=True)]
+        
+        assert asyncio.run(run()) == [7, 7, 7]
+        assert mock_query.call_count == 2
+    
+    def test_user_search_patterns(self):
+        """Test search terms are escaped, and short ones match as a prefix"""
+        from api.database import like_pattern, build_user_search
+        assert like_pattern("50%_off") == "%50\\%\\_off%"
+        _, params = build_user_search("jo", limit=21)
+        assert params == ("jo%", "jo%", 10000, 21)
+        _, params = build_user_search("smith", limit=21, offset=20, count_cap=None)
+        assert params == ("%smith%", "%smith%", 21, 20)
+    
+    def test_rowcount_parsed_from_command_tag(self):
+        """Test affected rows are parsed from asyncpg status strings"""
+        from api.database import _rowcount
+        assert _rowcount("UPDATE 3") == 3
+        assert _rowcount("INSERT 0 1") == 1
+        assert _rowcount("") == 0
+    
+    def test_query_metrics_aggregate_by_fingerprint(self):
+        """Test latency metrics group identical statements"""
+        from api.database import QueryMetrics
+        metrics = QueryMetrics()
+        metrics.record('SELECT 1\n   FROM "User"', 2.0)
+        metrics.record('SELECT 1 FROM "User"', 4.0, error=True)
+        stats = metrics.stats()
+        assert stats["queries"] == 2
+        assert stats["errors"] == 1
+        assert stats["top_queries"][0]["calls"] == 2
+        assert stats["top_queries"][0]["avg_ms"] == 3.0
+    
+    def test_stats_endpoint_reports_database(self):
+        """Test API stats expose pool and query metrics"""
+        response = client.get("/api/python/stats")
+        assert response.status_code == 200
+        assert "top_queries" in response.json()["database"]
+
+
 class TestErrorHandling:
     """Test error handling"""
     
@@ -397,6 +908,26 @@ class TestCORSAndHeaders:
         """Test that CORS headers are present"""
         response = client.options("/", headers={"Origin": "http://localhost:5000"})
         assert response.status_code in [200, 204, 405]
+    
+    def test_rate_limit_headers(self):
+        """Test responses carry the policy's X-RateLimit headers"""
+        response = client.get("/api/python/analytics/timeline?days=0",
+                              headers={"X-Forwarded-For": "198.51.100.7"})
+        assert response.headers["X-RateLimit-Limit"] == "100"
+        assert response.headers["X-RateLimit-Remaining"] == "95"
+    
+    def test_expensive_policy_returns_retry_after(self):
+        """Test exhausting a policy bucket returns 429 with Retry-After"""
+        headers = {"X-Forwarded-For": "198.51.100.8"}
+        for _ in range(2):
+            client.post("/api/python/governance/cleanup/audit-logs?days=1", headers=headers)
+        response = client.post("/api/python/governance/cleanup/audit-logs?days=1", headers=headers)
+        assert response.status_code == 429
+        assert response.json()["error"]["code"] == "RATE_LIMITED"
+        assert int(response.headers["Retry-After"]) > 0
+        
+        stats = client.get("/api/python/stats").json()["rate_limiter"]
+        assert stats["policies"]["maintenance"]["blocked"] >= 1
 
 
 if __name__ == "__main__":
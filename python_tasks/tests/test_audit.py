@@ -0,0 +1,165 @@
+"""
+Tests for the buffered audit log writer
+"""
+
+import os
+import sys
+import json
+import asyncio
+import asyncpg
+from unittest.mock import patch, AsyncMock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.audit import AuditWriter, audit_entry, INSERT_AUDIT_BATCH
+
+
+def entries(count: int) -> list:
+    return [audit_entry("DATA_EXPORT", f"u{i}", "user", f"u{i}", {"n": i}) for i in range(count)]
+
+
+class TestAuditWriter:
+    """Test batching, spooling and shutdown flushes"""
+    
+    def test_flush_writes_multi_row_batches(self):
+        """Test buffered entries are written as one insert per batch_size entries"""
+        writer = AuditWriter(batch_size=2, spool_path=None)
+        for entry in entries(5):
+            writer.write(entry)
+        
+        with patch("api.database.execute_write", new_callable=AsyncMock) as mock_write:
+            assert asyncio.run(writer.flush()) == 5
+        
+        assert mock_write.await_count == 3
+        query, params = mock_write.await_args_list[0].args
+        assert query == INSERT_AUDIT_BATCH
+        ids, actions, user_ids = params[0], params[1], params[2]
+        assert len(ids) == 2 and actions == ["DATA_EXPORT", "DATA_EXPORT"] and user_ids == ["u0", "u1"]
+        assert writer.stats()["buffered"] == 0
+    
+    def test_failed_batches_spool_and_replay(self, tmp_path):
+        """Test entries are fsynced to the spool while the database is down and replayed later"""
+        spool = str(tmp_path / "audit.spool")
+        writer = AuditWriter(batch_size=10, spool_path=spool)
+        queued = entries(3)
+        for entry in queued:
+            writer.write(entry)
+        
+        with patch("api.database.execute_write", AsyncMock(side_effect=ConnectionError("down"))):
+            assert asyncio.run(writer.flush()) == 0
+        assert os.path.exists(spool)
+        assert writer.stats()["spooled"] == 3
+        
+        writer.write(entries(1)[0])
+        with patch("api.database.execute_write", new_callable=AsyncMock) as mock_write:
+            assert asyncio.run(writer.flush()) == 4
+        
+        replayed_ids = mock_write.await_args_list[0].args[1][0]
+        assert replayed_ids == [entry["id"] for entry in queued]
+        assert not os.path.exists(spool) and not os.path.exists(spool + ".replay")
+        assert writer.stats()["replayed"] == 3
+    
+    def test_failed_batches_rebuffered_without_spool(self):
+        """Test entries stay in memory for the next flush when spooling is disabled"""
+        writer = AuditWriter(spool_path=None)
+        writer.write(entries(1)[0])
+        with patch("api.database.execute_write", AsyncMock(side_effect=ConnectionError("down"))):
+            asyncio.run(writer.flush())
+        assert writer.stats()["buffered"] == 1
+    
+    def test_poisoned_row_dead_lettered_without_blocking_the_rest(self, tmp_path):
+        """Test a rejected batch is retried row by row and only the bad row is dead-lettered"""
+        spool = str(tmp_path / "audit.spool")
+        dead = str(tmp_path / "audit.dead")
+        writer = AuditWriter(batch_size=10, spool_path=spool, dead_letter_path=dead)
+        queued = entries(3)
+        queued[1]["userId"] = None
+        for entry in queued:
+            writer.write(entry)
+        
+        async def insert(query, params):
+            if None in params[2]:
+                raise asyncpg.exceptions.NotNullViolationError('null value in column "userId"')
+        
+        with patch("api.database.execute_write", AsyncMock(side_effect=insert)) as mock_write:
+            assert asyncio.run(writer.flush()) == 2
+            assert mock_write.await_count == 4
+        
+        assert not os.path.exists(spool)
+        with open(dead) as f:
+            rejected = [json.loads(line) for line in f]
+        assert [row["id"] for row in rejected] == [queued[1]["id"]]
+        assert "userId" in rejected[0]["error"]
+        assert writer.stats()["dead_lettered"] == 1 and writer.stats()["buffered"] == 0
+        
+        writer.write(entries(1)[0])
+        with patch("api.database.execute_write", AsyncMock(side_effect=insert)):
+            assert asyncio.run(writer.flush()) == 1
+    
+    def test_poisoned_spool_replays(self, tmp_path):
+        """Test a spool holding a rejected row is still replayed and removed"""
+        spool = str(tmp_path / "audit.spool")
+        writer = AuditWriter(spool_path=spool, dead_letter_path=None)
+        queued = entries(2)
+        queued[0]["userId"] = None
+        writer._spool(queued)
+        
+        async def insert(query, params):
+            if None in params[2]:
+                raise asyncpg.exceptions.ForeignKeyViolationError("violates foreign key constraint")
+        
+        with patch("api.database.execute_write", AsyncMock(side_effect=insert)):
+            assert asyncio.run(writer.flush()) == 1
+        assert not writer._spool_pending()
+        assert writer.stats()["dead_lettered"] == 1
+    
+    def test_buffer_bounded(self):
+        """Test the oldest entries are dropped beyond max_buffer"""
+        writer = AuditWriter(spool_path=None, max_buffer=3)
+        for entry in entries(5):
+            writer.write(entry)
+        assert writer.stats()["buffered"] == 3
+        assert writer.stats()["dropped"] == 2
+    
+    def test_full_batch_wakes_flusher_and_stop_flushes(self):
+        """Test a full batch is written before the interval, and stop() writes the rest"""
+        writer = AuditWriter(flush_interval=60, batch_size=2, spool_path=None)
+        
+        async def run(mock_write):
+            writer.start()
+            for entry in entries(2):
+                writer.write(entry)
+            await asyncio.sleep(0.05)
+            written_early = mock_write.await_count
+            writer.write(entries(1)[0])
+            await writer.stop()
+            return written_early
+        
+        with patch("api.database.execute_write", new_callable=AsyncMock) as mock_write:
+            assert asyncio.run(run(mock_write)) == 1
+            assert mock_write.await_count == 2
+        assert not writer.running
+
+
+class TestCreateLog:
+    """Test AuditRepository.create_log routes through the writer"""
+    
+    def test_create_log_queues_when_writer_running(self):
+        """Test the request path only appends to the buffer"""
+        from api.database import AuditRepository
+        writer = AuditWriter(spool_path=None)
+        writer._task = object()
+        with patch("api.audit.audit_writer", writer), \
+             patch("api.database.execute_write", new_callable=AsyncMock) as mock_write:
+            asyncio.run(AuditRepository.create_log("LOGIN", user_id="u1", details={"ip": "x"}))
+        mock_write.assert_not_awaited()
+        assert writer.stats()["buffered"] == 1
+    
+    def test_create_log_writes_directly_without_writer(self):
+        """Test scripts without the API lifespan still insert immediately"""
+        from api.database import AuditRepository
+        with patch("api.database.execute_write", new_callable=AsyncMock) as mock_write:
+            asyncio.run(AuditRepository.create_log("LOGIN", user_id="u1"))
+        query, params = mock_write.await_args.args
+        assert query == INSERT_AUDIT_BATCH
+        assert params[1] == ["LOGIN"]
@@ -0,0 +1,400 @@
+"""
+Tests for the Python API caching layer
+"""
+
+import os
+import sys
+import time
+import asyncio
+import fnmatch
+import threading
+import pytest
+from datetime import datetime, date, timezone
+from decimal import Decimal
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.cache import InMemoryCache, HybridCache, cached, invalidates
+from api.codecs import available_codecs, get_codec, CompressedCodec, JSONCodec, MsgpackCodec
+
+
+class TestInMemoryCache:
+    """Test LRU/TTL eviction in the in-memory cache"""
+    
+    def test_lru_eviction_keeps_recently_used(self):
+        """Test the least recently used key is evicted first"""
+        cache = InMemoryCache(max_size=2, sweep_interval=0)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        assert cache.get("a") == 1
+        cache.set("c", 3)
+        
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+        assert cache.stats()["evictions"] == 1
+    
+    @patch('api.cache.time.time')
+    def test_expired_entries_swept(self, mock_time):
+        """Test expired entries are reclaimed and counted"""
+        mock_time.return_value = 1000.0
+        cache = InMemoryCache(sweep_interval=0)
+        cache.set("short", "x", ttl=1)
+        cache.set("long", "y", ttl=60)
+        
+        mock_time.return_value = 1010.0
+        assert cache.sweep() == 1
+        assert cache.get("long") == "y"
+        stats = cache.stats()
+        assert stats["size"] == 1
+        assert stats["expirations"] == 1
+    
+    def test_byte_budget_enforced(self):
+        """Test the cache evicts to stay within max_bytes"""
+        cache = InMemoryCache(max_size=1000, max_bytes=2048, sweep_interval=0)
+        for i in range(20):
+            cache.set(f"key{i}", "v" * 200)
+        
+        stats = cache.stats()
+        assert stats["bytes"] <= 2048
+        assert stats["evictions"] > 0
+        assert cache.get("key19") is not None
+    
+    def test_oversized_value_not_cached(self):
+        """Test a value larger than the whole budget is skipped"""
+        cache = InMemoryCache(max_bytes=512, sweep_interval=0)
+        cache.set("big", "v" * 4096)
+        assert cache.get("big") is None
+        assert cache.stats()["bytes"] == 0
+    
+    def test_overwrite_replaces_size(self):
+        """Test overwriting a key does not double count its bytes"""
+        cache = InMemoryCache(sweep_interval=0)
+        cache.set("k", "v" * 100)
+        first = cache.stats()["bytes"]
+        cache.set("k", "v" * 100)
+        assert cache.stats()["bytes"] == first
+        assert cache.stats()["size"] == 1
+    
+    def test_clear_with_pattern(self):
+        """Test pattern clears only drop matching keys"""
+        cache = InMemoryCache(sweep_interval=0)
+        cache.set("analytics:a", 1)
+        cache.set("analytics:b", 2)
+        cache.set("users:a", 3)
+        
+        assert cache.clear("analytics:*") == 2
+        assert cache.get("users:a") == 3
+        assert cache.get("analytics:a") is None
+
+
+class TestTagInvalidation:
+    """Test dependency tags on cache entries"""
+    
+    def test_invalidate_tags_removes_tagged_entries(self):
+        """Test only entries carrying the tag are dropped"""
+        cache = InMemoryCache(sweep_interval=0)
+        cache.set("posts", [1], tags=["table:Post"])
+        cache.set("profile", {"id": "u1"}, tags=["table:User", "user:u1"])
+        cache.set("other", 3)
+        
+        assert cache.invalidate_tags(["user:u1"]) == 1
+        assert cache.get("profile") is None
+        assert cache.get("posts") == [1]
+        assert cache.get("other") == 3
+    
+    def test_evicted_entries_leave_tag_index(self):
+        """Test the tag index does not keep evicted keys"""
+        cache = InMemoryCache(max_size=1, sweep_interval=0)
+        cache.set("a", 1, tags=["table:Post"])
+        cache.set("b", 2, tags=["table:User"])
+        assert "table:Post" not in cache._tags
+    
+    def test_invalidates_decorator_formats_tags(self):
+        """Test @invalidates drops entries cached under argument-formatted tags"""
+        from api.cache import cache as shared
+        shared.clear()
+        counter = {"n": 0}
+        
+        @cached(ttl=60, key_prefix="test", tags=["table:Post", "post:{post_id}"])
+        async def read_post(post_id: str):
+            counter["n"] += 1
+            return counter["n"]
+        
+        @invalidates("post:{post_id}")
+        async def pin_post(post_id: str, pinned: bool):
+            return pinned
+        
+        async def run():
+            return [await read_post("p1"), await read_post("p1"),
+                    await pin_post("p1", pinned=True), await read_post("p1")]
+        
+        assert asyncio.run(run()) == [1, 1, True, 2]
+
+
+class FakeRedisCache:
+    """Dict-backed stand-in for RedisCache that records published invalidations"""
+    
+    def __init__(self):
+        self.store = {}
+        self.published = []
+        self.subscriber = None
+        self.tag_subscriber = None
+        self.gets = 0
+    
+    is_connected = True
+    
+    def get(self, key):
+        self.gets += 1
+        return self.store.get(key)
+    
+    def set(self, key, value, ttl=None, tags=None):
+        self.store[key] = value
+        return True
+    
+    def delete(self, key):
+        return self.store.pop(key, None) is not None
+    
+    def clear(self, pattern="*"):
+        keys = [k for k in self.store if fnmatch.fnmatchcase(k, pattern)]
+        for k in keys:
+            del self.store[k]
+        return len(keys)
+    
+    def invalidate_tags(self, tags):
+        return 0
+    
+    def publish_invalidation(self, pattern="", tags=None):
+        self.published.append(tags or pattern)
+    
+    async def ainvalidate_tags(self, tags):
+        return 0
+    
+    async def apublish_invalidation(self, pattern="", tags=None):
+        self.published.append(("async", tags or pattern))
+    
+    def subscribe_invalidations(self, callback, tag_callback=None):
+        self.subscriber = callback
+        self.tag_subscriber = tag_callback
+    
+    def stats(self):
+        return {"type": "redis", "gets": self.gets}
+
+
+def make_tiered_cache():
+    fake = FakeRedisCache()
+    with patch('api.cache.RedisCache', return_value=fake):
+        cache = HybridCache(redis_url="redis://fake", tiered=True, l1_ttl=5)
+    return cache, fake
+
+
+class TestTieredCache:
+    """Test the in-process L1 in front of Redis"""
+    
+    def test_l1_serves_repeat_reads(self):
+        """Test a hot key is read from Redis once, then from L1"""
+        cache, fake = make_tiered_cache()
+        fake.store["k"] = {"v": 1}
+        
+        assert cache.get("k") == {"v": 1}
+        assert cache.get("k") == {"v": 1}
+        assert fake.gets == 1
+        
+        stats = cache.stats()
+        assert stats["type"] == "tiered"
+        assert stats["l1"]["hits"] == 1
+        assert stats["l1"]["misses"] == 1
+    
+    def test_invalidation_published_and_applied(self):
+        """Test clears are broadcast and remote invalidations drop L1 copies"""
+        cache, fake = make_tiered_cache()
+        cache.set("analytics:x", 1)
+        cache.set("users:y", 2)
+        
+        cache.clear("analytics:*")
+        assert fake.published == ["analytics:*"]
+        
+        fake.store["users:y"] = 3
+        fake.subscriber("users:*")
+        assert cache.get("users:y") == 3
+    
+    def test_tag_invalidation_empties_l1(self):
+        """Test tag invalidations are broadcast and drop this worker's L1"""
+        cache, fake = make_tiered_cache()
+        cache.set("posts:trending", [1], tags=["table:Post"])
+        fake.store["posts:trending"] = [2]
+        
+        cache.invalidate_tags(["table:Post"])
+        assert fake.published == [["table:Post"]]
+        assert cache.get("posts:trending") == [2]
+    
+    def test_tag_listeners_hear_local_and_remote_invalidations(self):
+        """Test registered listeners see this worker's and other workers' tag invalidations"""
+        seen = []
+        for tiered in (True, False):
+            fake = FakeRedisCache()
+            with patch('api.cache.RedisCache', return_value=fake):
+                cache = HybridCache(redis_url="redis://fake", tiered=tiered)
+            cache.add_tag_listener(seen.append)
+            
+            cache.invalidate_tags(["user:1"])
+            fake.tag_subscriber(["user:2"])
+            assert fake.published == [["user:1"]]
+        assert seen == [["user:1"], ["user:2"]] * 2
+    
+    def test_async_tag_invalidation_publishes_without_blocking(self):
+        """Test ainvalidate_tags broadcasts through the async client, not the blocking one"""
+        cache, fake = make_tiered_cache()
+        cache.set("posts:trending", [1], tags=["table:Post"])
+        fake.store["posts:trending"] = [2]
+        
+        asyncio.run(cache.ainvalidate_tags(["table:Post"]))
+        assert fake.published == [("async", ["table:Post"])]
+        assert cache.get("posts:trending") == [2]
+
+
+class TestCachedDecorator:
+    """Test stampede protection in the cached decorator"""
+    
+    def setup_method(self):
+        from api.cache import cache
+        cache.clear()
+    
+    def test_concurrent_misses_compute_once(self):
+        """Test single-flight: concurrent callers share one computation"""
+        calls = []
+        
+        @cached(ttl=60, key_prefix="test")
+        def slow_stats():
+            calls.append(1)
+            time.sleep(0.2)
+            return {"total": 42}
+        
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(slow_stats())) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        
+        assert len(calls) == 1
+        assert results == [{"total": 42}] * 8
+    
+    def test_stale_value_served_while_refreshing(self):
+        """Test expired entries inside stale_ttl are returned and refreshed in the background"""
+        counter = {"n": 0}
+        
+        @cached(ttl=60, key_prefix="test", stale_ttl=300, beta=0)
+        def numbers():
+            counter["n"] += 1
+            return counter["n"]
+        
+        assert numbers() == 1
+        with patch('api.cache.time.time', return_value=time.time() + 120):
+            assert numbers() == 1
+        
+        for _ in range(50):
+            if counter["n"] == 2:
+                break
+            time.sleep(0.02)
+        assert counter["n"] == 2
+    
+    def test_early_refresh_recomputes_before_expiry(self):
+        """Test probabilistic early expiry triggers a background recompute near the deadline"""
+        counter = {"n": 0}
+        
+        @cached(ttl=60, key_prefix="test", beta=1.0)
+        def value():
+            counter["n"] += 1
+            time.sleep(0.05)
+            return counter["n"]
+        
+        assert value() == 1
+        assert value() == 1
+        near_expiry = time.time() + 59.5
+        with patch('api.cache.random.random', return_value=0.999999), \
+             patch('api.cache.time.time', return_value=near_expiry):
+            assert value() == 1
+        
+        for _ in range(50):
+            if counter["n"] == 2:
+                break
+            time.sleep(0.02)
+        assert counter["n"] == 2
+    
+    def test_coroutine_results_cached(self):
+        """Test async functions are awaited once and concurrent callers share the result"""
+        calls = []
+        
+        @cached(ttl=60, key_prefix="test")
+        async def category_stats(limit: int = 10):
+            calls.append(limit)
+            await asyncio.sleep(0.1)
+            return [{"id": "c1", "postCount": limit}]
+        
+        async def run():
+            first = await asyncio.gather(*(category_stats(limit=5) for _ in range(5)))
+            again = await category_stats(limit=5)
+            return first, again
+        
+        first, again = asyncio.run(run())
+        assert calls == [5]
+        assert all(r == [{"id": "c1", "postCount": 5}] for r in first)
+        assert again == first[0]
+    
+    def test_cache_control_overrides(self):
+        """Test per-call no-cache recomputes and no-store bypasses the cache"""
+        counter = {"n": 0}
+        
+        @cached(ttl=60, key_prefix="test")
+        async def value():
+            counter["n"] += 1
+            return counter["n"]
+        
+        async def run():
+            return [
+                await value(),
+                await value(),
+                await value(cache_control="no-cache"),
+                await value(),
+                await value(cache_control="no-store"),
+                await value(),
+            ]
+        
+        assert asyncio.run(run()) == [1, 1, 2, 2, 3, 2]
+
+
+class TestCodecs:
+    """Test typed round-tripping through the Redis codecs"""
+    
+    PAYLOAD = [{
+        "id": "u1",
+        "createdAt": datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc),
+        "date": date(2024, 5, 1),
+        "totalScore": Decimal("12.50"),
+        "tags": ["a", "b"],
+        "lastLoginAt": None
+    }]
+    
+    def test_all_codecs_round_trip_types(self):
+        """Test datetime, date and Decimal survive every available codec"""
+        for codec in available_codecs().values():
+            framed = CompressedCodec(codec, threshold=0)
+            assert framed.loads(framed.dumps(self.PAYLOAD)) == self.PAYLOAD, codec.name
+    
+    def test_large_values_compressed(self):
+        """Test payloads above the threshold are compressed and still decode"""
+        codec = get_codec("json", compress_threshold=256)
+        payload = self.PAYLOAD * 100
+        encoded = codec.dumps(payload)
+        assert encoded[0] & CompressedCodec.COMPRESSED_FLAG
+        assert len(encoded) < len(JSONCodec().dumps(payload))
+        assert codec.loads(encoded) == payload
+    
+    def test_foreign_codec_rejected(self):
+        """Test a value written by another codec is not misread"""
+        written = CompressedCodec(JSONCodec(), threshold=0).dumps({"a": 1})
+        reader = CompressedCodec(MsgpackCodec(), threshold=0)
+        with pytest.raises(ValueError):
+            reader.loads(written)
@@ -31,3 +31,44 @@ class TestPrivacyService:
         assert redacted == text
         assert len(findings) == 0
         assert risk == RiskLevel.LOW
+
+    def test_all_types_redacted_in_one_pass(self, privacy_service):
+        text = "Email jo@example.org, SSN 123-45-6789, call 555 123 4567 or 555.987.6543 on 3/4/21."
+        redacted, findings, risk = privacy_service.scan_and_redact(text)
+
+        counts = {f['type']: f['count'] for f in findings}
+        assert counts == {'SSN': 1, 'DOB': 1, 'PHONE': 2, 'EMAIL': 1}
+        assert [f['type'] for f in findings] == ['SSN', 'DOB', 'PHONE', 'EMAIL']
+        assert redacted == ("Email [REDACTED_EMAIL], SSN XXX-XX-XXXX, call (XXX) XXX-XXXX "
+                            "or (XXX) XXX-XXXX on XX/XX/XXXX.")
+        assert risk == RiskLevel.HIGH
+
+    def test_overlapping_identifiers_counted_once(self, privacy_service):
+        redacted, findings, _ = privacy_service.scan_and_redact("MRN: 1234567890")
+
+        assert redacted == "MRN: [REDACTED]"
+        assert findings == [{'type': 'MRN', 'count': 1, 'confidence': 'HIGH'}]
+
+    def test_scan_many_matches_single_scans(self, privacy_service):
+        texts = ["SSN: 123-45-6789", "Hello world", "DOB 01/01/1980, phone 555-123-4567", ""]
+        results = privacy_service.scan_many(texts, action_id="batch")
+
+        assert results == [privacy_service.scan_and_redact(text) for text in texts]
+
+    def test_scan_many_audits_once_per_batch(self, privacy_service, monkeypatch):
+        events = []
+        monkeypatch.setattr(privacy_service, "_log_audit_event", lambda **kwargs: events.append(kwargs))
+
+        privacy_service.scan_many(["SSN: 123-45-6789", "clean", "x@y.io"], action_id="batch")
+
+        assert len(events) == 1
+        assert events[0]['findings_count'] == 2
+        assert events[0]['risk_level'] == RiskLevel.HIGH
+
+    def test_windowed_scan_matches_full_text_scan(self, privacy_service):
+        scanner = privacy_service.scanner
+        texts = ["notes\nMRN:\t123456789 and (555) 123-4567", "a 1 b 2 MRN: x 555 123\n4567",
+                 "id=jo.doe+kid@mail.example.com;dob=12/3/2019", "MRN: 12345", "no identifiers here"]
+        for text in texts:
+            expected = scanner.regex.sub(lambda m: scanner.masks[m.lastgroup], text)
+            assert scanner.scan(text)[0] == expected
@@ -0,0 +1,233 @@
+"""
+Tests for the API rate limiter
+"""
+
+import os
+import sys
+import time
+import asyncio
+from unittest.mock import patch, MagicMock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from api.rate_limiter import RateLimiter, RATE_LIMIT_POLICIES, match_policy
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+    
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    fake = FakeClock()
+    with patch("api.rate_limiter.time.monotonic", fake):
+        yield fake
+
+
+class TestShardedRateLimiter:
+    """Test the sharded bucket store"""
+    
+    def test_capacity_and_refill(self, clock):
+        """Test a bucket drains to zero and refills over time"""
+        limiter = RateLimiter(default_capacity=3, default_refill_rate=1, sweep_interval=0)
+        assert [limiter.is_allowed("a") for _ in range(4)] == [True, True, True, False]
+        
+        clock.now += 1
+        assert limiter.is_allowed("a")
+        assert not limiter.is_allowed("a")
+        assert limiter.is_allowed("b")
+    
+    def test_lru_cap_evicts_oldest(self, clock):
+        """Test the tracked key count never exceeds the cap"""
+        limiter = RateLimiter(default_capacity=1, shards=1, max_keys=2, sweep_interval=0)
+        limiter.is_allowed("a")
+        limiter.is_allowed("b")
+        limiter.is_allowed("a")
+        limiter.is_allowed("c")
+        
+        stats = limiter.stats()
+        assert stats["buckets"] == 2
+        assert stats["evictions"] == 1
+        # "a" was touched more recently than "b", so it kept its drained bucket
+        assert not limiter.is_allowed("a")
+    
+    def test_idle_buckets_expire(self, clock):
+        """Test cleanup drops only buckets idle past idle_ttl"""
+        limiter = RateLimiter(default_capacity=1, idle_ttl=60, sweep_interval=0)
+        limiter.is_allowed("old")
+        clock.now += 50
+        limiter.is_allowed("recent")
+        clock.now += 20
+        
+        assert limiter.cleanup() == 1
+        assert limiter.stats()["buckets"] == 1
+        assert limiter.stats()["expirations"] == 1
+    
+    def test_full_shard_reclaims_idle_before_evicting(self, clock):
+        """Test an idle key is reclaimed instead of evicting a live one"""
+        limiter = RateLimiter(shards=1, max_keys=1, idle_ttl=10, sweep_interval=0)
+        limiter.is_allowed("a")
+        clock.now += 11
+        limiter.is_allowed("b")
+        
+        stats = limiter.stats()
+        assert stats["evictions"] == 0
+        assert stats["expirations"] == 1
+    
+    def test_shards_must_be_power_of_two(self):
+        """Test shard counts that cannot be masked are rejected"""
+        with pytest.raises(ValueError):
+            RateLimiter(shards=12)
+
+
+class FakeGCRAScript:
+    """Stands in for the registered Lua script, recording calls"""
+    
+    def __init__(self, results=None, error=None):
+        self.results = list(results or [])
+        self.error = error
+        self.calls = []
+    
+    def __call__(self, keys, args):
+        self.calls.append((keys, args))
+        if self.error is not None:
+            raise self.error
+        return self.results.pop(0)
+
+
+def redis_limiter(script, **kwargs) -> RateLimiter:
+    limiter = RateLimiter(default_capacity=100, default_refill_rate=10, sweep_interval=0,
+                          redis_url="redis://fake", **kwargs)
+    limiter._script = script
+    return limiter
+
+
+class TestRedisRateLimiter:
+    """Test the shared GCRA mode with its local pre-check and fallback"""
+    
+    def test_precheck_admits_locally_and_charges_debt(self, clock):
+        """Test clients far from their limit skip Redis until the local allowance is spent"""
+        script = FakeGCRAScript(results=[[1, 99, 0], [1, 92, 0]])
+        limiter = redis_limiter(script)
+        
+        assert all(limiter.is_allowed("a") for _ in range(10))
+        assert len(script.calls) == 1
+        
+        assert limiter.is_allowed("a")
+        assert len(script.calls) == 2
+        keys, args = script.calls[1]
+        assert keys == ["neurokid:ratelimit:a"]
+        assert args == [100.0, 100, 1, 9]
+        assert limiter.stats()["prechecked"] == 9
+    
+    def test_sync_interval_bounds_local_admission(self, clock):
+        """Test a stale Redis answer is not trusted"""
+        script = FakeGCRAScript(results=[[1, 99, 0], [1, 98, 0]])
+        limiter = redis_limiter(script)
+        limiter.is_allowed("a")
+        clock.now += 2
+        limiter.is_allowed("a")
+        assert len(script.calls) == 2
+    
+    def test_rejection_is_cached_until_retry_after(self, clock):
+        """Test a rejected key is refused locally until Redis would admit it"""
+        script = FakeGCRAScript(results=[[0, 0, 500], [1, 0, 0]])
+        limiter = redis_limiter(script)
+        
+        assert not limiter.is_allowed("a")
+        assert not limiter.is_allowed("a")
+        assert len(script.calls) == 1
+        
+        clock.now += 0.5
+        assert limiter.is_allowed("a")
+        assert len(script.calls) == 2
+    
+    def test_falls_back_to_local_buckets(self, clock):
+        """Test Redis errors fall back to local limiting and back off before retrying"""
+        script = FakeGCRAScript(error=ConnectionError("down"))
+        limiter = redis_limiter(script, redis_retry_interval=5)
+        
+        assert limiter.is_allowed("a", capacity=1)
+        assert not limiter.is_allowed("a", capacity=1)
+        assert len(script.calls) == 1
+        stats = limiter.stats()
+        assert stats["fallbacks"] == 2
+        assert stats["redis_available"] is False
+        
+        clock.now += 5
+        limiter.is_allowed("a", capacity=1)
+        assert len(script.calls) == 2
+    
+    def test_async_check_awaits_script(self, clock):
+        """Test ais_allowed goes through the async script"""
+        script = FakeGCRAScript(results=[[0, 0, 100]])
+        
+        async def async_script(keys, args):
+            return script(keys, args)
+        
+        limiter = redis_limiter(None)
+        limiter._async_script = async_script
+        assert asyncio.run(limiter.ais_allowed("a")) is False
+        assert len(script.calls) == 1
+
+
+class TestRateLimitPolicies:
+    """Test the route policy table and decision headers"""
+    
+    def test_routes_map_to_policy_and_cost(self):
+        """Test templated routes resolve to their policy and cost"""
+        policy, cost = match_policy("GET", "/api/python/analytics/top-contributors")
+        assert (policy.name, cost) == ("api", 10)
+        policy, cost = match_policy("GET", "/api/python/governance/export/ckv123")
+        assert (policy.name, cost) == ("export", 5)
+        policy, cost = match_policy("DELETE", "/api/python/users/ckv123")
+        assert policy.name == "moderation"
+        policy, cost = match_policy("GET", "/api/python/unknown")
+        assert (policy.name, cost) == ("api", 1)
+    
+    def test_identity_policies_key_on_verified_subject(self):
+        """Test per-identity policies key on a verified token's subject, and on the IP otherwise"""
+        import json
+        import hmac
+        import base64
+        import hashlib
+        
+        def token(claims: dict, secret: str = "s3cret") -> str:
+            encode = lambda data: base64.urlsafe_b64encode(json.dumps(data).encode()).rstrip(b"=").decode()
+            signing_input = f"{encode({'alg': 'HS256', 'typ': 'JWT'})}.{encode(claims)}"
+            signature = hmac.new(secret.encode(), signing_input.encode(), hashlib.sha256).digest()
+            return signing_input + "." + base64.urlsafe_b64encode(signature).rstrip(b"=").decode()
+        
+        def key(policy: str, bearer: str) -> str:
+            request = MagicMock()
+            request.headers = {"Authorization": f"Bearer {bearer}", "X-Forwarded-For": "203.0.113.1"}
+            return RATE_LIMIT_POLICIES[policy].key(request)
+        
+        with patch("api.rate_limiter.API_JWT_SECRET", "s3cret"):
+            assert key("api", token({"sub": "u1"})) == "api:203.0.113.1"
+            assert key("export", token({"sub": "u1", "exp": time.time() + 60})) == "export:user:u1"
+            assert key("export", token({"sub": "u1", "iat": 1})) == "export:user:u1"
+            assert key("export", token({"sub": "u1"}, secret="forged")) == "export:203.0.113.1"
+            assert key("export", token({"sub": "u1", "exp": time.time() - 1})) == "export:203.0.113.1"
+            assert key("export", "made-up-token") == "export:203.0.113.1"
+        
+        assert key("export", token({"sub": "u1"})) == "export:203.0.113.1"
+    
+    def test_cost_weighted_decision_headers(self, clock):
+        """Test route costs draw down the shared bucket and shape the headers"""
+        limiter = RateLimiter(sweep_interval=0)
+        decision = limiter.check("api:a", tokens=10, capacity=20, refill_rate=2, policy="api")
+        assert decision.headers() == {"X-RateLimit-Limit": "20", "X-RateLimit-Remaining": "10",
+                                      "X-RateLimit-Reset": "5"}
+        limiter.check("api:a", tokens=10, capacity=20, refill_rate=2, policy="api")
+        
+        decision = limiter.check("api:a", tokens=3, capacity=20, refill_rate=2, policy="api")
+        assert not decision.allowed
+        assert decision.headers()["Retry-After"] == "2"
+        assert limiter.stats()["policies"] == {"api": {"allowed": 2, "blocked": 1}}
@@ -0,0 +1,170 @@
+"""
+Tests for the batched data retention engine
+"""
+
+import os
+import sys
+import json
+import gzip
+import asyncio
+import asyncpg
+import pytest
+from unittest.mock import patch, AsyncMock, MagicMock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.retention import RETENTION_POLICIES, delete_batch_sql, get_policy, run_retention
+
+
+class FakeTransaction:
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+
+def fake_connection(batches: list, last_run: dict = None) -> MagicMock:
+    """asyncpg connection stand-in whose batch DELETEs remove the given row counts in turn"""
+    conn = MagicMock()
+    conn.transaction.return_value = FakeTransaction()
+    conn.fetchval = AsyncMock(return_value=True)
+    conn.fetchrow = AsyncMock(return_value=last_run)
+    conn.is_closed.return_value = False
+    conn.close = AsyncMock()
+    remaining = list(batches)
+    
+    async def execute(sql, *args):
+        if sql.lstrip().startswith("DELETE"):
+            return f"DELETE {remaining.pop(0)}"
+        return "OK"
+    
+    async def fetch(sql, *args):
+        return [{"row": json.dumps({"id": f"a{i}"})} for i in range(remaining.pop(0))]
+    
+    conn.execute = AsyncMock(side_effect=execute)
+    conn.fetch = AsyncMock(side_effect=fetch)
+    return conn
+
+
+def saved_statuses(conn: MagicMock) -> list:
+    return [c.args[2] for c in conn.execute.call_args_list if 'UPDATE "JobExecution"' in c.args[0]]
+
+
+class TestPolicies:
+    """Test the retention policy table"""
+    
+    def test_batch_sql_deletes_by_ctid_with_a_limit(self):
+        """Test each batch is a bounded ctid delete on the policy's column"""
+        sql = delete_batch_sql(RETENTION_POLICIES["audit_logs"], "$1", "$2")
+        assert 'DELETE FROM "AuditLog" WHERE ctid = ANY(ARRAY(' in sql
+        assert '"createdAt" < $1 LIMIT $2' in sql
+        assert "RETURNING" not in sql
+        assert "RETURNING to_jsonb" in delete_batch_sql(RETENTION_POLICIES["sessions"], ":c", ":n", True)
+    
+    def test_policies_without_age_are_not_purgeable(self):
+        """Test policies kept until an explicit request cannot be run"""
+        with pytest.raises(ValueError):
+            get_policy("user_data")
+        with pytest.raises(KeyError):
+            get_policy("nope")
+        assert get_policy("sessions").table == "UserSession"
+
+
+class TestRunRetention:
+    """Test batched, resumable runs"""
+    
+    def test_deletes_until_a_short_batch(self):
+        """Test batches continue while full and the run finishes on a short one"""
+        conn = fake_connection([100, 100, 40])
+        with patch("api.retention.asyncpg.connect", AsyncMock(return_value=conn)):
+            progress = asyncio.run(run_retention("sessions", batch_size=100, pause=0))
+        
+        assert progress["deleted"] == 240
+        assert progress["batches"] == 3
+        assert progress["complete"] is True
+        assert saved_statuses(conn) == ["RUNNING", "RUNNING", "SUCCESS"]
+        conn.close.assert_awaited_once()
+    
+    def test_max_batches_leaves_run_resumable(self):
+        """Test a run stopped early stays RUNNING and the next one reuses its cutoff"""
+        conn = fake_connection([100, 100])
+        with patch("api.retention.asyncpg.connect", AsyncMock(return_value=conn)):
+            first = asyncio.run(run_retention("sessions", batch_size=100, pause=0, max_batches=2))
+        assert first["complete"] is False
+        assert saved_statuses(conn) == ["RUNNING", "RUNNING"]
+        
+        last_run = {"id": first["run_id"], "status": "RUNNING", "metadata": json.dumps(first)}
+        conn = fake_connection([7], last_run=last_run)
+        with patch("api.retention.asyncpg.connect", AsyncMock(return_value=conn)):
+            second = asyncio.run(run_retention("sessions", batch_size=100, pause=0))
+        assert second["resumed"] is True
+        assert second["run_id"] == first["run_id"]
+        assert second["cutoff"] == first["cutoff"]
+        assert second["deleted"] == 207
+        assert not any('INSERT INTO "JobExecution"' in c.args[0] for c in conn.execute.call_args_list)
+    
+    def test_resume_with_different_period_starts_new_run(self):
+        """Test an unfinished run is superseded, not resumed, when the retention period changed"""
+        first = {"policy": "sessions", "run_id": "old", "days": 30, "cutoff": "2020-01-01T00:00:00",
+                 "deleted": 100, "batches": 1, "archive": None, "complete": False, "resumed": False}
+        last_run = {"id": "old", "status": "RUNNING", "metadata": json.dumps(first)}
+        conn = fake_connection([5], last_run=last_run)
+        with patch("api.retention.asyncpg.connect", AsyncMock(return_value=conn)):
+            progress = asyncio.run(run_retention("sessions", days=60, batch_size=100, pause=0))
+        
+        assert progress["resumed"] is False
+        assert progress["run_id"] != "old"
+        assert progress["days"] == 60 and progress["deleted"] == 5
+        superseded = [c.args for c in conn.execute.call_args_list if 'UPDATE "JobExecution"' in c.args[0]][0]
+        assert superseded[1:3] == ("old", "FAILED")
+    
+    def test_completed_run_audited_as_system_user(self):
+        """Test the cleanup audit row is attributed to the system account"""
+        conn = fake_connection([3])
+        with patch("api.retention.asyncpg.connect", AsyncMock(return_value=conn)):
+            asyncio.run(run_retention("sessions", batch_size=100, pause=0))
+        
+        audit = [c.args for c in conn.execute.call_args_list if 'INSERT INTO "AuditLog"' in c.args[0]]
+        assert len(audit) == 1 and audit[0][1] == "system"
+    
+    def test_failed_audit_fails_the_run(self):
+        """Test a purge whose audit insert fails is saved as FAILED so the next run retries it"""
+        conn = fake_connection([3])
+        execute = conn.execute.side_effect
+        
+        async def failing_audit(sql, *args):
+            if 'INSERT INTO "AuditLog"' in sql:
+                raise asyncpg.exceptions.ForeignKeyViolationError("violates foreign key constraint")
+            return await execute(sql, *args)
+        
+        conn.execute = AsyncMock(side_effect=failing_audit)
+        with patch("api.retention.asyncpg.connect", AsyncMock(return_value=conn)):
+            with pytest.raises(asyncpg.exceptions.ForeignKeyViolationError):
+                asyncio.run(run_retention("sessions", batch_size=100, pause=0))
+        assert saved_statuses(conn) == ["SUCCESS", "FAILED"]
+    
+    def test_archives_rows_before_delete(self, tmp_path):
+        """Test archived runs write every deleted row to a gzip NDJSON file"""
+        conn = fake_connection([3, 1])
+        with patch("api.retention.asyncpg.connect", AsyncMock(return_value=conn)), \
+             patch("api.retention.RETENTION_ARCHIVE_DIR", str(tmp_path)):
+            progress = asyncio.run(run_retention("audit_logs", batch_size=3, pause=0))
+        
+        with gzip.open(progress["archive"], "rt") as archive:
+            rows = [json.loads(line) for line in archive]
+        assert len(rows) == progress["deleted"] == 4
+    
+    def test_refuses_concurrent_run(self):
+        """Test a second run of the same policy fails while the advisory lock is held"""
+        conn = fake_connection([])
+        conn.fetchval = AsyncMock(return_value=False)
+        with patch("api.retention.asyncpg.connect", AsyncMock(return_value=conn)):
+            with pytest.raises(RuntimeError):
+                asyncio.run(run_retention("sessions"))
+        conn.close.assert_awaited_once()
+    
+    def test_rejects_period_below_minimum(self):
+        """Test a retention period under the policy's minimum is refused"""
+        with pytest.raises(ValueError):
+            asyncio.run(run_retention("audit_logs", days=7))
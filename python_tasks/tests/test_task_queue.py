@@ -0,0 +1,338 @@
+"""
+Tests for the API background task queue
+"""
+
+import os
+import sys
+import time
+import threading
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from api.task_queue import (
+    InProcessQueue, Task, TaskQueueFull, _FairScheduler, resolve_task, retry_delay, task_name
+)
+
+
+def wait_for(predicate, timeout: float = 5.0) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def add(a, b):
+    return a + b
+
+
+class Flaky:
+    """Fails a set number of times before succeeding"""
+    
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.calls = 0
+    
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise RuntimeError(f"failure {self.calls}")
+        return "ok"
+
+
+@pytest.fixture
+def task_queue():
+    q = InProcessQueue(num_workers=2, retry_backoff=0.01)
+    q.start()
+    yield q
+    q.stop()
+
+
+class TestInProcessQueue:
+    """Test the in-process queue backend"""
+    
+    def test_task_ids_unique_under_concurrent_creation(self):
+        """Test ids do not collide when many threads create tasks at once"""
+        ids = []
+        
+        def producer():
+            ids.extend(Task(add, (1, 2)).id for _ in range(500))
+        
+        threads = [threading.Thread(target=producer) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(set(ids)) == 2000
+    
+    def test_failed_task_retried_with_backoff(self, task_queue):
+        """Test failures are retried until the task succeeds"""
+        flaky = Flaky(failures=2)
+        task = Task(flaky, max_retries=3)
+        task_queue.enqueue(task)
+        
+        assert wait_for(lambda: task.status == "completed")
+        status = task_queue.get_status(task.id)
+        assert status["attempts"] == 3
+        assert status["result"] == "ok"
+        assert task_queue.stats()["retried"] == 2
+    
+    def test_task_fails_after_max_retries(self, task_queue):
+        """Test a task that keeps failing ends up failed with its error"""
+        task = Task(Flaky(failures=10), max_retries=1)
+        task_queue.enqueue(task)
+        
+        assert wait_for(lambda: (task_queue.get_status(task.id) or {}).get("status") == "failed")
+        assert task.attempts == 2
+        assert task_queue.get_status(task.id)["error"] == "failure 2"
+    
+    def test_results_bounded(self):
+        """Test finished tasks are dropped past max_results and after result_ttl"""
+        q = InProcessQueue(num_workers=1, max_results=2, result_ttl=60)
+        tasks = [Task(add, (i, i)) for i in range(3)]
+        for task in tasks:
+            task.execute()
+            q._finish(task)
+        
+        assert q.get_task(tasks[0].id) is None
+        assert q.get_status(tasks[2].id)["result"] == 4
+        
+        later = time.time() + 61
+        with patch("api.task_queue.time.time", return_value=later):
+            assert q.get_task(tasks[2].id) is None
+        assert q.stats()["results"] == 0
+
+
+class TestTaskRegistry:
+    """Test task functions are resolvable by name for the Redis backend"""
+    
+    def test_resolve_by_name(self):
+        """Test module-level functions resolve from their name"""
+        assert resolve_task(task_name(add)) is add
+    
+    def test_retry_delay_is_exponential_and_capped(self):
+        """Test backoff doubles per attempt up to the cap"""
+        assert [retry_delay(n, base=2) for n in (1, 2, 3)] == [2, 4, 8]
+        assert retry_delay(20, base=2) == 300
+
+
+async def async_double(value):
+    return value * 2
+
+
+class TestExecutionLanes:
+    """Test async, thread and process lanes"""
+    
+    def test_coroutines_run_on_async_lane(self, task_queue):
+        """Test coroutine functions default to the event loop lane"""
+        task = Task(async_double, (21,))
+        assert task.lane == "async"
+        task_queue.enqueue(task)
+        
+        assert wait_for(lambda: task.status == "completed")
+        assert task.result == 42
+        lanes = task_queue.stats()["lanes"]
+        assert lanes["async"]["processed"] == 1
+        assert lanes["thread"]["processed"] == 0
+    
+    def test_process_lane_runs_out_of_process(self, task_queue):
+        """Test CPU-bound work can be routed to the process pool"""
+        task = Task(os.getpid, lane="process")
+        task_queue.enqueue(task)
+        
+        assert wait_for(lambda: task.status == "completed", timeout=30)
+        assert task.result != os.getpid()
+        assert task_queue.stats()["lanes"]["process"]["processed"] == 1
+    
+    def test_lanes_start_on_demand(self):
+        """Test only the thread lane has workers until others are used"""
+        q = InProcessQueue(num_workers=1, async_workers=3)
+        q.start()
+        try:
+            lanes = q.stats()["lanes"]
+            assert lanes["thread"]["workers"] == 1
+            assert lanes["async"]["workers"] == 0
+            q.enqueue(Task(async_double, (1,)))
+            assert q.stats()["lanes"]["async"]["workers"] == 3
+        finally:
+            q.stop()
+    
+    def test_unknown_lane_rejected(self):
+        """Test a typo in the lane name fails at enqueue time"""
+        with pytest.raises(ValueError):
+            Task(add, (1, 2), lane="gpu")
+
+
+class TestFairScheduler:
+    """Test ordering, fairness, deadlines and backpressure"""
+    
+    def drain(self, q) -> list:
+        order = []
+        while q.qsize():
+            order.append(q.get(timeout=0).args[0])
+        return order
+    
+    def test_equal_priorities_run_fifo(self):
+        """Test equal priorities neither compare Task objects nor reorder"""
+        q = _FairScheduler()
+        for i in range(5):
+            q.put(Task(add, (i, 0), priority=5, group="g"))
+        q.put(Task(add, (99, 0), priority=1, group="g"))
+        assert self.drain(q) == [99, 0, 1, 2, 3, 4]
+    
+    def test_groups_take_turns(self):
+        """Test a noisy group cannot starve a quiet one at the same priority"""
+        q = _FairScheduler()
+        for i in range(4):
+            q.put(Task(add, (f"noisy{i}", 0), group="noisy"))
+        q.put(Task(add, ("quiet0", 0), group="quiet"))
+        q.put(Task(add, ("quiet1", 0), group="quiet"))
+        assert self.drain(q) == ["noisy0", "quiet0", "noisy1", "quiet1", "noisy2", "noisy3"]
+    
+    def test_earlier_deadline_first_within_group(self):
+        """Test deadlines order tasks inside a group"""
+        q = _FairScheduler()
+        q.put(Task(add, ("none", 0), group="g"))
+        q.put(Task(add, ("late", 0), group="g", deadline=60))
+        q.put(Task(add, ("soon", 0), group="g", deadline=5))
+        assert self.drain(q) == ["soon", "late", "none"]
+    
+    def test_max_depth_applies_backpressure(self):
+        """Test enqueue reports a full lane to the caller"""
+        q = InProcessQueue(num_workers=1, max_depth=2)
+        q.enqueue(Task(add, (1, 1)))
+        q.enqueue(Task(add, (2, 2)))
+        with pytest.raises(TaskQueueFull):
+            q.enqueue(Task(add, (3, 3)))
+        assert q.stats()["lanes"]["thread"]["rejected"] == 1
+    
+    def test_expired_task_not_run(self, task_queue):
+        """Test a task past its deadline is dropped instead of run"""
+        calls = []
+        task = Task(calls.append, (1,), deadline=-1)
+        task_queue.enqueue(task)
+        
+        assert wait_for(lambda: task.status == "expired")
+        assert calls == []
+        assert task_queue.stats()["lanes"]["thread"]["expired"] == 1
+
+
+GATE = threading.Event()
+
+
+def wait_for_gate():
+    return GATE.wait(timeout=5)
+
+
+def fake_redis_queue(**kwargs):
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    from api.task_queue import RedisTaskQueue, register_task
+    for func in (add, async_double, wait_for_gate):
+        register_task(func)
+    with patch("redis.from_url", return_value=fakeredis.FakeRedis()):
+        return RedisTaskQueue("redis://fake", num_workers=1, async_workers=2, process_workers=1,
+                              poll_interval=0.01, retry_backoff=0.01, **kwargs)
+
+
+@pytest.fixture
+def redis_queue():
+    q = fake_redis_queue()
+    q.start()
+    yield q
+    GATE.set()
+    q.stop()
+
+
+class TestRedisTaskQueue:
+    """Test the Redis backend's lanes, using fakeredis to run the Lua scripts"""
+    
+    def test_each_lane_has_its_own_workers_and_stats(self, redis_queue):
+        """Test a blocked thread lane does not hold up the async lane, and runs are recorded per lane"""
+        GATE.clear()
+        blocked = redis_queue.enqueue(Task(wait_for_gate))
+        done = redis_queue.enqueue(Task(async_double, (21,)))
+        
+        assert wait_for(lambda: redis_queue.get_status(done)["status"] == "completed")
+        assert redis_queue.get_status(done)["result"] == 42
+        assert redis_queue.get_status(blocked)["status"] == "running"
+        
+        GATE.set()
+        assert wait_for(lambda: redis_queue.get_status(blocked)["status"] == "completed")
+        lanes = redis_queue.stats()["lanes"]
+        assert lanes["async"]["processed"] == 1 and lanes["async"]["workers"] == 2
+        assert lanes["thread"]["processed"] == 1 and lanes["thread"]["workers"] == 1
+    
+    def test_queue_depth_reported_per_lane(self, redis_queue):
+        """Test ready tasks are counted against their own lane"""
+        GATE.clear()
+        redis_queue.enqueue(Task(wait_for_gate))
+        assert wait_for(lambda: redis_queue.stats()["inflight"] == 1)
+        redis_queue.enqueue(Task(add, (1, 2)))
+        
+        lanes = redis_queue.stats()["lanes"]
+        assert lanes["thread"]["queue_depth"] == 1
+        assert lanes["async"]["queue_depth"] == 0
+
+
+class TestRedisFairScheduling:
+    """Test groups, deadlines and depth limits in the Redis scripts (no workers running)"""
+    
+    def drain(self, q, lane: str = "thread") -> list:
+        order = []
+        keys = [q.ready_keys[lane], q.delayed_key, q.inflight_key]
+        while True:
+            claimed = q._claim(keys=keys, args=[60000, q.task_prefix, 60, q.ready_prefix])
+            if not claimed:
+                return order
+            order.append(q._codec.loads(claimed[1])["args"][0])
+    
+    def test_groups_take_turns(self):
+        """Test a noisy group cannot starve a quiet one at the same priority"""
+        q = fake_redis_queue()
+        for i in range(4):
+            q.enqueue(Task(add, (f"noisy{i}", 0), group="noisy"))
+        q.enqueue(Task(add, ("quiet0", 0), group="quiet"))
+        q.enqueue(Task(add, ("quiet1", 0), group="quiet"))
+        q.enqueue(Task(add, ("urgent", 0), priority=1, group="noisy"))
+        assert self.drain(q) == ["urgent", "quiet0", "noisy0", "quiet1", "noisy1", "noisy2", "noisy3"]
+        assert q.stats()["lanes"]["thread"]["queue_depth"] == 0
+    
+    def test_deadlines_order_and_expire(self):
+        """Test earlier deadlines run first in a group and expired tasks are never leased"""
+        q = fake_redis_queue()
+        q.enqueue(Task(add, ("none", 0), group="g"))
+        q.enqueue(Task(add, ("late", 0), group="g", deadline=60))
+        q.enqueue(Task(add, ("soon", 0), group="g", deadline=5))
+        gone = q.enqueue(Task(add, ("gone", 0), group="g", deadline=-1))
+        assert self.drain(q) == ["soon", "late", "none"]
+        assert q.get_status(gone)["status"] == "expired"
+        assert q.stats()["lanes"]["thread"]["expired"] == 1
+    
+    def test_max_depth_checked_atomically(self):
+        """Test the depth limit is enforced by the enqueue script, per lane"""
+        q = fake_redis_queue(max_depth=2)
+        q.enqueue(Task(add, (1, 1)))
+        q.enqueue(Task(add, (2, 2)))
+        with pytest.raises(TaskQueueFull):
+            q.enqueue(Task(add, (3, 3)))
+        q.enqueue(Task(async_double, (1,)))
+        lanes = q.stats()["lanes"]
+        assert lanes["thread"]["rejected"] == 1
+        assert lanes["thread"]["queue_depth"] == 2 and lanes["async"]["queue_depth"] == 1
+    
+    def test_legacy_ready_set_drained(self):
+        """Test tasks queued in the old single ready set are moved onto the fair queues"""
+        q = fake_redis_queue()
+        q._client.hset(q.task_prefix + "old", mapping={
+            "payload": q._codec.dumps({"name": task_name(add), "args": ["old", 0], "kwargs": {},
+                                       "lane": "thread"}),
+            "priority": 5, "lane": "thread", "attempts": 0, "max_retries": 0})
+        q._client.zadd(q.ready_key, {"old": 5e13})
+        q._drain_legacy_ready()
+        assert q._client.zcard(q.ready_key) == 0
+        assert self.drain(q) == ["old"]
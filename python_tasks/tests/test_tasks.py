@@ -60,6 +60,23 @@ class TestDatabaseTasks:
         
         assert result == 5
         mock_session.execute.assert_called()
+    
+    @patch('tasks.database.get_session')
+    async def test_cleanup_deletes_in_batches(self, mock_get_session):
+        """Test cleanup keeps deleting bounded batches until one comes back short"""
+        from tasks.database import purge_expired
+        
+        mock_session = AsyncMock()
+        results = [MagicMock(rowcount=count) for count in (100, 100, 30)]
+        mock_session.execute.side_effect = results
+        mock_get_session.return_value = AsyncContextManagerMock(mock_session)
+        
+        result = await purge_expired("audit_logs", days=365, batch_size=100, pause=0)
+        
+        assert result == 230
+        assert mock_session.execute.call_count == 3
+        assert mock_session.commit.await_count == 3
+        assert "LIMIT :batch_size" in str(mock_session.execute.call_args.args[0])
 
 @pytest.mark.asyncio
 class TestNotificationTasks:
@@ -133,3 +150,77 @@ class TestAnalyticsTasks:
         
         # Verify Snowflake Sync was attempted
         MockSnowflake.return_value.sync_table.assert_called()
+
+
+@pytest.mark.asyncio
+class TestRollupJobs:
+    """Test the incremental rollup and leaderboard jobs"""
+    
+    @patch('services.jobs.get_session')
+    async def test_refresh_activity_rollup(self, mock_get_session):
+        """Test the rollup upserts missing days and records the job run"""
+        from services.jobs import refresh_activity_rollup
+        
+        mock_session = AsyncMock()
+        mock_result = MagicMock()
+        mock_result.rowcount = 2
+        mock_session.execute.return_value = mock_result
+        mock_get_session.return_value = AsyncContextManagerMock(mock_session)
+        
+        result = await refresh_activity_rollup(backfill_days=90)
+        
+        assert result == {"status": "success", "days": 2}
+        statements = [str(call.args[0]) for call in mock_session.execute.call_args_list]
+        assert any('ON CONFLICT ("date") DO UPDATE' in sql for sql in statements)
+        assert mock_session.execute.call_args_list[1].args[1] == {"backfill_days": 90}
+    
+    @patch('services.jobs.get_session')
+    async def test_contributor_scores_apply_delta_after_first_run(self, mock_get_session):
+        """Test the all-time leaderboard is rebuilt once, then advanced by deltas"""
+        from datetime import datetime
+        from services.jobs import refresh_contributor_scores
+        
+        now = datetime(2026, 1, 28, 12, 0)
+        mock_session = AsyncMock()
+        mock_result = MagicMock()
+        mock_result.rowcount = 1
+        mock_result.scalar.side_effect = [now, "2026-01-28T11:45:00"]
+        mock_session.execute.return_value = mock_result
+        mock_get_session.return_value = AsyncContextManagerMock(mock_session)
+        
+        result = await refresh_contributor_scores()
+        
+        assert result["mode"] == "delta"
+        statements = [str(call.args[0]) for call in mock_session.execute.call_args_list]
+        rebuilt = [call.args[1]["window"] for call in mock_session.execute.call_args_list
+                   if len(call.args) > 1 and "window" in call.args[1] and "since" in call.args[1]]
+        assert rebuilt == ["7d", "30d"]
+        assert sum('ON CONFLICT ("window", "userId")' in sql for sql in statements) == 1
+        
+        mock_result.scalar.side_effect = [now]
+        result = await refresh_contributor_scores(full=True)
+        assert result["mode"] == "full"
+    
+    @patch('services.jobs.get_session')
+    async def test_contributor_scores_lock_and_lag_the_watermark(self, mock_get_session):
+        """Test runs take the advisory lock first and the all-time watermark trails NOW()"""
+        from datetime import datetime
+        from services.jobs import refresh_contributor_scores, LEADERBOARD_WATERMARK_LAG
+        
+        now = datetime(2026, 1, 28, 12, 0)
+        mock_session = AsyncMock()
+        mock_result = MagicMock()
+        mock_result.rowcount = 1
+        mock_result.scalar.side_effect = [now, "2026-01-28T11:40:00"]
+        mock_session.execute.return_value = mock_result
+        mock_get_session.return_value = AsyncContextManagerMock(mock_session)
+        
+        result = await refresh_contributor_scores()
+        
+        calls = mock_session.execute.call_args_list
+        assert "pg_advisory_xact_lock" in str(calls[1].args[0])
+        assert result["through"] == (now - LEADERBOARD_WATERMARK_LAG).isoformat()
+        delta = next(call for call in calls if 'ON CONFLICT ("window", "userId")' in str(call.args[0]))
+        assert delta.args[1] == {"since": datetime(2026, 1, 28, 11, 40), "through": now - LEADERBOARD_WATERMARK_LAG}
+        windows = [call.args[1] for call in calls if len(call.args) > 1 and "window" in call.args[1] and "since" in call.args[1]]
+        assert all(params["through"] == now for params in windows)
@@ -0,0 +1,156 @@
+"""
+Tests for the trending posts engine
+"""
+
+import os
+import sys
+import asyncio
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.trending import TrendingEngine, _timestamp
+
+HOUR = 3600
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def vote_row(vote_id: str, post_id: str, minutes_ago: float, category: str = "c1", value: int = 1) -> dict:
+    created = utcnow() - timedelta(minutes=minutes_ago)
+    return {"id": vote_id, "postId": post_id, "value": value, "createdAt": created, "categoryId": category}
+
+
+def post_row(post_id: str, category: str = "c1", status: str = "ACTIVE") -> dict:
+    return {"id": post_id, "title": post_id, "createdAt": None, "voteScore": 0, "status": status,
+            "categoryId": category, "categoryName": category, "authorUsername": None}
+
+
+def fake_db(votes: list, posts: dict, batches: list = None):
+    """execute_query stand-in serving window re-syncs, votes after the watermark and posts by id"""
+    def execute_query(query, params=None, fetch_one=False):
+        if "NOW()" in query:
+            return {"now": utcnow()}
+        if "GROUP BY" in query:
+            epoch, half_life, since, cursor = params
+            totals = {}
+            for v in votes:
+                if since < v["createdAt"] < cursor:
+                    row = totals.setdefault(v["postId"], {"postId": v["postId"], "categoryId": v["categoryId"],
+                                                          "votes": 0, "weight": 0.0})
+                    row["votes"] += 1
+                    row["weight"] += v["value"] * 2 ** ((_timestamp(v["createdAt"]) - epoch) / half_life)
+            return list(totals.values())
+        if '"Vote"' in query:
+            since, last_id, limit = params
+            if batches is not None:
+                batches.append(limit)
+            pending = [v for v in votes if (v["createdAt"], v["id"]) > (since, last_id)]
+            return pending[:limit]
+        return [posts[post_id] for post_id in params[0] if post_id in posts]
+    return execute_query
+
+
+class TestDecayedScores:
+    """Test the exponentially decayed vote weights"""
+    
+    def test_scores_halve_every_half_life(self):
+        """Test a vote is worth half as much one half-life later"""
+        engine = TrendingEngine(half_life=HOUR)
+        now = engine._epoch
+        engine.add_vote("p1", "c1", 1, now)
+        assert abs(engine.score("p1", now) - 1.0) < 1e-9
+        assert abs(engine.score("p1", now + HOUR) - 0.5) < 1e-9
+    
+    def test_recent_votes_outrank_older_ones(self):
+        """Test three fresh votes beat four votes from two half-lives ago"""
+        engine = TrendingEngine(half_life=HOUR)
+        now = engine._epoch
+        for _ in range(4):
+            engine.add_vote("old", "c1", 1, now - 2 * HOUR)
+        for _ in range(3):
+            engine.add_vote("new", "c1", 1, now)
+        assert engine._rank()[None] == ["new", "old"]
+    
+    def test_rebase_keeps_scores(self):
+        """Test moving the epoch forward leaves current scores unchanged"""
+        engine = TrendingEngine(half_life=HOUR)
+        now = engine._epoch
+        engine.add_vote("p1", "c1", 1, now)
+        engine.add_vote("p1", "c1", 1, now + 100 * HOUR)
+        assert engine._epoch == now + 100 * HOUR
+        assert abs(engine.score("p1", now + 100 * HOUR) - 1.0) < 1e-9
+
+
+class TestRefresh:
+    """Test batched loading and the precomputed top lists"""
+    
+    def test_refresh_builds_per_category_lists(self):
+        """Test top lists exist overall and per category, and skip inactive posts"""
+        votes = [vote_row("v1", "a", 30), vote_row("v2", "a", 20), vote_row("v3", "b", 10, category="c2"),
+                 vote_row("v4", "gone", 5), vote_row("v5", "gone", 4), vote_row("v6", "gone", 3)]
+        posts = {"a": post_row("a"), "b": post_row("b", "c2"), "gone": post_row("gone", status="REMOVED")}
+        engine = TrendingEngine()
+        with patch("api.database.execute_query", side_effect=fake_db(votes, posts)):
+            assert asyncio.run(engine.refresh()) == 6
+            top = asyncio.run(engine.top(limit=10))
+            per_category = asyncio.run(engine.top(limit=10, category_id="c2"))
+        
+        assert [post["id"] for post in top] == ["a", "b"]
+        assert top[0]["trendingScore"] > top[1]["trendingScore"]
+        assert [post["id"] for post in per_category] == ["b"]
+        assert asyncio.run(engine.top(category_id="unknown")) == []
+    
+    def test_votes_loaded_in_batches_after_watermark(self):
+        """Test refreshes between re-syncs read only new votes, a batch at a time"""
+        votes = [vote_row("v0", "a", 50)]
+        batches = []
+        engine = TrendingEngine(batch_size=2)
+        with patch("api.database.execute_query", side_effect=fake_db(votes, {"a": post_row("a")}, batches)):
+            assert asyncio.run(engine.refresh()) == 1
+            assert batches == []
+            
+            votes.extend(vote_row(f"v{i}", "a", -i / 60) for i in range(1, 6))
+            assert asyncio.run(engine.refresh()) == 5
+            assert batches == [2, 2, 2]
+        assert engine.stats()["votes_applied"] == 6
+        assert engine.stats()["resyncs"] == 1
+    
+    def test_resync_drops_unvotes_and_late_commits(self):
+        """Test a re-sync recomputes scores, so removed votes stop counting and late ones start"""
+        votes = [vote_row("v1", "a", 30), vote_row("v2", "a", 20), vote_row("v3", "b", 10)]
+        posts = {"a": post_row("a"), "b": post_row("b")}
+        engine = TrendingEngine(resync_interval=3600)
+        with patch("api.database.execute_query", side_effect=fake_db(votes, posts)):
+            asyncio.run(engine.refresh())
+            assert [post["id"] for post in asyncio.run(engine.top())] == ["a", "b"]
+            
+            votes[:2] = [vote_row("v4", "b", 15)]
+            asyncio.run(engine.refresh())
+            assert [post["id"] for post in asyncio.run(engine.top())] == ["a", "b"]
+            
+            engine.resynced_at = 0.0
+            asyncio.run(engine.refresh())
+            top = asyncio.run(engine.top())
+        assert [post["id"] for post in top] == ["b"]
+        assert abs(top[0]["trendingScore"] - (2 ** (-10 / 360) + 2 ** (-15 / 360))) < 1e-3
+    
+    def test_top_refreshes_inline_until_first_refresh(self):
+        """Test requests are not served an empty list while the refresher has not succeeded"""
+        engine = TrendingEngine()
+        engine._task = object()
+        with patch("api.database.execute_query", side_effect=fake_db([vote_row("v1", "a", 5)], {"a": post_row("a")})):
+            assert [post["id"] for post in asyncio.run(engine.top())] == ["a"]
+        engine._task = None
+    
+    def test_top_served_from_snapshot_when_fresh(self):
+        """Test requests within the refresh interval do not touch the database"""
+        engine = TrendingEngine(refresh_interval=60)
+        with patch("api.database.execute_query", side_effect=fake_db([], {})) as mock_query:
+            asyncio.run(engine.top())
+            calls = mock_query.call_count
+            asyncio.run(engine.top())
+            assert mock_query.call_count == calls
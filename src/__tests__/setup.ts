@@ -830,6 +830,7 @@ vi.mock('@/lib/redis', () => ({
   setCached: vi.fn().mockResolvedValue(undefined),
   CACHE_TTL: { POSTS_FEED: 3600, POST_DETAILS: 3600, TAGS: 3600, CATEGORIES: 3600 },
   invalidateCache: vi.fn().mockResolvedValue(undefined),
+  publishCacheInvalidation: vi.fn().mockResolvedValue(undefined),
   cacheKey: vi.fn().mockReturnValue('cache-key'),
   checkDuplicateReport: vi.fn().mockResolvedValue(false),
   blockDuplicateReport: vi.fn().mockResolvedValue(undefined),
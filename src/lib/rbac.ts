@@ -1,6 +1,7 @@
 import { prisma } from "@/lib/prisma";
 import type { Role } from "@prisma/client";
 import { getCurrentUser } from "@/lib/auth";
+import { publishCacheInvalidation } from "@/lib/redis";
 
 /**
  * Check if user has a specific role
@@ -114,7 +115,7 @@ export async function getCurrentUserRoles(): Promise<Role[]> {
  * Grant role to user
  */
 export async function grantRole(userId: string, role: Role) {
-  return prisma.userRole.upsert({
+  const userRole = await prisma.userRole.upsert({
     where: {
       userId_role: {
         userId,
@@ -127,13 +128,15 @@ export async function grantRole(userId: string, role: Role) {
       role,
     },
   });
+  await publishCacheInvalidation([`user:${userId}`]);
+  return userRole;
 }
 
 /**
  * Revoke role from user
  */
 export async function revokeRole(userId: string, role: Role) {
-  return prisma.userRole.delete({
+  const userRole = await prisma.userRole.delete({
     where: {
       userId_role: {
         userId,
@@ -141,6 +144,8 @@ export async function revokeRole(userId: string, role: Role) {
       },
     },
   });
+  await publishCacheInvalidation([`user:${userId}`]);
+  return userRole;
 }
 
 /**
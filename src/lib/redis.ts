@@ -166,6 +166,23 @@ export async function invalidateCache(
   }
 }
 
+/**
+ * Tell the Python API workers to drop cached entries carrying any of the tags
+ * (e.g. `user:<id>`). Uses the channel the Python cache subscribes to.
+ */
+export async function publishCacheInvalidation(tags: string[]): Promise<void> {
+  if (!isRedisEnabled() || tags.length === 0) return;
+
+  try {
+    await redis.publish("neurokid:cache:invalidate-tags", tags.join("\n"));
+  } catch (error) {
+    if (!logWarned && !isProd) {
+      console.warn("Redis publishCacheInvalidation disabled:", (error as any)?.code || (error as any)?.message || error);
+      logWarned = true;
+    }
+  }
+}
+
 // Predefined cache TTLs
 export const CACHE_TTL = {
   POSTS_FEED: 30, // 30 seconds